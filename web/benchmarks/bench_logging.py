@@ -0,0 +1,100 @@
+"""
+Per-request logging overhead on the /api/reco hot path.
+
+Compares the old synchronous `print` calls made by `proxy_reco_request`
+against the queued logger, with stdout pointed at a real file so writes
+are not free.
+
+Run from the `web/` directory:
+
+    python -m benchmarks.bench_logging --requests 20000
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SHOPIFY_APP_KEY", "bench-key")
+os.environ.setdefault("SHOPIFY_APP_SECRET", "bench-secret")
+os.environ.setdefault("SHOPIFY_APP_URL", "http://localhost")
+
+from core.logger import get_logger, setup_logging, shutdown_logging  # noqa: E402
+
+API_KEY = "COUTURE-bench-api-key"
+STORE = "bench-store.myshopify.com"
+RECO_PATH = "similar-products"
+URL = f"http://localhost:8003/shopify/{RECO_PATH}?product_id=1&page_number=1"
+
+
+def print_request():
+    """The logging `proxy_reco_request` and its auth dependency used to do."""
+    print(f"API_KEY: {API_KEY} | STORE: {STORE}")
+    print("\n--- [PROXY LOG] ---")
+    print(f"[PROXY] Received request from theme for path: /{RECO_PATH}")
+    print(f"API_KEY: {API_KEY} ; STORE: {STORE}")
+    print(f"[PROXY] Forwarding request to internal API: {URL}")
+    print("[PROXY] Received status 200 from internal API.")
+    print("[PROXY] Success! Forwarding response back to the theme.")
+    print("--- [PROXY LOG END] ---\n")
+
+
+def logger_request(logger):
+    """The logging the same request does now."""
+    logger.debug("Incoming storefront request", extra={"store": STORE})
+    logger.debug(
+        "Received reco request from theme", extra={"path": RECO_PATH, "store": STORE}
+    )
+    logger.debug("Forwarding reco request", extra={"url": URL})
+    logger.debug("Reco upstream responded", extra={"status": 200, "store": STORE})
+
+
+def timed(fn, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n
+
+
+def run(n: int) -> dict:
+    with tempfile.TemporaryFile("w+") as sink:
+        real_stdout = sys.stdout
+        sys.stdout = io.TextIOWrapper(
+            os.fdopen(os.dup(sink.fileno()), "wb"), line_buffering=True
+        )
+        try:
+            before = timed(print_request, n)
+        finally:
+            sys.stdout.close()
+            sys.stdout = real_stdout
+
+        root = setup_logging(stream=sink)
+        logger = get_logger("bench")
+        after = timed(lambda: logger_request(logger), n)
+        # With DEBUG enabled the records pass the level check and hit sampling.
+        root.setLevel("DEBUG")
+        after_debug = timed(lambda: logger_request(logger), n)
+        shutdown_logging()
+
+    return {
+        "requests": n,
+        "print_us_per_request": round(before * 1e6, 3),
+        "logger_us_per_request": round(after * 1e6, 3),
+        "logger_debug_us_per_request": round(after_debug * 1e6, 3),
+        "speedup": round(before / after, 2) if after else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    result = run(args.requests)
+    for key, value in result.items():
+        print(f"{key:>24}: {value}")
+
+
+if __name__ == "__main__":
+    main()
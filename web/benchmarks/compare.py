@@ -0,0 +1,65 @@
+"""
+Compares two benchmark result files and reports regressions.
+
+    python -m benchmarks.compare results/OLD.json results/NEW.json --threshold 10
+
+Exits with status 1 when any metric got worse by more than `--threshold`
+percent, so it can gate CI.
+"""
+import argparse
+import json
+import sys
+
+HIGHER_IS_BETTER = ("_qps", "_per_s", "speedup")
+LOWER_IS_BETTER = ("_ms", "_us_per_request")
+
+
+def direction(metric: str) -> int:
+    """+1 when bigger is better, -1 when smaller is better, 0 if informational."""
+    if metric.endswith(HIGHER_IS_BETTER):
+        return 1
+    if metric.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    rows = []
+    for scenario, metrics in current.get("scenarios", {}).items():
+        base_metrics = baseline.get("scenarios", {}).get(scenario, {})
+        for metric, value in metrics.items():
+            sign = direction(metric)
+            base = base_metrics.get(metric)
+            if not sign or not isinstance(value, (int, float)) or not base:
+                continue
+            change = (value - base) / base * 100
+            regressed = change * sign < -threshold
+            rows.append((scenario, metric, base, value, change, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare benchmark results.")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0)
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    rows = compare(baseline, current, args.threshold)
+    regressions = [r for r in rows if r[5]]
+    for scenario, metric, base, value, change, regressed in rows:
+        flag = "REGRESSION" if regressed else ""
+        print(f"{scenario:>12} {metric:<32} {base:>14} -> {value:<14} {change:+7.1f}% {flag}")
+
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold}%.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,476 @@
+"""
+Local stand-ins for Shopify's Admin GraphQL API and the reco service.
+
+Both run as threaded HTTP servers on 127.0.0.1 so benchmarks can exercise
+the real request code without network access. The fake Shopify server is
+addressed per shop as http://127.0.0.1:<port>/<shop>, which is what
+`settings.SHOPIFY_ADMIN_URL` should be pointed at.
+"""
+import gzip
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.synthetic import write_jsonl
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data, status: int = 200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _FakeServer:
+    handler_class = _QuietHandler
+
+    def __init__(self, port: int = 0):
+        handler = type("Handler", (self.handler_class,), {"fake": self})
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# --- Shopify Admin GraphQL ---
+
+
+class _ShopState:
+    """Everything the fake remembers about one shop."""
+
+    def __init__(self, shop: str):
+        self.shop = shop
+        self.shop_gid = f"gid://shopify/Shop/{abs(hash(shop)) % 10**8}"
+        self.metafields = {}
+        self.definitions = {}
+        self.metaobjects = {}
+        self.bulk_op = None
+        self.bulk_seq = 0
+        self.available = 0.0
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class _ShopifyHandler(_QuietHandler):
+    _PATH_RE = re.compile(r"^/(?P<shop>[^/]+)/admin/api/[^/]+/graphql\.json$")
+
+    def do_POST(self):
+        match = self._PATH_RE.match(urlparse(self.path).path)
+        if not match:
+            return self._send_json({"errors": "Not Found"}, status=404)
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        self.fake.calls += 1
+        if self.fake.latency_s:
+            time.sleep(self.fake.latency_s)
+        data = self.fake.execute(
+            match.group("shop"), payload.get("query", ""), payload.get("variables") or {}
+        )
+        self._send_json(data)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if not path.startswith("/bulk/"):
+            return self._send_json({"errors": "Not Found"}, status=404)
+        file_path = self.fake.bulk_files.get(path)
+        if not file_path:
+            return self._send_json({"errors": "Not Found"}, status=404)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/jsonl")
+        self.send_header("Content-Length", str(os.path.getsize(file_path)))
+        self.end_headers()
+        with open(file_path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile)
+
+
+class FakeShopify(_FakeServer):
+    """
+    Minimal Admin GraphQL API: bulk operations, shop metafields,
+    metaobjects and cost-based throttling (a leaky bucket per shop).
+
+    Bulk operations move CREATED -> RUNNING -> COMPLETED over
+    `polls_to_complete` reads of `currentBulkOperation`; the result file
+    holds `export_lines` synthetic rows.
+    """
+
+    handler_class = _ShopifyHandler
+
+    def __init__(
+        self,
+        port: int = 0,
+        polls_to_complete: int = 3,
+        export_lines: int = 1000,
+        latency_s: float = 0.0,
+        bucket_size: int = 2000,
+        restore_rate: int = 100,
+    ):
+        super().__init__(port)
+        self.polls_to_complete = polls_to_complete
+        self.export_lines = export_lines
+        self.latency_s = latency_s
+        self.bucket_size = bucket_size
+        self.restore_rate = restore_rate
+        self.shops = {}
+        self.bulk_files = {}
+        self.calls = 0
+        self.workdir = tempfile.mkdtemp(prefix="fake-shopify-")
+        self._lock = threading.Lock()
+
+    def stop(self):
+        super().stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def shop_url(self, shop: str) -> str:
+        return f"{self.url}/{shop}"
+
+    def state(self, shop: str) -> _ShopState:
+        with self._lock:
+            if shop not in self.shops:
+                self.shops[shop] = _ShopState(shop)
+                self.shops[shop].available = float(self.bucket_size)
+            return self.shops[shop]
+
+    # -- throttling --
+
+    def _charge(self, state: _ShopState, cost: int) -> tuple:
+        """Refills the shop's bucket and tries to take `cost` points from it."""
+        now = time.monotonic()
+        state.available = min(
+            self.bucket_size,
+            state.available + (now - state.last_refill) * self.restore_rate,
+        )
+        state.last_refill = now
+        allowed = state.available >= cost
+        if allowed:
+            state.available -= cost
+        status = {
+            "maximumAvailable": float(self.bucket_size),
+            "currentlyAvailable": state.available,
+            "restoreRate": float(self.restore_rate),
+        }
+        return allowed, status
+
+    def execute(self, shop: str, query: str, variables: dict) -> dict:
+        state = self.state(shop)
+        cost = 10 if query.lstrip().startswith("mutation") else 1
+        with state.lock:
+            allowed, throttle_status = self._charge(state, cost)
+            if not allowed:
+                return {
+                    "errors": [
+                        {"message": "Throttled", "extensions": {"code": "THROTTLED"}}
+                    ],
+                    "extensions": {
+                        "cost": {
+                            "requestedQueryCost": cost,
+                            "throttleStatus": throttle_status,
+                        }
+                    },
+                }
+            data = self._resolve(state, query, variables)
+        return {
+            "data": data,
+            "extensions": {
+                "cost": {
+                    "requestedQueryCost": cost,
+                    "actualQueryCost": cost,
+                    "throttleStatus": throttle_status,
+                }
+            },
+        }
+
+    # -- resolvers --
+
+    _ALIASED_METAFIELD_RE = re.compile(
+        r'(\w+):\s*metafield\(namespace:\s*"([^"]+)",\s*key:\s*"([^"]+)"\)'
+    )
+
+    def _resolve(self, state: _ShopState, query: str, variables: dict) -> dict:
+        if "query DashboardState" in query:
+            return self._dashboard_state(state, query)
+        if "bulkOperationRunQuery" in query:
+            return {"bulkOperationRunQuery": self._start_bulk(state, query)}
+        if "currentBulkOperation" in query:
+            return {"currentBulkOperation": self._poll_bulk(state)}
+        if "metafieldsSet" in query:
+            return {"metafieldsSet": self._set_metafields(state, variables)}
+        if "metafieldsDelete" in query:
+            return {"metafieldsDelete": self._delete_metafields(state, variables)}
+        if "metaobjectDefinitionCreate" in query:
+            return {"metaobjectDefinitionCreate": self._create_definition(state, variables)}
+        if "metaobjectDefinitionByType" in query:
+            m = re.search(r'type:\s*"([^"]+)"', query)
+            def_type = m.group(1) if m else variables.get("type")
+            return {"metaobjectDefinitionByType": state.definitions.get(def_type)}
+        if "metaobjectDelete" in query:
+            return {"metaobjectDelete": self._delete_metaobject(state, variables)}
+        if "metaobjects(" in query:
+            return {"metaobjects": self._list_metaobjects(state, variables)}
+        if "metaobjectUpsert" in query:
+            return {"metaobjectUpsert": self._upsert_metaobject(state, variables)}
+        if "metaobjectCreate" in query:
+            return {"metaobjectCreate": self._create_metaobject(state, variables)}
+        if "appInstallation" in query:
+            scopes = ["read_products", "read_orders", "write_metaobjects"]
+            return {"appInstallation": {"accessScopes": [{"handle": s} for s in scopes]}}
+        if "metafield(" in query:
+            key = (variables.get("namespace"), variables.get("key"))
+            return {"shop": {"id": state.shop_gid, "metafield": state.metafields.get(key)}}
+        if "shop" in query:
+            return {"shop": {"id": state.shop_gid}}
+        return {}
+
+    def _dashboard_state(self, state: _ShopState, query: str) -> dict:
+        """Several root fields and aliased shop metafields in one document."""
+        data = self._resolve(state, "appInstallation", {})
+        if "currentBulkOperation" in query:
+            data["currentBulkOperation"] = self._poll_bulk(state)
+        data["shop"] = {
+            alias: state.metafields.get((namespace, key))
+            for alias, namespace, key in self._ALIASED_METAFIELD_RE.findall(query)
+        }
+        return data
+
+    def _start_bulk(self, state: _ShopState, query: str) -> dict:
+        op = state.bulk_op
+        if op and op["status"] in ("CREATED", "RUNNING"):
+            return {
+                "bulkOperation": None,
+                "userErrors": [{"field": None, "message": "A bulk query operation is already in progress."}],
+            }
+        state.bulk_seq += 1
+        inner = query.split('"""')[1] if '"""' in query else query
+        state.bulk_op = {
+            "id": f"gid://shopify/BulkOperation/{state.bulk_seq}",
+            "query": inner,
+            "status": "CREATED",
+            "errorCode": None,
+            "createdAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "completedAt": None,
+            "objectCount": "0",
+            "fileSize": None,
+            "url": None,
+            "_polls": 0,
+        }
+        return {
+            "bulkOperation": {"id": state.bulk_op["id"], "status": "CREATED"},
+            "userErrors": [],
+        }
+
+    def complete_bulk(self, state: _ShopState):
+        """Finishes the current bulk operation and publishes its result file."""
+        op = state.bulk_op
+        kind = "orders" if "orders" in op["query"] else "products"
+        url_path = f"/bulk/{state.shop}/{op['id'].rsplit('/', 1)[-1]}.jsonl"
+        file_path = os.path.join(
+            self.workdir, url_path.strip("/").replace("/", "_")
+        )
+        stats = write_jsonl(file_path, kind, self.export_lines)
+        self.bulk_files[url_path] = file_path
+        op.update(
+            status="COMPLETED",
+            completedAt=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            objectCount=str(stats["lines"]),
+            fileSize=str(stats["bytes"]),
+            url=f"{self.url}{url_path}",
+        )
+
+    def _poll_bulk(self, state: _ShopState) -> dict | None:
+        op = state.bulk_op
+        if not op:
+            return None
+        if op["status"] in ("CREATED", "RUNNING"):
+            op["_polls"] += 1
+            if op["_polls"] >= self.polls_to_complete:
+                self.complete_bulk(state)
+            else:
+                op["status"] = "RUNNING"
+                progress = op["_polls"] / self.polls_to_complete
+                op["objectCount"] = str(int(self.export_lines * progress))
+        return {k: v for k, v in op.items() if not k.startswith("_")}
+
+    def _set_metafields(self, state: _ShopState, variables: dict) -> dict:
+        saved = []
+        for mf in variables.get("metafields", []):
+            key = (mf["namespace"], mf["key"])
+            record = state.metafields.get(key) or {
+                "id": f"gid://shopify/Metafield/{len(state.metafields) + 1}",
+                "namespace": mf["namespace"],
+                "key": mf["key"],
+                "owner": {"__typename": "Shop", "id": state.shop_gid},
+            }
+            record["value"] = mf["value"]
+            state.metafields[key] = record
+            saved.append({"id": record["id"]})
+        return {"metafields": saved, "userErrors": []}
+
+    def _delete_metafields(self, state: _ShopState, variables: dict) -> dict:
+        deleted = []
+        for mf in variables.get("metafields", []):
+            if state.metafields.pop((mf["namespace"], mf["key"]), None):
+                deleted.append(mf)
+        return {"deletedMetafields": deleted, "userErrors": []}
+
+    def _create_definition(self, state: _ShopState, variables: dict) -> dict:
+        definition = variables["definition"]
+        record = {"id": f"gid://shopify/MetaobjectDefinition/{len(state.definitions) + 1}"}
+        state.definitions[definition["type"]] = record
+        return {"metaobjectDefinition": record, "userErrors": []}
+
+    def _upsert_metaobject(self, state: _ShopState, variables: dict) -> dict:
+        handle = variables["handle"]
+        key = (handle["type"], handle["handle"])
+        record = state.metaobjects.get(key) or {
+            "id": self._next_metaobject_id(state),
+            "handle": handle["handle"],
+            "type": handle["type"],
+        }
+        record["fields"] = variables["metaobject"]["fields"]
+        record["updatedAt"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        state.metaobjects[key] = record
+        return {"metaobject": record, "userErrors": []}
+
+    @staticmethod
+    def _next_metaobject_id(state: _ShopState) -> str:
+        numbers = [int(r["id"].rsplit("/", 1)[-1]) for r in state.metaobjects.values()]
+        return f"gid://shopify/Metaobject/{max(numbers, default=0) + 1}"
+
+    def _list_metaobjects(self, state: _ShopState, variables: dict) -> dict:
+        records = sorted(
+            (r for (t, _), r in state.metaobjects.items() if t == variables["type"]),
+            key=lambda r: int(r["id"].rsplit("/", 1)[-1]),
+        )
+        start = int(variables.get("after") or 0)
+        page = records[start:start + variables["first"]]
+        end = start + len(page)
+        return {
+            "edges": [{"node": r} for r in page],
+            "pageInfo": {"hasNextPage": end < len(records), "endCursor": str(end)},
+        }
+
+    def _delete_metaobject(self, state: _ShopState, variables: dict) -> dict:
+        for key, record in list(state.metaobjects.items()):
+            if record["id"] == variables["id"]:
+                del state.metaobjects[key]
+                return {"deletedId": record["id"], "userErrors": []}
+        return {"deletedId": None, "userErrors": [{"field": ["id"], "message": "Not found"}]}
+
+    def _create_metaobject(self, state: _ShopState, variables: dict) -> dict:
+        metaobject = variables["metaobject"]
+        key = (metaobject["type"], metaobject["handle"])
+        if key in state.metaobjects:
+            return {
+                "metaobject": None,
+                "userErrors": [{"field": ["handle"], "message": "Handle has already been taken"}],
+            }
+        record = {
+            "id": self._next_metaobject_id(state),
+            "handle": metaobject["handle"],
+            "type": metaobject["type"],
+            "fields": metaobject["fields"],
+        }
+        state.metaobjects[key] = record
+        return {"metaobject": record, "userErrors": []}
+
+
+# --- Reco service ---
+
+
+class _RecoHandler(_QuietHandler):
+    def do_GET(self):
+        self.fake.calls += 1
+        if self.fake.latency_s:
+            time.sleep(self.fake.latency_s)
+        parsed = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        page_size = int(params.get("page_size", 10))
+        page_number = int(params.get("page_number", 1))
+        start = (page_number - 1) * page_size
+        self._send_json(
+            {
+                "path": parsed.path,
+                "product_handles": [
+                    f"product-{i}" for i in range(start, start + page_size)
+                ],
+                "total": 1000,
+            }
+        )
+
+    def do_POST(self):
+        self.fake.calls += 1
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if "/ingest/" in self.path:
+            if self.fake.fail_ingest > 0:
+                self.fake.fail_ingest -= 1
+                self._send_json({"detail": "unavailable"}, status=503)
+                return
+            key = self.headers.get("Idempotency-Key")
+            if key not in self.fake.ingested:
+                self.fake.ingested[key] = gzip.decompress(body).count(b"\n")
+            self._send_json({"accepted": True})
+            return
+        self._send_json({"product_recos": self.fake.reco_configs})
+
+
+class FakeRecoService(_FakeServer):
+    """
+    Stand-in for `PROXY_SERVER_URL`: every GET returns a page of product
+    handles after `latency_s`; POST /reco-config returns `reco_configs`.
+    POST /ingest/{kind} records each idempotency key's record count once in
+    `ingested`, answering 503 while `fail_ingest` is above zero.
+    """
+
+    handler_class = _RecoHandler
+
+    def __init__(self, port: int = 0, latency_s: float = 0.005):
+        super().__init__(port)
+        self.latency_s = latency_s
+        self.calls = 0
+        self.ingested: dict[str, int] = {}
+        self.fail_ingest = 0
+        self.reco_configs = [
+            {
+                "banner_name": f"Carousel {i}",
+                "caption": f"Picked for you {i}",
+                "endpoint": f"/api/reco/similar-{i}",
+                "enabled": i % 2 == 0,
+            }
+            for i in range(5)
+        ]
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.url}/shopify"
@@ -0,0 +1,176 @@
+"""
+Offline benchmark suite.
+
+Starts a fake Shopify Admin API and a fake reco service on localhost, points
+the app at them and runs the load scenarios in `benchmarks.scenarios`.
+Results are written as JSON to `benchmarks/results/` so runs from different
+versions can be compared with `python -m benchmarks.compare`.
+
+Run from the `web/` directory:
+
+    python -m benchmarks.run                       # full suite
+    python -m benchmarks.run --quick               # small sizes, for a smoke run
+    python -m benchmarks.run --only reco jsonl_parse
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.fakes import FakeRecoService, FakeShopify
+
+RESULTS_DIR = Path(__file__).parent / "results"
+SCENARIOS = ["reco", "sync_status", "jsonl_parse", "logging"]
+# The reco scenario's store (see scenarios.STOREFRONT_HEADERS) gets a tier
+# without a rate limit, so the run measures the proxy rather than the throttle.
+BENCH_TIERS = {
+    "default": {"rate": 20.0, "burst": 40, "concurrency": 8, "weight": 1.0},
+    "bench": {"rate": 0, "burst": 1, "concurrency": 64, "weight": 1.0},
+}
+BENCH_TIER_ASSIGNMENTS = {"bench-store.myshopify.com": "bench"}
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _configure_env(shopify: FakeShopify, reco: FakeRecoService, workdir: str):
+    """Must run before anything imports `core.config`."""
+    os.environ.setdefault("SHOPIFY_APP_KEY", "bench-key")
+    os.environ.setdefault("SHOPIFY_APP_SECRET", "bench-secret")
+    os.environ.setdefault("SHOPIFY_APP_URL", "http://localhost")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("BULK_POLL_MIN_INTERVAL", "0.05")
+    os.environ.setdefault("BULK_POLL_TICK", "0.02")
+    os.environ.setdefault("RECO_STORE_TIERS", json.dumps(BENCH_TIERS))
+    os.environ.setdefault("RECO_STORE_TIER_ASSIGNMENTS", json.dumps(BENCH_TIER_ASSIGNMENTS))
+    # The storefront key sent by scenarios.STOREFRONT_HEADERS.
+    os.environ.setdefault("PROXY_API_KEY", "COUTURE-bench")
+    os.environ["SHOPIFY_ADMIN_URL"] = f"{shopify.url}/{{shop}}"
+    os.environ["PROXY_SERVER_URL"] = reco.base_url
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+    os.environ["SYNC_LEDGER_DATABASE_URL"] = f"sqlite:///{workdir}/ledger.db"
+
+
+def run_suite(args) -> dict:
+    web_dir = Path(__file__).resolve().parent.parent
+    workdir = tempfile.mkdtemp(prefix="couture-bench-")
+    original_cwd = os.getcwd()
+    selected = args.only or SCENARIOS
+    results = {}
+
+    with FakeShopify(
+        polls_to_complete=args.polls_to_complete, export_lines=args.export_lines
+    ) as shopify, FakeRecoService(latency_s=args.reco_latency_ms / 1000) as reco:
+        _configure_env(shopify, reco, workdir)
+        sys.path.insert(0, str(web_dir))
+
+        from main import app
+        from core.logger import setup_logging
+        from models.database import create_db_and_tables
+        from services.bulk_poller_service import bulk_poller
+        from benchmarks import scenarios
+
+        setup_logging()
+        create_db_and_tables()
+        bulk_poller.start()
+        # Sync downloads are written relative to the working directory.
+        os.chdir(workdir)
+        os.makedirs("downloads", exist_ok=True)
+
+        if "reco" in selected:
+            results["reco"] = scenarios.reco_load(
+                app, requests=args.reco_requests, concurrency=args.concurrency
+            )
+        if "sync_status" in selected:
+            results["sync_status"] = scenarios.sync_status_finalisation(
+                app, shopify, shops=args.shops
+            )
+        if "jsonl_parse" in selected:
+            results["jsonl_parse"] = scenarios.jsonl_parse(
+                shopify, lines=args.parse_lines
+            )
+        bulk_poller.stop()
+
+    os.chdir(original_cwd)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if "logging" in selected:
+        from benchmarks import bench_logging
+        from core.logger import shutdown_logging
+
+        # The logging benchmark installs its own listener on a temp file.
+        shutdown_logging()
+
+        results["logging"] = bench_logging.run(args.log_requests)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite.")
+    parser.add_argument("--only", nargs="+", choices=SCENARIOS)
+    parser.add_argument("--quick", action="store_true", help="Use small sizes.")
+    parser.add_argument("--reco-requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--reco-latency-ms", type=float, default=5.0)
+    parser.add_argument("--shops", type=int, default=5)
+    parser.add_argument("--polls-to-complete", type=int, default=3)
+    parser.add_argument("--export-lines", type=int, default=20000)
+    parser.add_argument("--parse-lines", type=int, default=1_000_000)
+    parser.add_argument("--log-requests", type=int, default=20000)
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR)
+    parser.add_argument("--label", help="Free-form tag stored with the results.")
+    args = parser.parse_args()
+    args.output = args.output.resolve()
+
+    if args.quick:
+        args.reco_requests = 500
+        args.shops = 2
+        args.export_lines = 2000
+        args.parse_lines = 50_000
+        args.log_requests = 2000
+
+    started = datetime.datetime.now(datetime.timezone.utc)
+    scenario_results = run_suite(args)
+
+    report = {
+        "meta": {
+            "timestamp": started.isoformat(),
+            "git_commit": _git_commit(),
+            "label": args.label,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {
+                k: v for k, v in vars(args).items() if k not in ("output", "only")
+            },
+        },
+        "scenarios": scenario_results,
+    }
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    name = f"{started.strftime('%Y%m%dT%H%M%S')}_{report['meta']['git_commit'] or 'nogit'}.json"
+    out_path = args.output / name
+    out_path.write_text(json.dumps(report, indent=2))
+
+    print(json.dumps(scenario_results, indent=2))
+    print(f"Results written to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Load scenarios run against the FastAPI app.
+
+Each scenario returns a flat dict of metrics. Metric names carry their
+direction so `benchmarks.compare` can spot regressions: `*_qps`, `*_per_s`
+and `speedup` are higher-is-better, `*_ms` / `*_us*` are lower-is-better.
+Import this module only after the environment points the app at the fakes.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+import httpx
+
+from core.config import settings
+from models import ShopifyAPIClient
+from services.shopify_auth_service import save_or_update_token_in_db
+from utils.commons.api_utils import read_jsonl_from_url
+from utils.commons.jsonl_parser import parse_jsonl_file
+from benchmarks.synthetic import write_jsonl
+
+STOREFRONT_HEADERS = {
+    "x-api-key": "COUTURE-bench",
+    "x-store-identifier": "bench-store.myshopify.com",
+}
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def session_headers(shop: str, ttl_s: float = 300.0) -> dict:
+    """An App Bridge style session token for `shop`, signed with the app secret."""
+    now = time.time()
+    header = _b64url(json.dumps({"alg": "HS256", "typ": "JWT"}).encode())
+    claims = _b64url(json.dumps({
+        "iss": f"https://{shop}/admin",
+        "dest": f"https://{shop}",
+        "aud": settings.SHOPIFY_APP_KEY,
+        "sub": "1",
+        "exp": now + ttl_s,
+        "nbf": now - 1,
+        "iat": now,
+    }).encode())
+    signature = hmac.new(
+        settings.SHOPIFY_APP_SECRET.encode(), f"{header}.{claims}".encode(), hashlib.sha256
+    ).digest()
+    return {"Authorization": f"Bearer {header}.{claims}.{_b64url(signature)}"}
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of `values` (0 < pct <= 100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100.0 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def latency_summary(latencies_s: list, prefix: str) -> dict:
+    ms = [v * 1000 for v in latencies_s]
+    return {
+        f"{prefix}_p50_ms": round(percentile(ms, 50), 3),
+        f"{prefix}_p95_ms": round(percentile(ms, 95), 3),
+        f"{prefix}_p99_ms": round(percentile(ms, 99), 3),
+        f"{prefix}_max_ms": round(max(ms), 3) if ms else 0.0,
+    }
+
+
+async def _drive(app, paths: list, concurrency: int, headers: dict) -> tuple:
+    """(latencies, errors, throttled, elapsed); 429s are counted as throttled, not errors."""
+    latencies, errors, throttled = [], 0, 0
+    queue = list(reversed(paths))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def worker():
+            nonlocal errors, throttled
+            while queue:
+                path = queue.pop()
+                start = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code == 429:
+                    throttled += 1
+                elif response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, throttled, elapsed
+
+
+def reco_load(app, requests: int = 2000, concurrency: int = 32) -> dict:
+    """
+    QPS and latency percentiles for /api/reco through the fake reco service.
+    The store is installed first; per-store state is only kept for
+    installed stores, and the runner gives it an unthrottled tier.
+    """
+    save_or_update_token_in_db(
+        shop=STOREFRONT_HEADERS["x-store-identifier"], access_token="token-bench"
+    )
+    paths = [
+        f"/api/reco/similar-products?product_id={i % 200}&page_number=1"
+        for i in range(requests)
+    ]
+    latencies, errors, throttled, elapsed = asyncio.run(
+        _drive(app, paths, concurrency, STOREFRONT_HEADERS)
+    )
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throttled": throttled,
+        "reco_qps": round(requests / elapsed, 2),
+        **latency_summary(latencies, "reco"),
+    }
+
+
+def _history(client: ShopifyAPIClient, key: str) -> list:
+    metafield = client.get_metafield(namespace="couture_app", key=key)
+    if not metafield or not metafield.get("value"):
+        return []
+    return json.loads(metafield["value"])
+
+
+def sync_status_finalisation(
+    app, shopify, shops: int = 5, max_polls: int = 200, poll_interval_s: float = 0.05
+) -> dict:
+    """
+    Starts a catalogue bulk export per shop, then polls /sync/status the way
+    the dashboard does until the history record flips to success. The bulk
+    poller must be running; it finalises operations in the background.
+    """
+    clients = []
+    for i in range(shops):
+        shop = f"bench-{i}.myshopify.com"
+        save_or_update_token_in_db(shop=shop, access_token=f"token-{i}")
+        client = ShopifyAPIClient(shop_url=shop, access_token=f"token-{i}")
+        client.update_sync_history(
+            key="catalogue_sync_history",
+            status="processing",
+            message="Benchmark catalogue sync.",
+        )
+        client.fetch_all_products()
+        clients.append(client)
+
+    poll_latencies, finalise_latencies, polls_needed = [], [], []
+    finalised = 0
+
+    async def poll_shop(http, client):
+        nonlocal finalised
+        headers = session_headers(client.shop_url)
+        start = time.perf_counter()
+        for poll in range(1, max_polls + 1):
+            t0 = time.perf_counter()
+            response = await http.get("/sync/status", headers=headers)
+            took = time.perf_counter() - t0
+            poll_latencies.append(took)
+            if response.status_code != 200:
+                raise RuntimeError(
+                    f"/sync/status for {client.shop_url} returned "
+                    f"{response.status_code}: {response.text[:200]}"
+                )
+            if response.json().get("status") == "COMPLETED":
+                history = _history(client, "catalogue_sync_history")
+                if history and history[0].get("status") == "success":
+                    finalise_latencies.append(took)
+                    polls_needed.append(poll)
+                    finalised += 1
+                    return time.perf_counter() - start
+            await asyncio.sleep(poll_interval_s)
+        return None
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            return await asyncio.gather(*(poll_shop(http, c) for c in clients))
+
+    totals = [t for t in asyncio.run(run()) if t is not None]
+    downloaded = sum(
+        os.path.exists(f"downloads/{c.shop_url}_products.jsonl") for c in clients
+    )
+    return {
+        "shops": shops,
+        "finalised": finalised,
+        "downloaded_files": downloaded,
+        "shopify_calls": shopify.calls,
+        "mean_polls": round(sum(polls_needed) / len(polls_needed), 2) if polls_needed else None,
+        **latency_summary(poll_latencies, "status_poll"),
+        **latency_summary(finalise_latencies, "status_finalise"),
+        "time_to_finalise_p50_ms": round(percentile(totals, 50) * 1000, 3),
+    }
+
+
+def jsonl_parse(shopify, lines: int = 1_000_000, kind: str = "products") -> dict:
+    """Download + parse throughput of `read_jsonl_from_url` on a synthetic export."""
+    url_path = f"/bulk/parse-bench/{kind}-{lines}.jsonl"
+    file_path = os.path.join(shopify.workdir, f"parse-bench-{kind}-{lines}.jsonl")
+    stats = write_jsonl(file_path, kind, lines)
+    shopify.bulk_files[url_path] = file_path
+
+    start = time.perf_counter()
+    rows = read_jsonl_from_url(f"{shopify.url}{url_path}")
+    elapsed = time.perf_counter() - start
+
+    # Parse-only throughput on one core vs. all cores, without the download.
+    workers = os.cpu_count() or 1
+    start = time.perf_counter()
+    parse_jsonl_file(file_path, workers=1)
+    single = time.perf_counter() - start
+    start = time.perf_counter()
+    parse_jsonl_file(file_path, workers=workers, parallel_min_bytes=0)
+    parallel = time.perf_counter() - start
+
+    return {
+        "lines": stats["lines"],
+        "bytes": stats["bytes"],
+        "parsed": len(rows),
+        "workers": workers,
+        "parse_total_ms": round(elapsed * 1000, 3),
+        "parse_lines_per_s": round(stats["lines"] / elapsed, 1),
+        "parse_mb_per_s": round(stats["bytes"] / elapsed / 1e6, 2),
+        "parse_single_core_lines_per_s": round(stats["lines"] / single, 1),
+        "parse_all_cores_lines_per_s": round(stats["lines"] / parallel, 1),
+    }
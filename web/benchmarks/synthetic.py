@@ -0,0 +1,101 @@
+"""
+Synthetic Shopify bulk-export data.
+
+Lines follow the shape of a real bulk operation result: one JSON object per
+line, with child rows (variants, images, line items) pointing at their parent
+through `__parentId`.
+"""
+import json
+import random
+
+VENDORS = ["Couture", "Northwind", "Acme", "Luma", "Zephyr", "Orbit"]
+PRODUCT_TYPES = ["Hoodie", "Jacket", "Sweatshirt", "Tee", "Trainer", "Kit"]
+ADJECTIVES = ["Classic", "Summit", "Street", "All-Weather", "Elements", "Complete"]
+TAGS = ["sale", "new", "winter", "summer", "eco", "limited", "men", "women"]
+
+
+def product_gid(i: int) -> str:
+    return f"gid://shopify/Product/{1000000 + i}"
+
+
+def product_rows(i: int, variants: int = 3, images: int = 1, rng=random):
+    """Yields the product row followed by its variant and image rows."""
+    gid = product_gid(i)
+    product_type = PRODUCT_TYPES[i % len(PRODUCT_TYPES)]
+    title = f"{ADJECTIVES[i % len(ADJECTIVES)]} {product_type} {i}"
+    yield {
+        "id": gid,
+        "title": title,
+        "handle": title.lower().replace(" ", "-"),
+        "descriptionHtml": f"<p>{title} made from recycled fibres.</p>",
+        "productType": product_type,
+        "vendor": VENDORS[i % len(VENDORS)],
+        "tags": rng.sample(TAGS, 3),
+        "status": "ACTIVE",
+    }
+    for v in range(variants):
+        yield {
+            "id": f"gid://shopify/ProductVariant/{(1000000 + i) * 10 + v}",
+            "title": ["S", "M", "L", "XL"][v % 4],
+            "sku": f"SKU-{i}-{v}",
+            "inventoryQuantity": rng.randint(0, 50),
+            "price": f"{rng.randint(10, 200)}.00",
+            "__parentId": gid,
+        }
+    for m in range(images):
+        yield {
+            "originalSrc": f"https://cdn.example.com/{i}/{m}.jpg",
+            "altText": title,
+            "__parentId": gid,
+        }
+
+
+def order_rows(i: int, n_products: int, line_items: int = 2, rng=random):
+    """Yields an order row followed by its line item rows."""
+    gid = f"gid://shopify/Order/{5000000 + i}"
+    created_at = f"2024-{(i % 12) + 1:02d}-{(i % 28) + 1:02d}T10:00:00Z"
+    yield {
+        "id": gid,
+        "name": f"#{1000 + i}",
+        "createdAt": created_at,
+        "updatedAt": created_at,
+        "currencyCode": "USD",
+        "totalPriceSet": {"shopMoney": {"amount": "120.00", "currencyCode": "USD"}},
+    }
+    for li in range(line_items):
+        p = rng.randrange(max(n_products, 1))
+        yield {
+            "id": f"gid://shopify/LineItem/{(5000000 + i) * 10 + li}",
+            "title": f"Product {p}",
+            "quantity": rng.randint(1, 3),
+            "discountedTotalSet": {
+                "shopMoney": {"amount": "60.00", "currencyCode": "USD"}
+            },
+            "product": {"id": product_gid(p), "title": f"Product {p}"},
+            "variant": {"id": f"gid://shopify/ProductVariant/{p}", "sku": f"SKU-{p}-0"},
+            "__parentId": gid,
+        }
+
+
+def write_jsonl(path: str, kind: str, lines: int, seed: int = 7) -> dict:
+    """
+    Writes roughly `lines` rows of a products or orders export to `path`.
+    Returns the number of lines, top-level objects and bytes written.
+    """
+    rng = random.Random(seed)
+    written = objects = size = 0
+    with open(path, "w", encoding="utf-8") as f:
+        i = 0
+        while written < lines:
+            if kind == "products":
+                rows = product_rows(i, rng=rng)
+            else:
+                rows = order_rows(i, n_products=max(lines // 5, 1), rng=rng)
+            for row in rows:
+                line = json.dumps(row) + "\n"
+                f.write(line)
+                written += 1
+                size += len(line)
+            objects += 1
+            i += 1
+    return {"lines": written, "objects": objects, "bytes": size}
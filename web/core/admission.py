@@ -0,0 +1,190 @@
+# core/admission.py
+"""
+Admission control for requests that have to go upstream, so a slow reco
+service makes the proxy shed load instead of piling up requests until
+the worker runs out of memory.
+
+At most `limit` requests are in flight. The limit adapts between
+RECO_ADMISSION_MIN_IN_FLIGHT and RECO_ADMISSION_MAX_IN_FLIGHT: it grows
+by roughly one per `limit` completions while latency stays under
+RECO_ADMISSION_TARGET_LATENCY_SECONDS, and shrinks by a tenth (at most
+once per target interval) when a request takes longer. Beyond the limit,
+requests wait in a FIFO queue of RECO_ADMISSION_QUEUE_SIZE. A request
+that would overflow the queue is shed at once; one still queued at its
+deadline (RECO_ADMISSION_QUEUE_TIMEOUT_SECONDS) is shed then, and is
+never started late.
+
+Shed requests raise OverloadedError with a Retry-After estimate from the
+recent latency and queue depth; callers answer from a stale cache entry
+if they have one.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from core.config import settings
+from core.logger import get_logger
+from core.metrics import metrics
+
+logger = get_logger("admission")
+
+QUEUE_FULL = "queue_full"
+DEADLINE = "deadline"
+# Weight of the newest latency sample in the moving average.
+LATENCY_SMOOTHING = 0.2
+
+
+class OverloadedError(Exception):
+    """Raised instead of admitting a request when the proxy is overloaded."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Request shed ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    __slots__ = ("deadline", "future", "loop", "granted")
+
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+        self.granted = False
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        name: str,
+        min_limit: int,
+        max_limit: int,
+        max_queue: int,
+        queue_timeout: float,
+        target_latency: float,
+    ):
+        self.name = name
+        self.min_limit = max(min_limit, 1)
+        self.max_limit = max(max_limit, self.min_limit)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.target_latency = target_latency
+        self.limit = float(self.max_limit)
+        self._in_flight = 0
+        self._queue: deque = deque()
+        self._latency = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def _retry_after(self) -> float:
+        """Seconds until a request sent now would likely be admitted."""
+        latency = self._latency or self.target_latency
+        return max(1.0, math.ceil(latency * (len(self._queue) + 1) / self.limit))
+
+    def _shed(self, reason: str, retry_after: float):
+        metrics.incr("reco_shed_total", controller=self.name, reason=reason)
+        raise OverloadedError(reason, retry_after)
+
+    async def acquire(self):
+        now = time.monotonic()
+        with self._lock:
+            if not self._queue and self._in_flight < int(self.limit):
+                self._in_flight += 1
+                return
+            if len(self._queue) >= self.max_queue:
+                retry_after = self._retry_after()
+                ticket = None
+            else:
+                ticket = _Ticket(now + self.queue_timeout)
+                self._queue.append(ticket)
+        if ticket is None:
+            self._shed(QUEUE_FULL, retry_after)
+
+        try:
+            await asyncio.wait_for(ticket.future, self.queue_timeout)
+        except BaseException as e:
+            with self._lock:
+                granted = ticket.granted
+                if not granted:
+                    try:
+                        self._queue.remove(ticket)
+                    except ValueError:
+                        pass  # already dropped as expired
+                retry_after = self._retry_after()
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            if granted and timed_out:
+                return
+            if granted:
+                self.release(0.0)
+            if timed_out:
+                self._shed(DEADLINE, retry_after)
+            raise
+
+    def _adapt(self, latency: float, now: float):
+        self._latency = (
+            latency if not self._latency
+            else (1 - LATENCY_SMOOTHING) * self._latency + LATENCY_SMOOTHING * latency
+        )
+        if latency > self.target_latency:
+            if now - self._last_decrease >= self.target_latency:
+                self.limit = max(float(self.min_limit), self.limit * 0.9)
+                self._last_decrease = now
+        else:
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+
+    def release(self, latency: float):
+        now = time.monotonic()
+        with self._lock:
+            self._in_flight -= 1
+            if latency:
+                self._adapt(latency, now)
+            while self._queue and self._in_flight < int(self.limit):
+                ticket = self._queue.popleft()
+                if ticket.deadline <= now:
+                    continue  # its wait timer sheds it; don't start it late
+                ticket.granted = True
+                self._in_flight += 1
+                ticket.loop.call_soon_threadsafe(_wake, ticket.future)
+
+    def under_load(self, threshold: float) -> bool:
+        """True while requests are queueing or `threshold` of the limit is in flight."""
+        with self._lock:
+            return bool(self._queue) or self._in_flight >= self.limit * threshold
+
+    @asynccontextmanager
+    async def admit(self):
+        """Holds an admission slot for the duration of the block."""
+        await self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self._in_flight,
+                "queue_depth": len(self._queue),
+                "latency_seconds": round(self._latency, 3),
+            }
+
+
+reco_admission = AdmissionController(
+    "reco",
+    min_limit=settings.RECO_ADMISSION_MIN_IN_FLIGHT,
+    max_limit=settings.RECO_ADMISSION_MAX_IN_FLIGHT,
+    max_queue=settings.RECO_ADMISSION_QUEUE_SIZE,
+    queue_timeout=settings.RECO_ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    target_latency=settings.RECO_ADMISSION_TARGET_LATENCY_SECONDS,
+)
+metrics.register_collector("reco_admission", reco_admission.snapshot)
@@ -0,0 +1,134 @@
+# core/cache.py
+"""
+Small in-process caches shared by the auth, sync and proxy paths.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded LRU cache whose entries expire.
+
+    Each entry carries its own expiry (`set(..., ttl=...)` or an absolute
+    `expires_at`), falling back to the cache-wide `default_ttl`. When full,
+    the least recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize: int = 1024, default_ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float = None, expires_at: float = None):
+        if expires_at is None:
+            expires_at = time.time() + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[0] if entry else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one execution.
+
+    The first caller runs the function; callers arriving while it is in
+    flight wait for and share its result (or exception). A result is also
+    reused for `window` seconds after it completes.
+    """
+
+    def __init__(self, window: float = 0.0, maxsize: int = 10000):
+        self.window = window
+        self._results = TTLCache(maxsize=maxsize, default_ttl=window)
+        self._in_flight: dict = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.shared = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            if self.window > 0:
+                found = self._results.get(key, _MISSING)
+                if found is not _MISSING:
+                    self.shared += 1
+                    return found
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+                self.executions += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            if self.window > 0:
+                self._results.set(key, call.result)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def forget(self, key):
+        """Drops a reused result so the next call runs again."""
+        self._results.pop(key)
+
+    def stats(self) -> dict:
+        return {"executions": self.executions, "shared": self.shared}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_MISSING = object()
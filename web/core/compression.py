@@ -0,0 +1,160 @@
+# core/compression.py
+"""
+Response compression negotiated from Accept-Encoding.
+
+CompressionMiddleware compresses complete (non-streaming) JSON, HTML and
+text responses of at least COMPRESSION_MIN_BYTES with brotli when the
+client accepts it and the package is installed, else gzip. Responses
+that already carry a Content-Encoding pass through untouched.
+
+Responses served many times from a cache use PrecompressedBody instead:
+it keeps the JSON body and each compressed variant next to the data, so
+a cached payload is serialised and compressed once, not on every hit.
+"""
+import gzip
+import json
+import threading
+
+from starlette.datastructures import Headers, MutableHeaders
+from fastapi.responses import Response
+
+from core.config import settings
+
+try:
+    import brotli  # optional dependency; gzip only without it
+except ImportError:
+    brotli = None
+
+BROTLI = "br"
+GZIP = "gzip"
+_COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript")
+
+
+def supported_encodings() -> tuple:
+    """Encodings this process can produce, in order of preference."""
+    return (BROTLI, GZIP) if brotli is not None else (GZIP,)
+
+
+def _parse_accept_encoding(accept_encoding: str) -> dict:
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+    return weights
+
+
+def choose_encoding(accept_encoding: str | None, size: int) -> str | None:
+    """The encoding to send a `size`-byte body with, or None to send it as is."""
+    if not accept_encoding or size < settings.COMPRESSION_MIN_BYTES:
+        return None
+    weights = _parse_accept_encoding(accept_encoding)
+    best, best_weight = None, 0.0
+    for encoding in supported_encodings():
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == BROTLI:
+        return brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL)
+
+
+def _compressible(content_type: str | None) -> bool:
+    return bool(content_type) and content_type.startswith(_COMPRESSIBLE_TYPES)
+
+
+class PrecompressedBody:
+    """A JSON payload with its encoded body and compressed variants, each built once."""
+
+    __slots__ = ("data", "_body", "_variants", "_lock")
+
+    def __init__(self, data):
+        self.data = data
+        self._body = None
+        self._variants: dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def body(self) -> bytes:
+        if self._body is None:
+            # Same encoding as FastAPI's JSONResponse.
+            self._body = json.dumps(
+                self.data, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+            ).encode("utf-8")
+        return self._body
+
+    def encoded(self, encoding: str | None) -> bytes:
+        if encoding is None:
+            return self.body
+        with self._lock:
+            variant = self._variants.get(encoding)
+            if variant is None:
+                variant = self._variants[encoding] = compress(self.body, encoding)
+        return variant
+
+    def response(self, accept_encoding: str | None) -> Response:
+        encoding = choose_encoding(accept_encoding, len(self.body))
+        headers = {"Vary": "Accept-Encoding"}
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(self.encoded(encoding), media_type="application/json", headers=headers)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing whole responses; streamed ones pass through."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = Headers(scope=scope).get("accept-encoding")
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            held, start = start, None
+            if message.get("more_body"):
+                await send(held)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=held["headers"])
+            if "content-encoding" not in headers and _compressible(headers.get("content-type")):
+                headers.add_vary_header("Accept-Encoding")
+                encoding = choose_encoding(accept_encoding, len(body))
+                if encoding:
+                    body = compress(body, encoding)
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(body))
+                    etag = headers.get("etag")
+                    if etag and not etag.startswith("W/"):
+                        headers["ETag"] = f"W/{etag}"
+            await send(held)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
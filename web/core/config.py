@@ -18,11 +18,173 @@ class Settings(BaseSettings):
 
     APP_URL: str = Field(..., alias="SHOPIFY_APP_URL")
 
+    # Base URL of a shop's Admin API; `{shop}` is replaced with the shop domain.
+    # Overridden by the offline benchmarks to point at a local fake.
+    SHOPIFY_ADMIN_URL: str = "https://{shop}"
+
+    # Verified App Bridge session tokens and HMAC-signed query strings are
+    # cached so repeat requests skip the crypto work.
+    SESSION_TOKEN_CACHE_SIZE: int = 4096
+    SESSION_TOKEN_LEEWAY_SECONDS: int = 5
+    HMAC_CACHE_TTL_SECONDS: int = 300
+
     # Database URL for storing tokens and sync status
     DATABASE_URL: str = "sqlite:///./shopify_app.db"
+    # Development only: delete the database on startup and shutdown. Workers
+    # share it (stores, jobs, watermarks), so never in production.
+    DEV_RESET_DATABASE: bool = False
+    # Sync ledger database, kept apart so a reset doesn't lose sync history.
+    SYNC_LEDGER_DATABASE_URL: str = "sqlite:///./sync_ledger.db"
+
+    # Field profile used for bulk exports when a shop hasn't chosen one:
+    # "full", "reco-minimal", or a JSON field spec.
+    DEFAULT_FIELD_PROFILE: str = "full"
+
+    # Worker processes for parsing large bulk export files (0 = one per core)
+    JSONL_PARSE_WORKERS: int = 0
+
+    # Background jobs (syncs, post-install setup) run on this many threads
+    JOB_WORKERS: int = 4
+
+    # Server-side polling of running bulk operations (seconds). The interval
+    # per shop adapts between the min and max based on objectCount growth.
+    BULK_POLL_MIN_INTERVAL: float = 2.0
+    BULK_POLL_MAX_INTERVAL: float = 60.0
+    BULK_POLL_TICK: float = 0.5
+    # Concurrent /sync/status and history reads for a shop share one
+    # Shopify call, and its result for this long.
+    SYNC_STATUS_COALESCE_SECONDS: float = 1.0
+
+    # Reco config sync: delete carousel metaobjects the reco service no longer lists.
+    RECO_CONFIG_PRUNE: bool = False
+
+    # Sync ledger summaries compare the last N successful syncs with the N before.
+    SYNC_LEDGER_SUMMARY_WINDOW: int = 50
+
+    # Webhook spool (see services/webhook_service.py): how often spooled
+    # events are applied, the minimum gap between neighbour rebuilds, how
+    # many flushes a shop's failing events get before dead-lettering, and
+    # how long a product delete keeps late updates out (Shopify retries a
+    # webhook delivery for up to 48 hours).
+    WEBHOOK_FLUSH_INTERVAL_SECONDS: float = 5.0
+    WEBHOOK_NEIGHBOUR_REBUILD_SECONDS: float = 600.0
+    WEBHOOK_MAX_APPLY_ATTEMPTS: int = 5
+    WEBHOOK_TOMBSTONE_TTL_SECONDS: float = 172800.0
 
     # Proxy URL for hitting requests like: similarity endpoint, product handles, etc
     PROXY_SERVER_URL: str = "http://localhost:8003/shopify"
     PROXY_API_KEY: str = "API_KEY"
 
+    # Storefront search waits this long for the reco service, then answers
+    # from the local BM25 index, which gets its own (much smaller) budget.
+    RECO_SEARCH_TIMEOUT_SECONDS: float = 1.5
+    SEARCH_FALLBACK_BUDGET_MS: float = 50.0
+
+    # Similar-product neighbours precomputed after each catalogue sync.
+    # Product requests on LOCAL_SIMILARITY_PATHS (none unless configured,
+    # e.g. ["similar-products"]) are answered from them instead of the reco
+    # service; other product requests only fall back to them when upstream
+    # fails.
+    SIMILARITY_TOP_K: int = 50
+    SIMILARITY_FEATURE_DIM: int = 512
+    SIMILARITY_BLOCK_ROWS: int = 512
+    LOCAL_SIMILARITY_PATHS: list[str] = []
+
+    # Proxy response cache, and the warmer that fills it after a sync with
+    # the best-selling products' carousels at a throttled rate.
+    RECO_CACHE_SIZE: int = 50000
+    RECO_CACHE_TTL_SECONDS: float = 300.0
+    RECO_WARM_PATHS: list[str] = ["similar-products"]
+    RECO_WARM_MAX_PRODUCTS: int = 200
+    RECO_WARM_LOOKBACK_DAYS: int = 30
+    RECO_WARM_RATE_PER_SECOND: float = 10.0
+
+    # Server-rendered carousel fragments: kept briefly so a product page's
+    # repeat views re-use the HTML, and browsers revalidate by ETag.
+    CAROUSEL_FRAGMENT_CACHE_SIZE: int = 20000
+    CAROUSEL_FRAGMENT_TTL_SECONDS: float = 60.0
+
+    # Per-store isolation on the reco service (see core/fairness.py). A tier
+    # sets a store's upstream rate and burst, concurrent calls and its fair
+    # queuing weight; stores not assigned a tier use "default".
+    RECO_UPSTREAM_CONCURRENCY: int = 64
+    RECO_FAIR_QUEUE_TIMEOUT_SECONDS: float = 2.0
+    RECO_STORE_TIERS: dict[str, dict] = {
+        "default": {"rate": 20.0, "burst": 40, "concurrency": 8, "weight": 1.0},
+        "plus": {"rate": 100.0, "burst": 200, "concurrency": 32, "weight": 4.0},
+    }
+    RECO_STORE_TIER_ASSIGNMENTS: dict[str, str] = {}
+    # Per-store state (rate buckets, prefetch budgets, theme activity) is
+    # kept only for installed stores; requests naming any other store share
+    # one "other" entry and metric label. Idle entries expire, and at most
+    # RECO_STORE_STATE_SIZE are kept.
+    RECO_STORE_STATE_SIZE: int = 10000
+    RECO_STORE_STATE_TTL_SECONDS: float = 86400.0
+    INSTALLED_STORES_TTL_SECONDS: float = 30.0
+
+    # Admission control for /api/reco requests that go upstream (see
+    # core/admission.py). Shed requests are answered from responses kept
+    # for RECO_STALE_TTL_SECONDS past their freshness, when there is one.
+    RECO_ADMISSION_MIN_IN_FLIGHT: int = 8
+    RECO_ADMISSION_MAX_IN_FLIGHT: int = 128
+    RECO_ADMISSION_QUEUE_SIZE: int = 256
+    RECO_ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 1.0
+    RECO_ADMISSION_TARGET_LATENCY_SECONDS: float = 1.0
+    RECO_STALE_TTL_SECONDS: float = 3600.0
+
+    # Prefetching page N+1 of paginated reco/search responses into the
+    # cache (see services/reco_prefetch_service.py), within a per-store
+    # budget and only while admission control is under MAX_LOAD of its limit.
+    RECO_PREFETCH_ENABLED: bool = False
+    RECO_PREFETCH_RATE_PER_SECOND: float = 2.0
+    RECO_PREFETCH_BURST: int = 10
+    RECO_PREFETCH_MAX_LOAD: float = 0.5
+
+    # Pushing synced products and orders to the reco backend's ingest API.
+    RECO_PUSH_ENABLED: bool = True
+    RECO_PUSH_BATCH_BYTES: int = 4 * 1024 * 1024
+    RECO_PUSH_BATCH_RECORDS: int = 5000
+    RECO_PUSH_CONCURRENCY: int = 4
+    RECO_PUSH_MAX_RETRIES: int = 5
+    RECO_PUSH_RETRY_BASE_SECONDS: float = 0.5
+    # Tombstones are not staged when a sync would delete more than this
+    # share of the previous catalogue (1.0 allows deleting everything).
+    RECO_PUSH_MAX_DELETE_RATIO: float = 0.5
+
+    # Response compression: gzip, or brotli when the package is installed,
+    # for bodies of at least COMPRESSION_MIN_BYTES.
+    COMPRESSION_MIN_BYTES: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 5
+
+    # Cross-worker locks and shared cache (see core/coordination.py).
+    # COORDINATION_URL is a file path for "sqlite", a redis:// URL for "redis".
+    COORDINATION_BACKEND: str = "sqlite"
+    COORDINATION_URL: str = "coordination.db"
+
+    # Outbound calls: per-destination timeouts, jittered retries drawn from
+    # a retry budget, and circuit breakers per shop / reco host.
+    SHOPIFY_CONNECT_TIMEOUT_SECONDS: float = 3.05
+    SHOPIFY_READ_TIMEOUT_SECONDS: float = 20.0
+    SHOPIFY_MAX_RETRIES: int = 2
+    # Longest wait before retrying a query Shopify's GraphQL cost limit throttled.
+    SHOPIFY_THROTTLE_MAX_WAIT_SECONDS: float = 10.0
+    RECO_TIMEOUT_SECONDS: float = 5.0
+    RECO_MAX_RETRIES: int = 1
+    RETRY_BASE_DELAY_SECONDS: float = 0.2
+    RETRY_MAX_DELAY_SECONDS: float = 2.0
+    RETRY_BUDGET_RATIO: float = 0.1
+    RETRY_BUDGET_MIN_PER_SECOND: float = 1.0
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_RESET_TIMEOUT_SECONDS: float = 30.0
+    BREAKER_HALF_OPEN_PROBES: int = 1
+    # /metrics endpoints require it in the X-Metrics-Token header, and are
+    # not served at all while it is empty.
+    METRICS_TOKEN: str = ""
+
+    # Logging: records go through a queue to a background writer thread.
+    # DEBUG lines on the request hot path are sampled at this rate (0.0 - 1.0).
+    LOG_LEVEL: str = "INFO"
+    LOG_DEBUG_SAMPLE_RATE: float = 0.01
+
 settings = Settings()
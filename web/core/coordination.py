@@ -0,0 +1,286 @@
+# core/coordination.py
+"""
+Coordination between uvicorn workers: advisory locks and a shared cache.
+
+In-process state (is a bulk operation being started, was it finalised,
+what's cached) stops being authoritative once several worker processes
+serve the app. Everything that must hold across workers goes through the
+`Coordinator` returned by `get_coordinator()`:
+
+    with coordinator.lock(f"bulk:{shop}", ttl=120) as acquired:
+        if acquired:
+            ...
+    coordinator.add(f"finalised:{shop}:{op_id}", True, ttl=86400)  # claim once
+    coordinator.get(key) / coordinator.set(key, value, ttl)
+
+COORDINATION_BACKEND picks the implementation:
+
+    "sqlite"  a SQLite file shared by all workers on the host (default)
+    "local"   in-process only, for a single worker
+    "redis"   a Redis server at COORDINATION_URL (needs the redis package)
+
+Locks expire after their TTL so a crashed worker can't hold one forever.
+Values must be JSON-serialisable.
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from core.cache import TTLCache
+from core.config import settings
+from core.logger import get_logger
+
+logger = get_logger("coordination")
+
+LOCK_RETRY_SECONDS = 0.05
+
+
+class Coordinator:
+    """Interface for cross-worker locks and cache. Subclasses implement the primitives."""
+
+    def acquire(self, name: str, ttl: float) -> str | None:
+        """Takes the named lock for `ttl` seconds. Returns a release token, or None if held."""
+        raise NotImplementedError
+
+    def release(self, name: str, token: str):
+        """Releases the lock if `token` still owns it."""
+        raise NotImplementedError
+
+    def get(self, key: str, default=None):
+        raise NotImplementedError
+
+    def set(self, key: str, value, ttl: float):
+        raise NotImplementedError
+
+    def add(self, key: str, value, ttl: float) -> bool:
+        """Sets `key` only if it is absent (or expired). Returns True if it was set."""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    @contextmanager
+    def lock(self, name: str, ttl: float, wait: float = 0):
+        """
+        Advisory lock; yields whether it was acquired. Gives up at once, or
+        after retrying for up to `wait` seconds.
+        """
+        token = self.acquire(name, ttl)
+        deadline = time.monotonic() + wait
+        while token is None and time.monotonic() < deadline:
+            time.sleep(LOCK_RETRY_SECONDS)
+            token = self.acquire(name, ttl)
+        try:
+            yield token is not None
+        finally:
+            if token is not None:
+                self.release(name, token)
+
+
+class LocalCoordinator(Coordinator):
+    """Single-process implementation."""
+
+    def __init__(self):
+        self._locks: dict[str, tuple] = {}
+        self._cache = TTLCache(maxsize=100000, default_ttl=60)
+        self._lock = threading.Lock()
+
+    def acquire(self, name, ttl):
+        now = time.time()
+        with self._lock:
+            held = self._locks.get(name)
+            if held and held[1] > now:
+                return None
+            token = uuid.uuid4().hex
+            self._locks[name] = (token, now + ttl)
+            return token
+
+    def release(self, name, token):
+        with self._lock:
+            held = self._locks.get(name)
+            if held and held[0] == token:
+                del self._locks[name]
+
+    def get(self, key, default=None):
+        return self._cache.get(key, default)
+
+    def set(self, key, value, ttl):
+        self._cache.set(key, value, ttl=ttl)
+
+    def add(self, key, value, ttl):
+        with self._lock:
+            if self._cache.get(key, _MISSING) is not _MISSING:
+                return False
+            self._cache.set(key, value, ttl=ttl)
+            return True
+
+    def delete(self, key):
+        self._cache.pop(key)
+
+
+class SQLiteCoordinator(Coordinator):
+    """
+    Shares locks and cache entries through a SQLite file, so every worker
+    on the host sees them. Writes that must be atomic (lock acquisition,
+    add) run in BEGIN IMMEDIATE transactions.
+    """
+
+    # Expired rows are purged every this many writes.
+    PURGE_EVERY = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, token TEXT, expires_at REAL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _wrote(self, db: sqlite3.Connection):
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            now = time.time()
+            db.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+            db.execute("DELETE FROM locks WHERE expires_at <= ?", (now,))
+
+    def acquire(self, name, ttl):
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT expires_at FROM locks WHERE name = ?", (name,)).fetchone()
+            if row and row[0] > now:
+                return None
+            token = uuid.uuid4().hex
+            db.execute(
+                "INSERT OR REPLACE INTO locks (name, token, expires_at) VALUES (?, ?, ?)",
+                (name, token, now + ttl),
+            )
+            self._wrote(db)
+        return token
+
+    def release(self, name, token):
+        self._connect().execute("DELETE FROM locks WHERE name = ? AND token = ?", (name, token))
+
+    def get(self, key, default=None):
+        row = self._connect().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value, ttl):
+        with self._transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl),
+            )
+            self._wrote(db)
+
+    def add(self, key, value, ttl):
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row and row[0] > now:
+                return False
+            db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now + ttl),
+            )
+            self._wrote(db)
+        return True
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+
+class RedisCoordinator(Coordinator):
+    """Locks and cache in Redis, for workers spread over several hosts."""
+
+    _RELEASE = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then "
+        "return redis.call('del', KEYS[1]) else return 0 end"
+    )
+
+    def __init__(self, url: str):
+        import redis  # optional dependency, only needed for this backend
+
+        self._redis = redis.Redis.from_url(url)
+        self._release = self._redis.register_script(self._RELEASE)
+
+    def acquire(self, name, ttl):
+        token = uuid.uuid4().hex
+        if self._redis.set(f"lock:{name}", token, nx=True, px=int(ttl * 1000)):
+            return token
+        return None
+
+    def release(self, name, token):
+        self._release(keys=[f"lock:{name}"], args=[token])
+
+    def get(self, key, default=None):
+        value = self._redis.get(f"cache:{key}")
+        return json.loads(value) if value is not None else default
+
+    def set(self, key, value, ttl):
+        self._redis.set(f"cache:{key}", json.dumps(value), px=int(ttl * 1000))
+
+    def add(self, key, value, ttl):
+        return bool(self._redis.set(f"cache:{key}", json.dumps(value), nx=True, px=int(ttl * 1000)))
+
+    def delete(self, key):
+        self._redis.delete(f"cache:{key}")
+
+
+_MISSING = object()
+_coordinator: Coordinator | None = None
+_coordinator_lock = threading.Lock()
+
+
+def create_coordinator(backend: str, url: str) -> Coordinator:
+    if backend == "local":
+        return LocalCoordinator()
+    if backend == "sqlite":
+        return SQLiteCoordinator(url)
+    if backend == "redis":
+        return RedisCoordinator(url)
+    raise ValueError(f"Unknown coordination backend '{backend}'")
+
+
+def get_coordinator() -> Coordinator:
+    """The process-wide coordinator, created on first use from settings."""
+    global _coordinator
+    if _coordinator is None:
+        with _coordinator_lock:
+            if _coordinator is None:
+                _coordinator = create_coordinator(
+                    settings.COORDINATION_BACKEND, settings.COORDINATION_URL
+                )
+                logger.info(
+                    "Coordination backend ready",
+                    extra={"backend": settings.COORDINATION_BACKEND},
+                )
+    return _coordinator
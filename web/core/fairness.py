@@ -0,0 +1,241 @@
+# core/fairness.py
+"""
+Per-store isolation for calls to the reco service, so one store's spike
+(or a crawler on its storefront) can't take the upstream from everyone.
+
+Each store belongs to a tier from RECO_STORE_TIERS (stores not listed in
+RECO_STORE_TIER_ASSIGNMENTS are "default"), which sets:
+
+    rate, burst    token bucket on the store's upstream calls
+    concurrency    the store's upstream calls in flight at once
+    weight         its share of the upstream when that is contended
+
+At most RECO_UPSTREAM_CONCURRENCY upstream calls are in flight per worker.
+Calls that can't start wait in per-store FIFO queues, and each freed slot
+goes to the waiting call with the lowest start tag (start-time fair
+queuing): a store's tags advance by 1/weight per call, so while several
+stores are waiting they get slots in proportion to their weights, and a
+store that floods the queue only lengthens its own wait. A call waits at
+most RECO_FAIR_QUEUE_TIMEOUT_SECONDS.
+
+Callers get StoreThrottledError when the store is over its rate or its
+call timed out in the queue. Stores are named by the caller's store key
+(see reco_proxy_service.store_key), so unknown stores share one entry.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from core.cache import TTLCache
+from core.config import settings
+from core.logger import get_logger
+from core.metrics import metrics
+
+logger = get_logger("fairness")
+
+DEFAULT_TIER = "default"
+RATE = "rate"
+QUEUE = "queue"
+
+
+class StoreThrottledError(Exception):
+    """Raised instead of calling upstream for a store over its limits."""
+
+    def __init__(self, store: str, reason: str, retry_after: float):
+        super().__init__(f"Store '{store}' is over its {reason} limit")
+        self.store = store
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Tier:
+    def __init__(self, name: str, rate: float, burst: float, concurrency: int, weight: float):
+        self.name = name
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.concurrency = max(concurrency, 1)
+        self.weight = max(weight, 0.01)
+
+    @classmethod
+    def from_config(cls, name: str, config: dict) -> "Tier":
+        return cls(
+            name,
+            rate=float(config.get("rate", 0)),
+            burst=float(config.get("burst", 1)),
+            concurrency=int(config.get("concurrency", 1)),
+            weight=float(config.get("weight", 1)),
+        )
+
+
+def tier_for(store: str) -> Tier:
+    name = settings.RECO_STORE_TIER_ASSIGNMENTS.get(store, DEFAULT_TIER)
+    return _tiers.get(name) or _tiers[DEFAULT_TIER]
+
+
+class TokenBucket:
+    """`rate` tokens a second up to `burst`; a rate of 0 means unlimited."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_take(self) -> float:
+        """Takes a token and returns 0, or returns the seconds until one is available."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0.0
+            return (1.0 - self._tokens) / self.rate
+
+
+class _Waiter:
+    __slots__ = ("store", "tier", "start", "future", "loop", "granted")
+
+    def __init__(self, store: str, tier: Tier, start: float):
+        self.store = store
+        self.tier = tier
+        self.start = start
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+        self.granted = False
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class FairScheduler:
+    """Rate limits, concurrency caps and weighted fair queuing of one worker's upstream calls."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._in_flight = 0
+        self._store_in_flight: dict[str, int] = {}
+        self._queues: dict[str, deque] = {}
+        self._next_start: dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._buckets = TTLCache(
+            maxsize=settings.RECO_STORE_STATE_SIZE,
+            default_ttl=settings.RECO_STORE_STATE_TTL_SECONDS,
+        )
+        self._lock = threading.Lock()
+
+    def check_rate(self, store: str):
+        """Spends one of the store's tokens; raises StoreThrottledError if it has none."""
+        with self._lock:
+            bucket = self._buckets.get(store)
+            if bucket is None:
+                tier = tier_for(store)
+                bucket = TokenBucket(tier.rate, tier.burst)
+            self._buckets.set(store, bucket)  # refreshes the idle expiry
+        wait = bucket.try_take()
+        if wait:
+            metrics.incr("reco_store_throttled_total", store=store, reason=RATE)
+            raise StoreThrottledError(store, RATE, wait)
+
+    def _runnable(self, store: str, tier: Tier) -> bool:
+        return self._store_in_flight.get(store, 0) < tier.concurrency
+
+    def _start(self, store: str):
+        self._in_flight += 1
+        self._store_in_flight[store] = self._store_in_flight.get(store, 0) + 1
+
+    def _dispatch(self):
+        """Grants free slots to waiters, lowest start tag first. Called with the lock held."""
+        while self._in_flight < self.capacity:
+            best = None
+            for queue in self._queues.values():
+                head = queue[0]
+                if self._runnable(head.store, head.tier) and (best is None or head.start < best.start):
+                    best = head
+            if best is None:
+                return
+            queue = self._queues[best.store]
+            queue.popleft()
+            if not queue:
+                del self._queues[best.store]
+            best.granted = True
+            self._virtual_time = max(self._virtual_time, best.start)
+            self._start(best.store)
+            best.loop.call_soon_threadsafe(_wake, best.future)
+
+    def _forget(self, store: str):
+        if store not in self._queues and not self._store_in_flight.get(store):
+            self._store_in_flight.pop(store, None)
+            self._next_start.pop(store, None)
+
+    async def acquire(self, store: str, timeout: float = None):
+        tier = tier_for(store)
+        timeout = settings.RECO_FAIR_QUEUE_TIMEOUT_SECONDS if timeout is None else timeout
+        with self._lock:
+            if not self._queues and self._in_flight < self.capacity and self._runnable(store, tier):
+                self._start(store)
+                return
+            start = max(self._virtual_time, self._next_start.get(store, 0.0))
+            self._next_start[store] = start + 1.0 / tier.weight
+            waiter = _Waiter(store, tier, start)
+            self._queues.setdefault(store, deque()).append(waiter)
+            self._dispatch()
+
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except BaseException as e:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    queue = self._queues[store]
+                    queue.remove(waiter)
+                    if not queue:
+                        del self._queues[store]
+                    self._forget(store)
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            if granted and timed_out:
+                return  # the slot arrived as the wait ran out
+            if granted:
+                self.release(store)
+            if timed_out:
+                metrics.incr("reco_store_throttled_total", store=store, reason=QUEUE)
+                raise StoreThrottledError(store, QUEUE, timeout) from None
+            raise
+
+    def release(self, store: str):
+        with self._lock:
+            self._in_flight -= 1
+            self._store_in_flight[store] -= 1
+            self._forget(store)
+            self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, store: str):
+        """Holds one of the store's upstream slots, waiting in its fair-queue turn."""
+        await self.acquire(store)
+        try:
+            yield
+        finally:
+            self.release(store)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "in_flight": self._in_flight,
+                "queued": {store: len(queue) for store, queue in self._queues.items()},
+            }
+
+
+_tiers = {name: Tier.from_config(name, config) for name, config in settings.RECO_STORE_TIERS.items()}
+_tiers.setdefault(DEFAULT_TIER, Tier(DEFAULT_TIER, 0.0, 1.0, settings.RECO_UPSTREAM_CONCURRENCY, 1.0))
+
+reco_scheduler = FairScheduler(settings.RECO_UPSTREAM_CONCURRENCY)
+metrics.register_collector("reco_fairness", reco_scheduler.snapshot)
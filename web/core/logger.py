@@ -0,0 +1,200 @@
+# core/logger.py
+"""
+Structured, non-blocking logging for the app.
+
+Callers only pay for building a LogRecord and putting it on a queue; a
+background QueueListener thread does the JSON formatting, secret redaction
+and the actual write to stdout.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import threading
+
+from core.config import settings
+
+ROOT_LOGGER_NAME = "couture"
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+# and is emitted as a structured field.
+_RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+# Field names whose values are never written out.
+SECRET_FIELD_NAMES = {
+    "access_token",
+    "api_key",
+    "x_api_key",
+    "x-api-key",
+    "x-shopify-access-token",
+    "client_secret",
+    "secret",
+    "token",
+    "authorization",
+}
+
+# Inline `key: value` / `key=value` pairs inside free-text messages.
+_INLINE_SECRET_RE = re.compile(
+    r"(?i)\b(api[_-]?key|access[_-]?token|x[_-]api[_-]key|client[_-]secret|"
+    r"x-shopify-access-token|authorization|token)(\s*[:=]\s*)([^\s,;&|]+)"
+)
+
+REDACTED = "***"
+
+_listener: logging.handlers.QueueListener | None = None
+_lock = threading.Lock()
+
+
+def _known_secret_values() -> list:
+    values = [
+        settings.SHOPIFY_APP_SECRET,
+        settings.PROXY_API_KEY,
+    ]
+    # Very short values would redact unrelated text, so skip them.
+    return [v for v in values if v and len(v) >= 6]
+
+
+def redact(text: str) -> str:
+    """Masks known secrets and inline `key=value` credentials in a string."""
+    text = _INLINE_SECRET_RE.sub(lambda m: f"{m.group(1)}{m.group(2)}{REDACTED}", text)
+    for value in _known_secret_values():
+        if value in text:
+            text = text.replace(value, REDACTED)
+    return text
+
+
+def redact_fields(fields: dict) -> dict:
+    """Returns a copy of `fields` with secret-named keys masked."""
+    cleaned = {}
+    for key, value in fields.items():
+        if key.lower() in SECRET_FIELD_NAMES:
+            cleaned[key] = REDACTED
+        elif isinstance(value, dict):
+            cleaned[key] = redact_fields(value)
+        elif isinstance(value, str):
+            cleaned[key] = redact(value)
+        else:
+            cleaned[key] = value
+    return cleaned
+
+
+class SampledLogger(logging.LoggerAdapter):
+    """
+    Logger wrapper that samples DEBUG calls before a LogRecord is built.
+
+    Building the record (caller lookup, timestamps, thread info) is most of
+    the cost of a log call, so dropped lines must bail out before that. A
+    call can override the default rate with `extra={"sample_rate": 0.1}`.
+    Records at INFO and above are never sampled.
+    """
+
+    def __init__(self, logger: logging.Logger, sample_rate: float = 1.0):
+        super().__init__(logger, None)
+        self.sample_rate = sample_rate
+
+    def process(self, msg, kwargs):
+        return msg, kwargs
+
+    def debug(self, msg, *args, **kwargs):
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        rate = (kwargs.get("extra") or {}).get("sample_rate", self.sample_rate)
+        if rate < 1.0 and random.random() >= rate:
+            return
+        self.logger._log(logging.DEBUG, msg, args, **kwargs)
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one redacted JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": redact(record.getMessage()),
+        }
+        fields = {
+            k: v
+            for k, v in record.__dict__.items()
+            if k not in _RESERVED_ATTRS and k != "sample_rate"
+        }
+        if fields:
+            payload.update(redact_fields(fields))
+        if record.exc_info:
+            payload["exc"] = redact(self.formatException(record.exc_info))
+        elif record.exc_text:
+            payload["exc"] = redact(record.exc_text)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread.
+
+    The stdlib handler formats in the caller; we only freeze the message
+    string so mutable args can't change before the listener sees them.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_text = None
+        if record.exc_info:
+            # Tracebacks hold frames; render them now so the record is inert.
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(stream=None) -> logging.Logger:
+    """
+    Configures the app logger to hand records to a background thread.
+    Safe to call more than once; only the first call installs handlers.
+    """
+    global _listener
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    with _lock:
+        if _listener is not None:
+            return root
+
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter())
+
+        queue_handler = _DeferredQueueHandler(log_queue)
+
+        root.handlers.clear()
+        root.addHandler(queue_handler)
+        root.setLevel(settings.LOG_LEVEL.upper())
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(
+            log_queue, output, respect_handler_level=True
+        )
+        _listener.start()
+        atexit.register(shutdown_logging)
+    return root
+
+
+def shutdown_logging():
+    """Flushes pending records and stops the background writer thread."""
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> SampledLogger:
+    """Returns a child of the app logger, e.g. get_logger("api") -> couture.api."""
+    return SampledLogger(
+        logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}"),
+        sample_rate=settings.LOG_DEBUG_SAMPLE_RATE,
+    )
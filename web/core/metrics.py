@@ -0,0 +1,51 @@
+# core/metrics.py
+"""
+In-process counters and gauges, served as JSON from /metrics.
+
+Counters are keyed by name plus optional labels:
+
+    metrics.incr("reco_cache_hits_total", store="a.myshopify.com")
+
+Components whose state is easier to read than to track (circuit
+breakers, queues) register a collector that returns a dict when /metrics
+is rendered.
+"""
+import threading
+from typing import Callable
+
+
+def _key(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    inner = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    return f"{name}{{{inner}}}"
+
+
+class Metrics:
+    def __init__(self):
+        self._counters: dict[str, float] = {}
+        self._gauges: dict[str, float] = {}
+        self._collectors: dict[str, Callable[[], dict]] = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def register_collector(self, name: str, collector: Callable[[], dict]):
+        self._collectors[name] = collector
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            data = {"counters": dict(self._counters), "gauges": dict(self._gauges)}
+        for name, collector in self._collectors.items():
+            data[name] = collector()
+        return data
+
+
+metrics = Metrics()
@@ -0,0 +1,276 @@
+# core/resilience.py
+"""
+Failure isolation for outbound calls (Shopify Admin API, reco service).
+
+- Retries use exponential backoff with full jitter, and are drawn from a
+  per-destination retry budget: a bucket that earns RETRY_BUDGET_RATIO of
+  a token per call (plus a small floor per second) and spends one per
+  retry. When a destination is failing everywhere, retries stop
+  multiplying the load.
+- A circuit breaker per shop or upstream host opens after
+  BREAKER_FAILURE_THRESHOLD consecutive failures and fails calls fast for
+  BREAKER_RESET_TIMEOUT_SECONDS. It then lets BREAKER_HALF_OPEN_PROBES
+  calls through; a successful probe closes it, a failed one re-opens it.
+
+An exception with a `retry_after` (seconds) is retried no sooner than
+that, e.g. a Shopify GraphQL throttle that says when enough query cost
+will have been restored.
+
+Breaker states and budget levels are published through core.metrics.
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Callable
+
+from core.config import settings
+from core.logger import get_logger
+from core.metrics import metrics
+
+logger = get_logger("resilience")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a destination whose breaker is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' is open")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float, half_open_probes: int):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self, now: float):
+        if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self._state
+
+    def before_call(self):
+        """
+        Raises CircuitOpenError if the call must not go out. Returns a probe
+        token if the call takes a half-open probe slot, else None.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._refresh(now)
+            if self._state == CLOSED:
+                return None
+            if self._state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return self._opened_at
+            retry_after = max(self.reset_timeout - (now - self._opened_at), 1.0)
+        metrics.incr("breaker_rejections_total", breaker=self.name)
+        raise CircuitOpenError(self.name, retry_after)
+
+    def release_probe(self, probe):
+        """Frees a probe slot whose call ended without a verdict (e.g. cancelled)."""
+        if probe is None:
+            return
+        with self._lock:
+            # A probe from an earlier half-open period has nothing left to free.
+            if self._state == HALF_OPEN and self._opened_at == probe and self._probes_in_flight:
+                self._probes_in_flight -= 1
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info("Circuit closed", extra={"breaker": self.name})
+            self._state = CLOSED
+            self._failures = 0
+            self._probes_in_flight = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (
+                self._state == CLOSED and self._failures >= self.failure_threshold
+            ):
+                if self._state == CLOSED:
+                    logger.warning("Circuit opened", extra={"breaker": self.name})
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probes_in_flight = 0
+
+    def snapshot(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self._failures}
+
+
+class RetryBudget:
+    """Token bucket limiting retries to a fraction of recent calls."""
+
+    def __init__(self, ratio: float, min_per_second: float, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def record_call(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return round(self._tokens, 2)
+
+
+class Destination:
+    """Breakers (one per key, e.g. shop or host) and a shared retry budget for one kind of upstream."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.budget = RetryBudget(settings.RETRY_BUDGET_RATIO, settings.RETRY_BUDGET_MIN_PER_SECOND)
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(
+                    f"{self.name}:{key}",
+                    settings.BREAKER_FAILURE_THRESHOLD,
+                    settings.BREAKER_RESET_TIMEOUT_SECONDS,
+                    settings.BREAKER_HALF_OPEN_PROBES,
+                )
+            return breaker
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {
+            "retry_budget_tokens": self.budget.tokens,
+            "breakers": {key: b.snapshot() for key, b in breakers.items()},
+        }
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for retry number `attempt` (0-based)."""
+    cap = min(settings.RETRY_MAX_DELAY_SECONDS, settings.RETRY_BASE_DELAY_SECONDS * 2 ** attempt)
+    return random.uniform(0, cap)
+
+
+def retry_delay(e: Exception, attempt: int) -> float:
+    """The backoff for retry number `attempt`, or longer if `e` says when to retry."""
+    return max(backoff_delay(attempt), getattr(e, "retry_after", None) or 0)
+
+
+def call_with_retries(
+    destination: Destination,
+    key: str,
+    fn: Callable,
+    max_retries: int,
+    is_failure: Callable[[Exception], bool],
+    is_retryable: Callable[[Exception], bool] = None,
+):
+    """
+    Calls `fn()` behind `key`'s breaker. Exceptions for which `is_failure`
+    is true count against the breaker; those that are also retryable are
+    retried while attempts and the retry budget last.
+    """
+    is_retryable = is_retryable or is_failure
+    breaker = destination.breaker(key)
+    destination.budget.record_call()
+    attempt = 0
+    while True:
+        probe = breaker.before_call()
+        try:
+            result = fn()
+        except Exception as e:
+            if is_failure(e):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if attempt >= max_retries or not is_retryable(e) or not destination.budget.try_spend():
+                raise
+            metrics.incr("retries_total", destination=destination.name)
+            time.sleep(retry_delay(e, attempt))
+            attempt += 1
+            continue
+        except BaseException:
+            breaker.release_probe(probe)
+            raise
+        breaker.record_success()
+        return result
+
+
+async def acall_with_retries(
+    destination: Destination,
+    key: str,
+    fn: Callable,
+    max_retries: int,
+    is_failure: Callable[[Exception], bool],
+    is_retryable: Callable[[Exception], bool] = None,
+):
+    """`call_with_retries` for a coroutine function."""
+    is_retryable = is_retryable or is_failure
+    breaker = destination.breaker(key)
+    destination.budget.record_call()
+    attempt = 0
+    while True:
+        probe = breaker.before_call()
+        try:
+            result = await fn()
+        except Exception as e:
+            if is_failure(e):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if attempt >= max_retries or not is_retryable(e) or not destination.budget.try_spend():
+                raise
+            metrics.incr("retries_total", destination=destination.name)
+            await asyncio.sleep(retry_delay(e, attempt))
+            attempt += 1
+            continue
+        except BaseException:
+            breaker.release_probe(probe)
+            raise
+        breaker.record_success()
+        return result
+
+
+shopify_destination = Destination("shopify")
+reco_destination = Destination("reco")
+
+metrics.register_collector(
+    "circuit_breakers",
+    lambda: {d.name: d.snapshot() for d in (shopify_destination, reco_destination)},
+)
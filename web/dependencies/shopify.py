@@ -1,7 +1,10 @@
-from fastapi import Depends, HTTPException, Request
+from fastapi import Depends, HTTPException
 from models import ShopifyAPIClient
-from services.shopify_auth_service import get_shop_access_token, verify_hmac_signature
-from typing import Optional
+from services.shopify_auth_service import (
+    get_shop_access_token,
+    verify_hmac_signature,
+    verify_shopify_request,
+)
 
 
 async def get_shopify_client(
@@ -18,28 +21,14 @@ async def get_shopify_client(
     return ShopifyAPIClient(shop_url=shop, access_token=access_token)
 
 
-async def get_shopify_client_from_query(request: Request) -> ShopifyAPIClient:
-    """Dependency that returns an authenticated ShopifyAPIClient instance
-    from either query params (GET) or JSON body (POST/PUT)."""
-
-    shop: Optional[str] = request.query_params.get("shop")
-
-    # If not found in query params, try JSON body
-    if not shop and request.method in ("POST", "PUT", "PATCH"):
-        try:
-            body = await request.json()
-            shop = body.get("shop")
-        except Exception:
-            shop = None
-
-    if not shop:
-        raise HTTPException(status_code=400, detail="Missing 'shop' parameter")
-
+async def get_shopify_client_from_session(
+    session: dict = Depends(verify_shopify_request),
+) -> ShopifyAPIClient:
+    """Dependency that returns an authenticated ShopifyAPIClient instance for a
+    request carrying a verified App Bridge session token."""
+    shop = session["shop"]
     access_token = get_shop_access_token(shop)
-
     if not access_token:
         raise HTTPException(status_code=401, detail="No access token found for shop")
 
     return ShopifyAPIClient(shop_url=shop, access_token=access_token)
-
-
@@ -6,9 +6,23 @@ from models.database import create_db_and_tables, create_folders, remove_shopify
 from services.shopify_auth_service import (
     verify_hmac_signature,
     get_shop_access_token,
-    get_shop_api_key,
 )
-from routers import auth_router, sync_router, api_router
+from routers import (
+    auth_router,
+    sync_router,
+    api_router,
+    jobs_router,
+    metrics_router,
+    admin_router,
+    webhooks_router,
+)
+from services.job_service import shutdown_jobs
+from services.bulk_poller_service import bulk_poller
+from services.webhook_service import webhook_spool
+from services.reco_proxy_service import close_http_client
+from core.compression import CompressionMiddleware
+from core.config import settings
+from core.logger import setup_logging, shutdown_logging
 
 app = FastAPI(title="Couture Search Shopify App")
 
@@ -17,16 +31,31 @@ app = FastAPI(title="Couture Search Shopify App")
 @app.on_event("startup")
 def on_startup():
     """Initialize database tables on startup"""
-    remove_shopify_db()
+    setup_logging()
+    if settings.DEV_RESET_DATABASE:
+        remove_shopify_db()
     create_db_and_tables()
     create_folders(folders=["downloads", "tokens"])
+    bulk_poller.start()
+    webhook_spool.start()
 
 
 # remove the shopify db on closing the application
 @app.on_event("shutdown")
 def on_shutdown():
     """Cleanup actions on shutdown"""
-    remove_shopify_db()
+    bulk_poller.stop()
+    webhook_spool.stop()
+    shutdown_jobs()
+    if settings.DEV_RESET_DATABASE:
+        remove_shopify_db()
+    shutdown_logging()
+
+
+@app.on_event("shutdown")
+async def close_proxy_client():
+    """Closes the pooled reco proxy connections."""
+    await close_http_client()
 
 
 # CORS Configuration
@@ -43,6 +72,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
 
 # Template Configuration
 templates = Jinja2Templates(directory="templates")
@@ -54,6 +84,14 @@ app.include_router(sync_router, tags=["Synchronization"])
 
 app.include_router(api_router, tags=["API"])
 
+app.include_router(jobs_router, tags=["Jobs"])
+
+app.include_router(metrics_router, tags=["Metrics"])
+
+app.include_router(admin_router, tags=["Admin"])
+
+app.include_router(webhooks_router, tags=["Webhooks"])
+
 
 @app.get("/")
 async def root():
@@ -65,7 +103,6 @@ async def root():
 def admin_dashboard(
     request: Request,
     shop: str = Depends(verify_hmac_signature),
-    api_key: str = Depends(get_shop_api_key),
 ):
     """Serves the main admin dashboard UI for the app, protected by HMAC verification."""
     if not shop:
@@ -79,5 +116,5 @@ def admin_dashboard(
 
     return templates.TemplateResponse(
         "admin_dashboard.html",
-        {"request": request, "api_key": api_key},
+        {"request": request, "client_id": settings.SHOPIFY_APP_KEY},
     )
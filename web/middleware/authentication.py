@@ -1,15 +1,26 @@
-from fastapi import Header, HTTPException
+import hmac
+
+from fastapi import Header, HTTPException, Request
+from core.logger import get_logger
+from services.shopify_auth_service import get_shop_api_key
+
+logger = get_logger("auth")
 
 
 def validate_shopify_incoming_request(
-    x_api_key: str = Header(...), x_store_identifier: str = Header(...)
+    request: Request, x_api_key: str = Header(...), x_store_identifier: str = Header(...)
 ):
-    print(f"API_KEY: {x_api_key} | STORE: {x_store_identifier}")
+    logger.debug("Incoming storefront request", extra={"store": x_store_identifier})
     if not x_api_key or not x_store_identifier:
         raise HTTPException(status_code=400, detail="Missing headers")
 
     if "COUTURE" not in x_api_key or "myshopify.com" not in x_store_identifier:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+    # Checked here, before anything is served from a cache, not left to upstream.
+    expected = get_shop_api_key(request, x_store_identifier)
+    if not expected or not hmac.compare_digest(x_api_key.encode(), expected.encode()):
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
     # If everything is good, just return True (or nothing)
     return True
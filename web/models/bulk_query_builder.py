@@ -0,0 +1,192 @@
+# models/bulk_query_builder.py
+"""
+Builds Shopify bulk export queries from field profiles.
+
+A field spec is a list whose items are either a field name or a dict:
+
+    {"field": "variants", "connection": True, "fields": [...]}   # edges { node { ... } }
+    {"field": "lineItems", "connection": True, "args": "first: 250", "fields": [...]}
+    {"field": "totalPriceSet", "fields": [...]}                  # plain object
+
+A profile maps each export ("products", "orders") to a field spec. Shops
+pick a preset by name or store their own profile as JSON.
+"""
+import json
+import re
+
+_NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_ARGS_RE = re.compile(r"^[A-Za-z0-9_:\s,<>=.\-]*$")
+
+
+def connection(field: str, fields: list, args: str = None) -> dict:
+    spec = {"field": field, "connection": True, "fields": fields}
+    if args:
+        spec["args"] = args
+    return spec
+
+
+def obj(field: str, fields: list) -> dict:
+    return {"field": field, "fields": fields}
+
+
+MONEY = [obj("shopMoney", ["amount", "currencyCode"])]
+
+PRESETS = {
+    "full": {
+        "products": [
+            "id",
+            "title",
+            "handle",
+            "descriptionHtml",
+            "productType",
+            "vendor",
+            "tags",
+            "status",
+            connection("variants", ["id", "title", "sku", "inventoryQuantity", "price"]),
+            connection("images", ["originalSrc", "altText"]),
+        ],
+        "orders": [
+            "id",
+            "name",
+            "createdAt",
+            "updatedAt",
+            "currencyCode",
+            obj("totalPriceSet", MONEY),
+            connection(
+                "lineItems",
+                [
+                    "id",
+                    "title",
+                    "quantity",
+                    obj("discountedTotalSet", MONEY),
+                    obj("product", ["id", "title"]),
+                    obj("variant", ["id", "title", "sku"]),
+                ],
+                args="first: 250",
+            ),
+        ],
+    },
+    # Only what search and recommendations read: no HTML, images or money.
+    "reco-minimal": {
+        "products": [
+            "id",
+            "title",
+            "handle",
+            "productType",
+            "vendor",
+            "tags",
+            "status",
+        ],
+        "orders": [
+            "id",
+            "createdAt",
+            "updatedAt",
+            connection("lineItems", ["quantity", obj("product", ["id"])], args="first: 250"),
+        ],
+    },
+}
+
+DEFAULT_PROFILE = "full"
+
+
+class FieldProfileError(ValueError):
+    """Raised for an unknown preset or a malformed custom field spec."""
+
+
+def _validate(fields: list, path: str = ""):
+    if not isinstance(fields, list) or not fields:
+        raise FieldProfileError(f"Expected a non-empty field list at '{path or 'root'}'")
+    for item in fields:
+        name = item if isinstance(item, str) else (item or {}).get("field")
+        if not isinstance(name, str) or not _NAME_RE.match(name):
+            raise FieldProfileError(f"Invalid field name {name!r} at '{path or 'root'}'")
+        if isinstance(item, dict):
+            if not _ARGS_RE.match(item.get("args", "")):
+                raise FieldProfileError(f"Invalid arguments for '{path}{name}'")
+            _validate(item.get("fields"), f"{path}{name}.")
+
+
+def resolve_profile(profile: str | dict | None) -> dict:
+    """
+    Turns a preset name, a JSON string or a profile dict into a validated
+    profile. Exports missing from a custom profile fall back to "full", and
+    products always include `id`, which rows are keyed and parented on.
+    """
+    if profile is None or profile == "":
+        profile = DEFAULT_PROFILE
+    if isinstance(profile, str):
+        if profile in PRESETS:
+            return PRESETS[profile]
+        try:
+            profile = json.loads(profile)
+        except ValueError:
+            raise FieldProfileError(f"Unknown field profile '{profile}'")
+    if not isinstance(profile, dict):
+        raise FieldProfileError("A field profile must be a preset name or an object")
+
+    resolved = dict(PRESETS[DEFAULT_PROFILE])
+    for export, fields in profile.items():
+        if export not in resolved:
+            raise FieldProfileError(f"Unknown export '{export}'")
+        _validate(fields)
+        if export == "products" and "id" not in fields:
+            fields = ["id"] + fields
+        resolved[export] = fields
+    return resolved
+
+
+def build_selection(fields: list, indent: int = 0) -> str:
+    pad = "  " * indent
+    lines = []
+    for item in fields:
+        if isinstance(item, str):
+            lines.append(f"{pad}{item}")
+            continue
+        name = item["field"]
+        if item.get("args"):
+            name = f"{name}({item['args']})"
+        inner = build_selection(item["fields"], indent + (3 if item.get("connection") else 1))
+        if item.get("connection"):
+            lines.append(
+                f"{pad}{name} {{\n{pad}  edges {{\n{pad}    node {{\n{inner}\n"
+                f"{pad}    }}\n{pad}  }}\n{pad}}}"
+            )
+        else:
+            lines.append(f"{pad}{name} {{\n{inner}\n{pad}}}")
+    return "\n".join(lines)
+
+
+def build_bulk_query(root: str, fields: list, search: str = None) -> str:
+    """
+    The inner query for a bulk export of `root` (e.g. "products"). `search`
+    is passed as the connection's `query:` filter, e.g. "updated_at:>='...'".
+    """
+    if search:
+        root = f'{root}(query: "{search}")'
+    return (
+        f"{{\n  {root} {{\n    edges {{\n      node {{\n"
+        f"{build_selection(fields, indent=4)}\n"
+        f"      }}\n    }}\n  }}\n}}"
+    )
+
+
+def build_bulk_mutation(inner_query: str) -> str:
+    """Wraps an inner query in a bulkOperationRunQuery mutation."""
+    return f'''
+        mutation {{
+          bulkOperationRunQuery(
+            query: """
+{inner_query}
+            """
+          ) {{
+            bulkOperation {{
+              id
+              status
+            }}
+            userErrors {{
+              field
+              message
+            }}
+          }}
+        }}
+        '''
@@ -1,13 +1,21 @@
 # web/models/database.py
-from sqlalchemy import create_engine, Column, Integer, String
+from sqlalchemy import create_engine, Column, Integer, Float, String, Text, DateTime
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from core.config import settings
+from core.logger import get_logger
 import os
 
 engine = create_engine(settings.DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+# The sync ledger has its own database, so it outlives a reset of the main one.
+ledger_engine = create_engine(
+    settings.SYNC_LEDGER_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+LedgerSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=ledger_engine)
+LedgerBase = declarative_base()
+logger = get_logger("db")
 
 
 class Store(Base):
@@ -16,6 +24,67 @@ class Store(Base):
     id = Column(Integer, primary_key=True, index=True)
     shop_url = Column(String, unique=True, index=True, nullable=False)
     access_token = Column(String, nullable=False)
+    # Preset name or JSON field spec for bulk exports (models.bulk_query_builder)
+    field_profile = Column(Text, nullable=True)
+
+
+class SyncWatermark(Base):
+    """High-water marks of the last synced records for incremental syncs."""
+
+    __tablename__ = "sync_watermarks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    shop_url = Column(String, index=True, nullable=False)
+    resource = Column(String, nullable=False)
+    created_at = Column(String, nullable=True)
+    updated_at = Column(String, nullable=True)
+
+
+class Job(Base):
+    """A unit of background work (sync, install setup) and its outcome."""
+
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    shop_url = Column(String, index=True, nullable=False)
+    status = Column(String, nullable=False, default="queued")
+    message = Column(String, nullable=True)
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class SyncLedgerEntry(LedgerBase):
+    """
+    One bulk sync's outcome with per-phase timings (milliseconds) and sizes,
+    kept for every sync so performance can be tracked over time.
+    """
+
+    __tablename__ = "sync_ledger"
+
+    id = Column(Integer, primary_key=True, index=True)
+    shop_url = Column(String, index=True, nullable=False)
+    kind = Column(String, index=True, nullable=False)  # "products" or "orders"
+    operation_id = Column(String, index=True, nullable=True)
+    status = Column(String, nullable=False, default="processing")
+    error = Column(Text, nullable=True)
+    triggered_at = Column(DateTime, index=True, nullable=False)
+    completed_at = Column(DateTime, nullable=True)
+    # Phases: starting the bulk query, Shopify running it, downloading and
+    # parsing the result, and storing it locally (snapshot, files, indexes).
+    trigger_ms = Column(Float, nullable=True)
+    shopify_ms = Column(Float, nullable=True)
+    download_ms = Column(Float, nullable=True)
+    parse_ms = Column(Float, nullable=True)
+    store_ms = Column(Float, nullable=True)
+    total_ms = Column(Float, nullable=True)
+    object_count = Column(Integer, nullable=True)
+    file_size = Column(Integer, nullable=True)
+    bytes_downloaded = Column(Integer, nullable=True)
+    records = Column(Integer, nullable=True)
 
 
 def create_db_and_tables():
@@ -23,8 +92,9 @@ def create_db_and_tables():
     Creates the database and all tables defined.
     This is called once on application startup.
     """
-    print("[DEBUG] Initializing database and creating tables if they don't exist...")
+    logger.info("Initializing database and creating tables if they don't exist")
     Base.metadata.create_all(bind=engine)
+    LedgerBase.metadata.create_all(bind=ledger_engine)
 
 
 def create_folders(folders=[]):
@@ -34,9 +104,9 @@ def create_folders(folders=[]):
     for folder in folders:
         try:
             os.makedirs(folder, exist_ok=True)
-            print(f"Created or already exists: {folder}")
+            logger.debug("Created or already exists", extra={"folder": folder})
         except Exception as e:
-            print(f"Failed to create {folder}: {e}")
+            logger.error("Failed to create folder", extra={"folder": folder, "error": str(e)})
 
 
 def remove_shopify_db():
@@ -47,6 +117,6 @@ def remove_shopify_db():
     db_path = settings.DATABASE_URL.replace("sqlite:///", "")
     if os.path.exists(db_path):
         os.remove(db_path)
-        print(f"Removed database file at {db_path}")
+        logger.info("Removed database file", extra={"db_path": db_path})
     else:
-        print(f"No database file found at {db_path} to remove.")
+        logger.info("No database file to remove", extra={"db_path": db_path})
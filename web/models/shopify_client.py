@@ -2,6 +2,72 @@ import requests
 import json
 import datetime
 from datetime import timezone
+from core.config import settings
+from core.logger import get_logger
+from core.resilience import call_with_retries, shopify_destination
+from models.bulk_query_builder import (
+    build_bulk_mutation,
+    build_bulk_query,
+    resolve_profile,
+)
+
+logger = get_logger("shopify_client")
+
+
+class ShopifyThrottledError(Exception):
+    """
+    A GraphQL request rejected by the shop's query cost limit. Shopify
+    answers these with HTTP 200 and a THROTTLED error; nothing was run.
+    """
+
+    def __init__(self, retry_after: float):
+        super().__init__("Shopify GraphQL request was throttled")
+        self.retry_after = retry_after
+
+
+def _throttle_delay(body: dict) -> float:
+    """Seconds until the throttled query's cost will have been restored."""
+    cost = (body.get("extensions") or {}).get("cost") or {}
+    throttle = cost.get("throttleStatus") or {}
+    try:
+        needed = float(cost["requestedQueryCost"]) - float(throttle["currentlyAvailable"])
+        delay = needed / float(throttle["restoreRate"])
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        delay = settings.RETRY_MAX_DELAY_SECONDS
+    return min(max(delay, 0.0), settings.SHOPIFY_THROTTLE_MAX_WAIT_SECONDS)
+
+
+def _raise_if_throttled(body: dict):
+    errors = body.get("errors")
+    if not isinstance(errors, list):
+        return
+    for error in errors:
+        if ((error or {}).get("extensions") or {}).get("code") == "THROTTLED":
+            raise ShopifyThrottledError(_throttle_delay(body))
+
+
+def _status(e: Exception) -> int | None:
+    response = getattr(e, "response", None)
+    return response.status_code if response is not None else None
+
+
+def _is_shop_failure(e: Exception) -> bool:
+    """Errors that say the shop's API is unhealthy (they trip its breaker)."""
+    if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+        return True
+    return isinstance(e, requests.HTTPError) and (_status(e) or 0) >= 500
+
+
+def _is_throttled(e: Exception) -> bool:
+    return isinstance(e, ShopifyThrottledError) or _status(e) == 429
+
+
+def _is_unsent_or_throttled(e: Exception) -> bool:
+    return isinstance(e, requests.ConnectTimeout) or _is_throttled(e)
+
+
+def _is_retryable(e: Exception) -> bool:
+    return _is_shop_failure(e) or _is_throttled(e)
 
 
 class ShopifyAPIClient:
@@ -12,8 +78,9 @@ class ShopifyAPIClient:
     def __init__(self, shop_url: str, access_token: str):
         self.shop_url = shop_url
         self.api_version = "2025-04"
+        admin_url = settings.SHOPIFY_ADMIN_URL.format(shop=shop_url)
         self.graphql_endpoint = (
-            f"https://{shop_url}/admin/api/{self.api_version}/graphql.json"
+            f"{admin_url}/admin/api/{self.api_version}/graphql.json"
         )
         self.headers = {
             "Content-Type": "application/json",
@@ -26,11 +93,31 @@ class ShopifyAPIClient:
         if variables:
             payload["variables"] = variables
 
-        response = requests.post(
-            self.graphql_endpoint, json=payload, headers=self.headers
+        def send():
+            response = requests.post(
+                self.graphql_endpoint,
+                json=payload,
+                headers=self.headers,
+                timeout=(
+                    settings.SHOPIFY_CONNECT_TIMEOUT_SECONDS,
+                    settings.SHOPIFY_READ_TIMEOUT_SECONDS,
+                ),
+            )
+            response.raise_for_status()
+            body = response.json()
+            _raise_if_throttled(body)
+            return body
+
+        # A mutation that may have reached Shopify is not safe to repeat.
+        is_mutation = query.lstrip().startswith("mutation")
+        return call_with_retries(
+            shopify_destination,
+            self.shop_url,
+            send,
+            max_retries=settings.SHOPIFY_MAX_RETRIES,
+            is_failure=_is_shop_failure,
+            is_retryable=_is_unsent_or_throttled if is_mutation else _is_retryable,
         )
-        response.raise_for_status()
-        return response.json()
 
     def get_bulk_operation_status(self) -> dict:
         """Fetches the status of the current or most recent bulk operation."""
@@ -167,132 +254,36 @@ class ShopifyAPIClient:
         variables = {"metafields": [metafield_input]}
         self._execute_query(mutation, variables)
 
-    def fetch_all_products(self) -> dict:
+    def fetch_all_products(self, profile: str | dict | None = None) -> dict:
         """
         Initiates a bulk query to fetch all products and their variants.
+        `profile` selects the exported fields (see models.bulk_query_builder).
         """
-        bulk_query = """
-        mutation {
-          bulkOperationRunQuery(
-            query: \"""
-            {
-              products {
-                edges {
-                  node {
-                    id
-                    title
-                    handle
-                    descriptionHtml
-                    productType
-                    vendor
-                    tags
-                    status
-                    variants {
-                      edges {
-                        node {
-                          id
-                          title
-                          sku
-                          inventoryQuantity
-                          price
-                        }
-                      }
-                    }
-                    images {
-                      edges {
-                        node {
-                          originalSrc
-                          altText
-                        }
-                      }
-                    }
-                  }
-                }
-              }
-            }
-            \"""
-          ) {
-            bulkOperation {
-              id
-              status
-            }
-            userErrors {
-              field
-              message
-            }
-          }
-        }
-        """
+        fields = resolve_profile(profile)["products"]
+        bulk_query = build_bulk_mutation(build_bulk_query("products", fields))
         response = self._execute_query(bulk_query)
-        # print(response)
         return response.get("data", {}).get("bulkOperationRunQuery", {})
 
-    def fetch_all_orders_information(self) -> dict:
+    def fetch_all_orders_information(
+        self, profile: str | dict | None = None, updated_since: str | None = None
+    ) -> dict:
         """
-        Fetch all the orders information
+        Fetch all the orders information, or only orders created or updated
+        at or after `updated_since` (ISO timestamp) for an incremental sync.
+        `profile` selects the exported fields (see models.bulk_query_builder).
         """
-        bulk_query = """
-        mutation {
-          bulkOperationRunQuery(
-            query: \"""
-            {
-              orders {
-                edges {
-                  node {
-                    id
-                    name
-                    createdAt
-                    currencyCode
-                    totalPriceSet {
-                      shopMoney {
-                        amount
-                        currencyCode
-                      }
-                    }
-                    lineItems(first: 250) {
-                      edges {
-                        node {
-                          id
-                          title
-                          quantity
-                          discountedTotalSet {
-                            shopMoney {
-                              amount
-                              currencyCode
-                            }
-                          }
-                          product {
-                            id
-                            title
-                          }
-                          variant {
-                            id
-                            title
-                            sku
-                          }
-                        }
-                      }
-                    }
-                  }
-                }
-              }
-            }
-            \"""
-          ) {
-            bulkOperation {
-              id
-              status
-            }
-            userErrors {
-              field
-              message
-            }
-          }
-        }
-"""
-        print("Order sync started")
+        fields = resolve_profile(profile)["orders"]
+        # Incremental syncs key partitions and watermarks on these fields.
+        for required in ("id", "createdAt", "updatedAt"):
+            if required not in fields:
+                fields = [required] + fields
+        search = f"updated_at:>='{updated_since}'" if updated_since else None
+        bulk_query = build_bulk_mutation(build_bulk_query("orders", fields, search))
+        logger.info(
+            "Order bulk export requested",
+            extra={"shop": self.shop_url, "updated_since": updated_since},
+        )
         response = self._execute_query(bulk_query)
-        # print(response)
         return response.get("data", {}).get("bulkOperationRunQuery", {})
 
     # --- METAOBJECT METHODS ---
@@ -302,7 +293,7 @@ class ShopifyAPIClient:
         Checks if our custom metaobject definition exists. If not, creates it.
         Returns the ID of the definition.
         """
-        print("[DEBUG] Checking for existing Metaobject Definition...")
+        logger.debug("Checking for existing metaobject definition")
         find_query = """
             query {
                 metaobjectDefinitionByType(type: "couture_product_carousel") {
@@ -314,10 +305,12 @@ class ShopifyAPIClient:
         existing_definition = response.get("data", {}).get("metaobjectDefinitionByType")
 
         if existing_definition and existing_definition.get("id"):
-            print(f"[DEBUG] Found existing definition: {existing_definition['id']}")
+            logger.debug(
+                "Found existing definition", extra={"definition": existing_definition["id"]}
+            )
             return existing_definition["id"]
 
-        print("[DEBUG] No existing definition found. Creating a new one...")
+        logger.info("No existing definition found, creating one", extra={"shop": self.shop_url})
         create_mutation = """
             mutation createMetaobjectDefinition($definition: MetaobjectDefinitionCreateInput!) {
                 metaobjectDefinitionCreate(definition: $definition) {
@@ -352,7 +345,7 @@ class ShopifyAPIClient:
             }
         }
         response = self._execute_query(create_mutation, variables)
-        print(response)
+        logger.debug("Definition create response", extra={"response": response})
         new_definition = (
             response.get("data", {})
             .get("metaobjectDefinitionCreate", {})
@@ -360,8 +353,8 @@ class ShopifyAPIClient:
         )
 
         if new_definition and new_definition.get("id"):
-            print(
-                f"[DEBUG] Successfully created new definition: {new_definition['id']}"
+            logger.info(
+                "Created metaobject definition", extra={"definition": new_definition["id"]}
             )
             return new_definition["id"]
         else:
@@ -372,14 +365,82 @@ class ShopifyAPIClient:
             )
             raise Exception(f"Could not create metaobject definition: {errors}")
 
-    # In web/models/shopify_client.py
+    @staticmethod
+    def carousel_fields(reco_data: dict) -> tuple:
+        """The metaobject handle and field values for a reco carousel config."""
+        handle = reco_data["banner_name"].lower().replace(" ", "-")
+        fields = {
+            "name": reco_data.get("banner_name"),
+            "caption": reco_data.get("caption"),
+            "endpoint": reco_data.get("endpoint"),
+            "enabled_default": str(reco_data.get("enabled", False)).lower(),
+        }
+        return handle, fields
+
+    def list_metaobjects(self, metaobject_type: str, page_size: int = 250) -> list:
+        """
+        Fetches every metaobject of `metaobject_type`, following pagination.
+        Returns [{"id", "handle", "fields": {key: value}}].
+        """
+        query = """
+        query($type: String!, $first: Int!, $after: String) {
+            metaobjects(type: $type, first: $first, after: $after) {
+                edges {
+                    node {
+                        id
+                        handle
+                        fields { key value }
+                    }
+                }
+                pageInfo { hasNextPage endCursor }
+            }
+        }
+        """
+        metaobjects, after = [], None
+        while True:
+            variables = {"type": metaobject_type, "first": page_size, "after": after}
+            response = self._execute_query(query, variables)
+            page = (response.get("data") or {}).get("metaobjects")
+            if page is None:
+                raise Exception(f"Failed to list metaobjects: {response.get('errors')}")
+            for edge in page.get("edges") or []:
+                node = edge["node"]
+                metaobjects.append({
+                    "id": node["id"],
+                    "handle": node["handle"],
+                    "fields": {f["key"]: f["value"] for f in node.get("fields") or []},
+                })
+            page_info = page.get("pageInfo") or {}
+            if not page_info.get("hasNextPage"):
+                return metaobjects
+            after = page_info.get("endCursor")
+
+    def delete_metaobject(self, metaobject_id: str) -> bool:
+        """Deletes a metaobject. Returns True if Shopify reports it deleted."""
+        mutation = """
+        mutation($id: ID!) {
+            metaobjectDelete(id: $id) {
+                deletedId
+                userErrors { field message }
+            }
+        }
+        """
+        response = self._execute_query(mutation, {"id": metaobject_id})
+        result = (response.get("data") or {}).get("metaobjectDelete") or {}
+        if result.get("userErrors") or not result.get("deletedId"):
+            logger.error(
+                "Failed to delete metaobject",
+                extra={"metaobject_id": metaobject_id, "errors": result.get("userErrors")},
+            )
+            return False
+        return True
 
     def upsert_metaobject(self, definition_id: str, reco_data: dict) -> str:
         """
         Creates or updates a Metaobject entry for a specific product carousel.
         """
-        handle = reco_data["banner_name"].lower().replace(" ", "-")
-        print(f"[DEBUG] Upserting metaobject for handle: {handle}")
+        handle, fields = self.carousel_fields(reco_data)
+        logger.debug("Upserting metaobject", extra={"handle": handle})
 
         mutation = """
             mutation metaobjectUpsert($handle: MetaobjectHandleInput!, $metaobject: MetaobjectUpsertInput!) {
@@ -399,15 +460,7 @@ class ShopifyAPIClient:
         variables = {
             "handle": {"type": "couture_product_carousel", "handle": handle},
             "metaobject": {
-                "fields": [
-                    {"key": "name", "value": reco_data.get("banner_name")},
-                    {"key": "caption", "value": reco_data.get("caption")},
-                    {"key": "endpoint", "value": reco_data.get("endpoint")},
-                    {
-                        "key": "enabled_default",
-                        "value": str(reco_data.get("enabled", False)).lower(),
-                    },
-                ]
+                "fields": [{"key": key, "value": value} for key, value in fields.items()]
             },
         }
 
@@ -417,7 +470,7 @@ class ShopifyAPIClient:
 
         # Check if the API call itself had top-level errors
         if "errors" in response:
-            print(f"[ERROR] GraphQL query failed: {response['errors']}")
+            logger.error("GraphQL query failed", extra={"errors": response["errors"]})
             return "failed"
 
         upsert_data = response.get("data", {}).get("metaobjectUpsert", {})
@@ -426,7 +479,9 @@ class ShopifyAPIClient:
             return "updated"
         else:
             errors = upsert_data.get("userErrors", [])
-            print(f"[ERROR] Failed to upsert metaobject '{handle}': {errors}")
+            logger.error(
+                "Failed to upsert metaobject", extra={"handle": handle, "errors": errors}
+            )
             return "failed"
 
     def delete_metafield(self, metafield: dict):
@@ -460,7 +515,7 @@ class ShopifyAPIClient:
         }
 
         response = self._execute_query(mutation, variables)
-        print("Shopify API response:", response)
+        logger.debug("Metafield delete response", extra={"response": response})
 
         errors = (
             response.get("data", {}).get("metafieldsDelete", {}).get("userErrors", [])
@@ -492,12 +547,119 @@ class ShopifyAPIClient:
         # Extract just the string handles from the response
         return [scope["handle"] for scope in scopes]
 
+    def ensure_webhook_subscriptions(self, callback_base: str, topics: dict) -> list:
+        """
+        Subscribes the app to webhook `topics` (GraphQL topic enum -> path
+        under `callback_base`), skipping subscriptions that already exist.
+        Returns the topics subscribed by this call.
+        """
+        query = """
+        query {
+            webhookSubscriptions(first: 100) {
+                edges {
+                    node {
+                        topic
+                        endpoint {
+                            __typename
+                            ... on WebhookHttpEndpoint { callbackUrl }
+                        }
+                    }
+                }
+            }
+        }
+        """
+        response = self._execute_query(query)
+        edges = ((response.get("data") or {}).get("webhookSubscriptions") or {}).get("edges") or []
+        existing = {
+            (edge["node"]["topic"], (edge["node"].get("endpoint") or {}).get("callbackUrl"))
+            for edge in edges
+        }
+
+        mutation = """
+        mutation($topic: WebhookSubscriptionTopic!, $webhookSubscription: WebhookSubscriptionInput!) {
+            webhookSubscriptionCreate(topic: $topic, webhookSubscription: $webhookSubscription) {
+                webhookSubscription { id }
+                userErrors { field message }
+            }
+        }
+        """
+        created = []
+        for topic, path in topics.items():
+            callback_url = f"{callback_base}/{path}"
+            if (topic, callback_url) in existing:
+                continue
+            variables = {
+                "topic": topic,
+                "webhookSubscription": {"callbackUrl": callback_url, "format": "JSON"},
+            }
+            response = self._execute_query(mutation, variables)
+            result = (response.get("data") or {}).get("webhookSubscriptionCreate") or {}
+            if result.get("userErrors"):
+                raise Exception(f"Failed to subscribe to {topic}: {result['userErrors']}")
+            created.append(topic)
+        logger.info("Webhook subscriptions ensured", extra={"shop": self.shop_url, "topics": created})
+        return created
+
+    def get_dashboard_state(
+        self, history_keys: dict, include_bulk_status: bool = True
+    ) -> dict:
+        """
+        Fetches the access scopes, the current bulk operation and several
+        sync history metafields in one aliased query, instead of a request
+        each. `history_keys` maps an alias to a couture_app metafield key.
+        Returns {"scopes", "bulk_operation", "histories": {alias: value}}.
+        """
+        metafields = "\n".join(
+            f'{alias}: metafield(namespace: "couture_app", key: {json.dumps(key)}) {{ value }}'
+            for alias, key in history_keys.items()
+        )
+        bulk_operation = """
+            currentBulkOperation {
+                id
+                query
+                status
+                errorCode
+                createdAt
+                completedAt
+                objectCount
+                fileSize
+                url
+            }
+        """ if include_bulk_status else ""
+        query = f"""
+        query DashboardState {{
+            appInstallation {{
+                accessScopes {{
+                    handle
+                }}
+            }}
+            {bulk_operation}
+            shop {{
+                {metafields}
+            }}
+        }}
+        """
+        response = self._execute_query(query)
+        data = response.get("data")
+        if not data:
+            raise Exception(f"Dashboard state query failed: {response.get('errors')}")
+
+        scopes = (data.get("appInstallation") or {}).get("accessScopes") or []
+        shop = data.get("shop") or {}
+        return {
+            "scopes": [scope["handle"] for scope in scopes],
+            "bulk_operation": data.get("currentBulkOperation"),
+            "histories": {
+                alias: (shop.get(alias) or {}).get("value") for alias in history_keys
+            },
+        }
+
     def ensure_api_key_definition(self) -> str:
         """
         Checks if the API Key metaobject definition exists. If not, creates it.
         Returns the ID of the definition.
         """
-        print("[DEBUG] Checking for API Key Metaobject Definition...")
+        logger.debug("Checking for API key metaobject definition")
 
         # 1. Check if the definition already exists
         find_query = """
@@ -513,13 +675,14 @@ class ShopifyAPIClient:
         existing_definition = response.get("data", {}).get("metaobjectDefinitionByType")
 
         if existing_definition and existing_definition.get("id"):
-            print(
-                f"[DEBUG] Found existing API Key definition: {existing_definition['id']}"
+            logger.debug(
+                "Found existing API key definition",
+                extra={"definition": existing_definition["id"]},
             )
             return existing_definition["id"]
 
         # 2. If it doesn't exist, create it
-        print("[DEBUG] No API Key definition found. Creating a new one...")
+        logger.info("No API key definition found, creating one", extra={"shop": self.shop_url})
         create_mutation = """
             mutation createMetaobjectDefinition($definition: MetaobjectDefinitionCreateInput!) {
                 metaobjectDefinitionCreate(definition: $definition) {
@@ -560,8 +723,8 @@ class ShopifyAPIClient:
 
         new_definition = create_data.get("metaobjectDefinition")
         if new_definition and new_definition.get("id"):
-            print(
-                f"[DEBUG] Successfully created new API Key definition: {new_definition['id']}"
+            logger.info(
+                "Created API key definition", extra={"definition": new_definition["id"]}
             )
             return new_definition["id"]
         else:
@@ -577,7 +740,7 @@ class ShopifyAPIClient:
         Prerequisite: A metaobject definition with the type 'api_key_storage'
         must exist in the Shopify Partner Dashboard.
         """
-        print("[DEBUG] Attempting to create API_KEY metaobject...")
+        logger.debug("Attempting to create API key metaobject", extra={"shop": self.shop_url})
 
         self.ensure_api_key_definition()
 
@@ -613,7 +776,7 @@ class ShopifyAPIClient:
         # Check for top-level GraphQL errors (e.g., syntax errors in the query)
         if "errors" in response:
             error_detail = response["errors"]
-            print(f"[ERROR] GraphQL query failed: {error_detail}")
+            logger.error("GraphQL query failed", extra={"errors": error_detail})
             raise Exception(f"GraphQL query failed: {error_detail}")
 
         # Check for specific user errors returned by the mutation
@@ -622,18 +785,19 @@ class ShopifyAPIClient:
 
         if user_errors:
             error_messages = [e["message"] for e in user_errors]
-            print(f"[ERROR] Failed to create metaobject: {error_messages}")
+            logger.error("Failed to create metaobject", extra={"errors": error_messages})
             raise Exception(f"Failed to create metaobject: {', '.join(error_messages)}")
 
         created_metaobject = create_data.get("metaobject")
         if created_metaobject and created_metaobject.get("id"):
-            print(
-                f"[DEBUG] Successfully created API_KEY metaobject with ID: {created_metaobject['id']}"
+            logger.info(
+                "Created API key metaobject", extra={"metaobject": created_metaobject["id"]}
             )
             return created_metaobject
         else:
-            print(
-                f"[ERROR] Metaobject creation did not return the expected object. Response: {response}"
+            logger.error(
+                "Metaobject creation did not return the expected object",
+                extra={"response": response},
             )
             raise Exception(
                 "Metaobject creation response was invalid or did not contain a metaobject ID."
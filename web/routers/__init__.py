@@ -6,5 +6,9 @@ Export all routers for use in main application.
 from .auth import router as auth_router
 from .sync import router as sync_router
 from .api import router as api_router
+from .jobs import router as jobs_router
+from .metrics import router as metrics_router
+from .admin import router as admin_router
+from .webhooks import router as webhooks_router
 
-__all__ = ['auth_router', 'sync_router', 'api_router']
+__all__ = ['auth_router', 'sync_router', 'api_router', 'jobs_router', 'metrics_router', 'admin_router', 'webhooks_router']
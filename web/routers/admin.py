@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Depends
+from dependencies.shopify import get_shopify_client_from_session
+from services.admin_state_service import get_admin_state
+from models import ShopifyAPIClient
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+
+@router.get("/state")
+async def get_dashboard_state(
+    client: ShopifyAPIClient = Depends(get_shopify_client_from_session),
+):
+    """
+    Bootstrap payload for the admin dashboard: access scopes, sync status,
+    all three sync histories and the field profile in one round trip. The
+    shop comes from the App Bridge session token.
+    """
+    return await get_admin_state(client)
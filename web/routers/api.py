@@ -1,12 +1,151 @@
+import math
 from fastapi import APIRouter, HTTPException, Header, Depends
+from fastapi.responses import HTMLResponse, Response
 import httpx
 from core.config import settings
-from urllib.parse import urlencode
+from core.admission import OverloadedError, reco_admission
+from core.compression import PrecompressedBody
+from core.fairness import RATE, StoreThrottledError
+from core.metrics import metrics
+from core.resilience import CircuitOpenError
 from middleware.authentication import validate_shopify_incoming_request
+from services.carousel_fragment_service import (
+    cached_fragment,
+    card_registry,
+    etag_matches,
+    fragment_key,
+    store_fragment,
+)
+from services.reco_prefetch_service import schedule_next_page
+from services.search_index_service import search_indexes
+from services.similarity_index_service import neighbour_indexes
+from services.reco_proxy_service import (
+    build_reco_params,
+    cache_key,
+    fetch_reco,
+    get_cached_body,
+    get_stale,
+    record_activity,
+    store_key,
+    upstream_url,
+)
+from core.logger import get_logger
+
+logger = get_logger("api")
 
 router = APIRouter(prefix="/api", tags=["API"])
 
 
+async def _reco_response(
+    x_store_identifier: str,
+    x_api_key: str,
+    reco_path: str,
+    product_id: int,
+    query: str,
+    page_number: int,
+    page_size: int,
+    sort_by: str,
+    sort_order: str,
+) -> dict | PrecompressedBody:
+    """
+    The reco data for a theme request: local neighbours, then the response
+    cache, then upstream if admitted. When upstream fails or the request is
+    shed, falls back to a stale response, then to the local indexes.
+    Responses from the cache or upstream come back as their cache entry.
+    """
+    if product_id is not None and reco_path in settings.LOCAL_SIMILARITY_PATHS:
+        results = neighbour_indexes.similar(
+            x_store_identifier, product_id, page_number, page_size
+        )
+        if results is not None:
+            return {**results, "source": "local-index"}
+
+    params = build_reco_params(
+        product_id, query, page_number, page_size, sort_by, sort_order
+    )
+    key = cache_key(x_store_identifier, reco_path, params)
+    cached = await get_cached_body(key)
+    if cached is not None:
+        schedule_next_page(x_store_identifier, x_api_key, reco_path, params, cached.data)
+        return cached
+
+    internal_api_url = upstream_url(reco_path, params)
+    logger.debug("Forwarding reco request", extra={"url": internal_api_url})
+
+    # Searches have a local fallback, so don't let a slow upstream hold them.
+    timeout = settings.RECO_SEARCH_TIMEOUT_SECONDS if query else None
+
+    try:
+        async with reco_admission.admit():
+            data = await fetch_reco(
+                x_store_identifier,
+                x_api_key,
+                reco_path,
+                params,
+                timeout=timeout,
+                max_retries=0 if query else None,
+            )
+        logger.debug("Reco upstream responded", extra={"store": x_store_identifier})
+        record_activity(x_store_identifier, x_api_key, reco_path, product_id is not None)
+        schedule_next_page(x_store_identifier, x_api_key, reco_path, params, data)
+        return await get_cached_body(key) or data
+    except (
+        httpx.RequestError,
+        httpx.HTTPStatusError,
+        CircuitOpenError,
+        StoreThrottledError,
+        OverloadedError,
+    ) as exc:
+        if isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code < 500:
+            raise
+        if not isinstance(exc, OverloadedError):  # shedding is counted, not logged
+            logger.error(
+                "Reco proxy request failed",
+                extra={"url": internal_api_url, "error": str(exc) or type(exc).__name__},
+            )
+        stale = get_stale(key)
+        if stale is not None:
+            metrics.incr("reco_stale_served_total", store=store_key(x_store_identifier))
+            return {**stale, "source": "stale-cache"}
+        results = None
+        if query:
+            results = search_indexes.search(
+                x_store_identifier, query, page_number, page_size
+            )
+        elif product_id is not None:
+            results = neighbour_indexes.similar(
+                x_store_identifier, product_id, page_number, page_size
+            )
+        if results is not None:
+            logger.warning(
+                "Serving reco request from local index",
+                extra={"store": x_store_identifier, "path": reco_path},
+            )
+            return {**results, "source": "local-index"}
+        if isinstance(exc, OverloadedError):
+            raise HTTPException(
+                status_code=503,
+                detail="The recommendation service is overloaded.",
+                headers={"Retry-After": str(math.ceil(exc.retry_after))},
+            )
+        if isinstance(exc, StoreThrottledError):
+            raise HTTPException(
+                status_code=429 if exc.reason == RATE else 503,
+                detail="Too many recommendation requests for this store.",
+                headers={"Retry-After": str(math.ceil(exc.retry_after))},
+            )
+        if isinstance(exc, CircuitOpenError):
+            raise HTTPException(
+                status_code=503,
+                detail="The recommendation service is temporarily unavailable.",
+                headers={"Retry-After": str(int(exc.retry_after))},
+            )
+        raise HTTPException(
+            status_code=502,
+            detail="Error connecting to the recommendation service.",
+        )
+
+
 @router.get("/reco/{reco_path:path}")
 async def proxy_reco_request(
     reco_path: str,
@@ -18,50 +157,59 @@ async def proxy_reco_request(
     sort_order: str = "asc",
     x_api_key: str = Header(...),
     x_store_identifier: str = Header(...),
+    accept_encoding: str = Header(None),
     _=Depends(validate_shopify_incoming_request),
 ):
-    print("\n--- [PROXY LOG] ---")
-    print(f"[PROXY] Received request from theme for path: /{reco_path}")
-    print(f"API_KEY: {x_api_key} ; STORE: {x_store_identifier}")
-
-    base_url = f"{settings.PROXY_SERVER_URL}/{reco_path}"
-
-    params = {}
-    if product_id is not None:
-        params["product_id"] = product_id
-    if query is not None:
-        params["query"] = query
-    if page_number is not None:
-        params["page_number"] = page_number
-    if page_number is not None:
-        params["page_size"] = page_size
-    if sort_by is not None:
-        params["sort_by"] = sort_by
-    if sort_order is not None:
-        params["sort_order"] = sort_order
+    logger.debug(
+        "Received reco request from theme",
+        extra={"path": reco_path, "store": x_store_identifier},
+    )
+    result = await _reco_response(
+        x_store_identifier, x_api_key, reco_path, product_id, query,
+        page_number, page_size, sort_by, sort_order,
+    )
+    if isinstance(result, PrecompressedBody):
+        return result.response(accept_encoding)
+    return result
 
-    query_string = urlencode(params)
-    internal_api_url = f"{base_url}?{query_string}"
 
-    user_headers = {}
-    if x_api_key:
-        user_headers["x_api_key"] = x_api_key
-    if x_store_identifier:
-        user_headers["x_store_identifier"] = x_store_identifier
-
-    print(f"[PROXY] Forwarding request to internal API: {internal_api_url}")
+@router.get("/fragment/{reco_path:path}", response_class=HTMLResponse)
+async def carousel_fragment(
+    reco_path: str,
+    product_id: int = None,
+    query: str = None,
+    page_number: int = 1,
+    page_size: int = 10,
+    sort_by: str = "relevance",
+    sort_order: str = "asc",
+    x_api_key: str = Header(...),
+    x_store_identifier: str = Header(...),
+    if_none_match: str = Header(None),
+    _=Depends(validate_shopify_incoming_request),
+):
+    """The carousel for a reco request as rendered card HTML, with an ETag."""
+    params = build_reco_params(
+        product_id, query, page_number, page_size, sort_by, sort_order
+    )
+    version, cards = card_registry.get(x_store_identifier)
+    key = fragment_key(
+        x_store_identifier, version, cache_key(x_store_identifier, reco_path, params)
+    )
+    fragment = cached_fragment(key)
+    if fragment is None:
+        data = await _reco_response(
+            x_store_identifier, x_api_key, reco_path, product_id, query,
+            page_number, page_size, sort_by, sort_order,
+        )
+        if isinstance(data, PrecompressedBody):
+            data = data.data
+        fragment = store_fragment(key, cards, data.get("product_handles") or [])
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(internal_api_url, headers=user_headers)
-            response.raise_for_status()
-            print(f"[PROXY] Received status {response.status_code} from internal API.")
-            print("[PROXY] Success! Forwarding response back to the theme.")
-            print("--- [PROXY LOG END] ---\n")
-            return response.json()
-        except httpx.RequestError as exc:
-            print(f"[ERROR] Proxy request to {internal_api_url} failed: {exc}")
-            raise HTTPException(
-                status_code=502,
-                detail="Error connecting to the recommendation service.",
-            )
+    html, etag = fragment
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={int(settings.CAROUSEL_FRAGMENT_TTL_SECONDS)}",
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(html, headers=headers)
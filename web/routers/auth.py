@@ -6,9 +6,10 @@ from services.shopify_auth_service import (
     get_install_url,
     save_or_update_token_in_db,
     exchange_code_for_token,
+    run_post_install_setup,
 )
+from services.job_service import submit_job
 from dependencies.shopify import get_shopify_client
-from services.shopify_product_service import trigger_initial_product_sync
 from models import ShopifyAPIClient
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
@@ -39,8 +40,9 @@ async def auth_callback(request: Request):
     if access_token:
         save_or_update_token_in_db(shop=shop, access_token=access_token)
         client = ShopifyAPIClient(shop_url=shop, access_token=access_token)
-        client.create_api_key_metaobject()
-        trigger_initial_product_sync(client=client)
+        # Metaobject setup and the first sync run in the background so the
+        # merchant isn't kept waiting on the OAuth redirect.
+        submit_job("install_setup", shop, run_post_install_setup, client)
 
     final_admin_url = f"{settings.APP_URL}/admin?{request.url.query}"
     return RedirectResponse(url=final_admin_url)
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Depends, HTTPException
+from services.job_service import get_job
+from services.shopify_auth_service import verify_shopify_request
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+@router.get("/{job_id}")
+async def get_job_status(job_id: str, session: dict = Depends(verify_shopify_request)):
+    """Returns the status, progress message and result of a background job."""
+    job = get_job(job_id)
+    # Jobs are only visible to the store they were queued for.
+    if not job or job["shop"] != session["shop"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
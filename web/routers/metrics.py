@@ -0,0 +1,33 @@
+import hmac
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from core.config import settings
+from core.metrics import metrics
+from services.sync_ledger_service import slowest_stores
+
+router = APIRouter(tags=["Metrics"])
+
+
+def _require_token(token: str | None):
+    """Closed unless METRICS_TOKEN is set and sent; the endpoint is hidden when it isn't set."""
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+
+
+@router.get("/metrics")
+async def get_metrics(x_metrics_token: str = Header(None)):
+    """Counters, gauges and component state (circuit breakers, caches) as JSON."""
+    _require_token(x_metrics_token)
+    return metrics.snapshot()
+
+
+@router.get("/metrics/sync-ledger")
+async def get_slowest_stores(
+    kind: str | None = None, limit: int = 20, x_metrics_token: str = Header(None)
+):
+    """Stores ranked by p90 total sync time over their recent syncs."""
+    _require_token(x_metrics_token)
+    return {"stores": await run_in_threadpool(slowest_stores, kind, limit)}
@@ -1,88 +1,67 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-import json
-from dependencies.shopify import get_shopify_client_from_query
-from services.shopify_product_service import (
-    trigger_initial_product_sync,
-    trigger_order_history_sync,
-    get_last_sync_status,
+from dependencies.shopify import get_shopify_client_from_session
+from services.sync_job_service import run_catalogue_sync, run_order_sync
+from services.bulk_poller_service import bulk_poller
+from services.shopify_product_service import get_sync_history
+from services.shopify_config_service import run_reco_config_sync
+from services.job_service import submit_job
+from services.sync_ledger_service import list_entries, summarise
+from services.shop_settings_service import (
+    get_shop_field_profile,
+    save_shop_field_profile,
 )
-from services.shopify_config_service import sync_reco_configurations
+from models.bulk_query_builder import PRESETS, FieldProfileError
 from models import ShopifyAPIClient
-from middleware.authentication import validate_shopify_incoming_request
+from core.logger import get_logger
 
-router = APIRouter(
-    prefix="/sync",
-    tags=["Synchronization"],
-    dependencies=[Depends(validate_shopify_incoming_request)],
-)
+logger = get_logger("sync")
+
+# Dashboard routes: the shop comes from the App Bridge session token.
+router = APIRouter(prefix="/sync", tags=["Synchronization"])
 
 
 class SyncRequest(BaseModel):
     shop: str
 
 
-@router.post("/products")
-async def trigger_product_sync(
-    background_tasks: BackgroundTasks,
-    client: ShopifyAPIClient = Depends(get_shopify_client_from_query),
-):
-    """API endpoint to manually trigger a full product catalogue sync."""
-    try:
-        print("In products sync")
-        # Log the "processing" state immediately
-        client.update_sync_history(
-            key="catalogue_sync_history",
-            status="processing",
-            message="Full catalogue sync initiated by user.",
-        )
+class FieldProfileRequest(BaseModel):
+    shop: str | None = None  # ignored; the session token names the shop
+    profile: str | dict
 
-        trigger_initial_product_sync(client=client)
-        return {"message": "Product catalogue sync completed successfully."}
 
-    except Exception as e:
-        error_message = f"Catalogue sync failed: {str(e)}"
-        client.update_sync_history(
-            key="catalogue_sync_history", status="error", message=error_message
-        )
-        raise HTTPException(status_code=500, detail=error_message)
+@router.post("/products", status_code=202)
+async def trigger_product_sync(
+    client: ShopifyAPIClient = Depends(get_shopify_client_from_session),
+):
+    """API endpoint to queue a full product catalogue sync. Poll /jobs/{job_id} for progress."""
+    logger.info("Catalogue sync requested", extra={"shop": client.shop_url})
+    job_id = submit_job("catalogue_sync", client.shop_url, run_catalogue_sync, client)
+    return {"message": "Product catalogue sync has been queued.", "job_id": job_id}
 
 
-@router.post("/orders")
+@router.post("/orders", status_code=202)
 async def trigger_order_sync(
-    client: ShopifyAPIClient = Depends(get_shopify_client_from_query),
+    full: bool = False,
+    client: ShopifyAPIClient = Depends(get_shopify_client_from_session),
 ):
-    """API endpoint to manually trigger a full order history sync."""
-    if client.is_bulk_operation_running():
-        raise HTTPException(
-            status_code=409, detail="A sync operation is already in progress."
-        )
-
-    client.update_sync_history(
-        key="order_sync_history",
-        status="processing",
-        message="Full order history sync initiated by user.",
-    )
-
-    trigger_order_history_sync(client=client)
-    return {"message": "Order history sync has been started in the background."}
+    """
+    API endpoint to queue an order history sync. After the first export only
+    new and updated orders are fetched; pass `full=true` to re-export all.
+    Poll /jobs/{job_id} for progress.
+    """
+    job_id = submit_job("order_sync", client.shop_url, run_order_sync, client, full=full)
+    return {"message": "Order history sync has been queued.", "job_id": job_id}
 
 
 @router.get("/history/products")
 async def get_catalogue_sync_history(
-    shop: str,
-    client: ShopifyAPIClient = Depends(get_shopify_client_from_query),
+    client: ShopifyAPIClient = Depends(get_shopify_client_from_session),
 ):
     """Fetches the catalogue sync history from a shop metafield."""
     try:
-        history_metafield = client.get_metafield(
-            namespace="couture_app", key="catalogue_sync_history"
-        )
-
-        if not history_metafield or not history_metafield.get("value"):
-            return {"history": []}
-
-        history = json.loads(history_metafield["value"])
+        history = await run_in_threadpool(get_sync_history, client, "catalogue_sync_history")
         return {"history": history}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get history: {str(e)}")
@@ -90,17 +69,11 @@ async def get_catalogue_sync_history(
 
 @router.get("/history/orders")
 async def get_order_sync_history(
-    shop: str,
-    client: ShopifyAPIClient = Depends(get_shopify_client_from_query),
+    client: ShopifyAPIClient = Depends(get_shopify_client_from_session),
 ):
     """Fetches the order sync history from a shop metafield."""
     try:
-        history_metafield = client.get_metafield(
-            namespace="couture_app", key="order_sync_history"
-        )
-        if not history_metafield or not history_metafield.get("value"):
-            return {"history": []}
-        history = json.loads(history_metafield["value"])
+        history = await run_in_threadpool(get_sync_history, client, "order_sync_history")
         return {"history": history}
     except Exception as e:
         raise HTTPException(
@@ -108,43 +81,31 @@ async def get_order_sync_history(
         )
 
 
-@router.post("/reco-config")
+@router.post("/reco-config", status_code=202)
 async def sync_reco_config(
-    client: ShopifyAPIClient = Depends(get_shopify_client_from_query), body: dict = {}
+    prune: bool | None = None,
+    client: ShopifyAPIClient = Depends(get_shopify_client_from_session),
+    body: dict = {},
 ):
-    """Sync recommendation configurations."""
-    try:
-        result = sync_reco_configurations(client.shop_url, client)
-        message = f"Sync successful! {result['created']} created, {result['updated']} updated."
-
-        client.update_sync_history(
-            key="reco_config_sync", status="success", message=message
-        )
-
-        return {"message": message}
-    except Exception as e:
-        error_message = f"Sync failed: {str(e)}"
-        client.update_sync_history(
-            key="reco_config_sync", status="error", message=error_message
-        )
-        raise HTTPException(status_code=500, detail=str(e))
+    """
+    Queue a sync of recommendation configurations. Only new or changed
+    carousels are written; `prune=true` also deletes carousels the reco
+    service no longer lists (default: RECO_CONFIG_PRUNE). Poll
+    /jobs/{job_id} for progress.
+    """
+    job_id = submit_job(
+        "reco_config_sync", client.shop_url, run_reco_config_sync, client, prune=prune
+    )
+    return {"message": "Reco configuration sync has been queued.", "job_id": job_id}
 
 
 @router.get("/history/reco")
 async def get_reco_sync_history(
-    shop: str,
-    client: ShopifyAPIClient = Depends(get_shopify_client_from_query),
+    client: ShopifyAPIClient = Depends(get_shopify_client_from_session),
 ):
     """Fetches the reco sync history from a shop metafield."""
     try:
-        history_metafield = client.get_metafield(
-            namespace="couture_app", key="reco_config_sync"
-        )
-
-        if not history_metafield or not history_metafield.get("value"):
-            return {"history": []}
-
-        history = json.loads(history_metafield["value"])
+        history = await run_in_threadpool(get_sync_history, client, "reco_config_sync")
         return {"history": history}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get history: {str(e)}")
@@ -152,8 +113,7 @@ async def get_reco_sync_history(
 
 @router.post("/history/clear")
 async def clear_all_history(
-    shop: str,
-    client: ShopifyAPIClient = Depends(get_shopify_client_from_query),
+    client: ShopifyAPIClient = Depends(get_shopify_client_from_session),
 ):
     """Deletes all sync history metafields for a given shop."""
     try:
@@ -188,12 +148,55 @@ async def clear_all_history(
 
 @router.get("/status")
 async def get_sync_status(
-    shop: str,
-    client: ShopifyAPIClient = Depends(get_shopify_client_from_query),
+    client: ShopifyAPIClient = Depends(get_shopify_client_from_session),
 ):
-    """API endpoint to check the status of the latest bulk operation."""
+    """API endpoint to check the status of the latest bulk operation.
+    Served from the bulk poller's cache while it is tracking the shop."""
     try:
-        status = get_last_sync_status(client=client)
-        return status
+        return await run_in_threadpool(bulk_poller.status_for, client)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/ledger")
+async def get_sync_ledger(
+    kind: str | None = None,
+    page_number: int = 1,
+    page_size: int = 20,
+    client: ShopifyAPIClient = Depends(get_shopify_client_from_session),
+):
+    """Every sync for the shop with per-phase timings and sizes, newest first."""
+    return await run_in_threadpool(list_entries, client.shop_url, kind, page_number, page_size)
+
+
+@router.get("/ledger/summary")
+async def get_sync_ledger_summary(
+    kind: str | None = None,
+    client: ShopifyAPIClient = Depends(get_shopify_client_from_session),
+):
+    """p50/p90/p99 per sync phase for recent syncs, next to the window before them."""
+    return await run_in_threadpool(summarise, client.shop_url, kind)
+
+
+@router.get("/field-profile")
+async def get_field_profile(
+    client: ShopifyAPIClient = Depends(get_shopify_client_from_session),
+):
+    """Returns the shop's bulk export field profile and the available presets."""
+    return {
+        "profile": get_shop_field_profile(client.shop_url),
+        "presets": list(PRESETS),
+    }
+
+
+@router.post("/field-profile")
+async def set_field_profile(
+    body: FieldProfileRequest,
+    client: ShopifyAPIClient = Depends(get_shopify_client_from_session),
+):
+    """Sets the fields exported by future catalogue and order syncs."""
+    try:
+        save_shop_field_profile(client.shop_url, body.profile)
+    except FieldProfileError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Field profile updated.", "profile": body.profile}
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends
+from services.shopify_auth_service import verify_webhook
+from services.webhook_service import webhook_spool
+
+router = APIRouter(prefix="/webhooks", tags=["Webhooks"])
+
+
+def _accept(topic: str, webhook: dict) -> dict:
+    # Spooled only; the flusher applies it shortly after.
+    webhook_spool.append(topic, webhook["shop"], webhook["payload"], webhook["webhook_id"])
+    return {"status": "accepted"}
+
+
+@router.post("/products/create")
+def product_created(webhook: dict = Depends(verify_webhook)):
+    """Shopify webhook: a product was created."""
+    return _accept("products/create", webhook)
+
+
+@router.post("/products/update")
+def product_updated(webhook: dict = Depends(verify_webhook)):
+    """Shopify webhook: a product was updated."""
+    return _accept("products/update", webhook)
+
+
+@router.post("/products/delete")
+def product_deleted(webhook: dict = Depends(verify_webhook)):
+    """Shopify webhook: a product was deleted."""
+    return _accept("products/delete", webhook)
+
+
+@router.post("/orders/create")
+def order_created(webhook: dict = Depends(verify_webhook)):
+    """Shopify webhook: an order was placed."""
+    return _accept("orders/create", webhook)
@@ -0,0 +1,98 @@
+# services/admin_state_service.py
+"""
+Everything the admin dashboard shows on first paint, in one response.
+
+The Shopify side (access scopes, current bulk operation, the three sync
+histories) is fetched with a single aliased GraphQL document; the bulk
+operation is left out when the poller already knows the shop's status.
+Local lookups run alongside it. If the merged query fails, the individual
+lookups are made concurrently instead and any that fail are reported per
+section rather than failing the whole payload.
+"""
+import asyncio
+import json
+
+from fastapi.concurrency import run_in_threadpool
+
+from core.logger import get_logger
+from models.shopify_client import ShopifyAPIClient
+from services.bulk_poller_service import bulk_poller
+from services.shop_settings_service import get_shop_field_profile
+from services.shopify_product_service import get_sync_history
+
+logger = get_logger("admin_state")
+
+# Dashboard section -> sync history metafield key.
+HISTORY_KEYS = {
+    "products": "catalogue_sync_history",
+    "orders": "order_sync_history",
+    "reco": "reco_config_sync",
+}
+
+
+def _parse_history(value: str | None) -> list:
+    return json.loads(value) if value else []
+
+
+async def _merged_state(client: ShopifyAPIClient) -> dict:
+    cached_status = bulk_poller.cached_status(client.shop_url)
+    state = await run_in_threadpool(
+        client.get_dashboard_state, HISTORY_KEYS, cached_status is None
+    )
+    if cached_status is None:
+        status = await run_in_threadpool(bulk_poller.observe, client, state["bulk_operation"])
+    else:
+        status = cached_status
+    return {
+        "scopes": state["scopes"],
+        "status": status,
+        "history": {
+            section: _parse_history(state["histories"].get(section))
+            for section in HISTORY_KEYS
+        },
+        "errors": {},
+    }
+
+
+async def _separate_state(client: ShopifyAPIClient) -> dict:
+    sections = ["scopes", "status", *HISTORY_KEYS]
+    results = await asyncio.gather(
+        run_in_threadpool(client.get_access_scopes),
+        run_in_threadpool(bulk_poller.status_for, client),
+        *(run_in_threadpool(get_sync_history, client, key) for key in HISTORY_KEYS.values()),
+        return_exceptions=True,
+    )
+    values = dict(zip(sections, results))
+    errors = {
+        section: str(value) for section, value in values.items() if isinstance(value, Exception)
+    }
+
+    def ok(section, default):
+        return default if section in errors else values[section]
+
+    return {
+        "scopes": ok("scopes", []),
+        "status": ok("status", None),
+        "history": {section: ok(section, []) for section in HISTORY_KEYS},
+        "errors": errors,
+    }
+
+
+async def _remote_state(client: ShopifyAPIClient) -> dict:
+    try:
+        return await _merged_state(client)
+    except Exception as e:
+        logger.warning(
+            "Merged dashboard query failed, fetching sections separately",
+            extra={"shop": client.shop_url, "error": str(e)},
+        )
+        return await _separate_state(client)
+
+
+async def get_admin_state(client: ShopifyAPIClient) -> dict:
+    """Scopes, sync status, sync histories and field profile for the dashboard."""
+    remote, field_profile = await asyncio.gather(
+        _remote_state(client),
+        run_in_threadpool(get_shop_field_profile, client.shop_url),
+    )
+    return {"shop": client.shop_url, **remote, "field_profile": field_profile}
@@ -0,0 +1,229 @@
+# services/bulk_poller_service.py
+import threading
+import time
+
+from core.cache import SingleFlight, TTLCache
+from core.config import settings
+from core.coordination import get_coordinator
+from core.logger import get_logger
+from models.database import SessionLocal, Store
+from models.shopify_client import ShopifyAPIClient
+from services.job_service import submit_job
+from services.shopify_product_service import (
+    TERMINAL_BULK_STATUSES,
+    claim_finalisation,
+    run_finalisation,
+)
+from services.sync_ledger_service import in_flight
+
+logger = get_logger("bulk_poller")
+
+
+class _TrackedOperation:
+    """Polling state for one shop's outstanding bulk operation."""
+
+    def __init__(self, client: ShopifyAPIClient, operation_id: str | None):
+        self.client = client
+        self.operation_id = operation_id
+        self.interval = settings.BULK_POLL_MIN_INTERVAL
+        self.next_poll_at = time.monotonic() + self.interval
+        self.last_object_count = -1
+        self.status_data: dict = {}
+
+
+class BulkOperationPoller:
+    """
+    Polls `currentBulkOperation` for shops with an outstanding bulk export
+    and finalises each finished operation exactly once, whether or not
+    anyone has the dashboard open. Statuses are published through the
+    coordinator so other workers answer /sync/status without polling too.
+
+    The poll interval adapts per shop: while `objectCount` keeps growing it
+    halves (down to BULK_POLL_MIN_INTERVAL), and when it stalls it doubles
+    (up to BULK_POLL_MAX_INTERVAL). The latest status is cached so
+    /sync/status can answer without a Shopify round trip.
+
+    Tracking is in memory, so on start the poller picks up again every
+    operation the sync ledger still has as processing; one that finished
+    while no worker was running is finalised on its first poll.
+    """
+
+    def __init__(self):
+        self._tracked: dict[str, _TrackedOperation] = {}
+        # Final status of each shop's last operation, served to /sync/status
+        # until it goes stale and Shopify is asked again.
+        self._latest = TTLCache(maxsize=10000, default_ttl=settings.BULK_POLL_MAX_INTERVAL)
+        self._status_reads = SingleFlight(window=settings.SYNC_STATUS_COALESCE_SECONDS)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="couture-bulk-poller", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def track(self, client: ShopifyAPIClient, operation: dict | None = None):
+        """
+        Starts polling a bulk operation for `client`'s shop. `operation` is the
+        `bulkOperationRunQuery` result, or any dict with a `bulkOperation`.
+        """
+        bulk_operation = (operation or {}).get("bulkOperation") or {}
+        operation_id = bulk_operation.get("id")
+        tracked = _TrackedOperation(client, operation_id)
+        if bulk_operation.get("status"):
+            tracked.status_data = bulk_operation
+        with self._lock:
+            self._tracked[client.shop_url] = tracked
+        logger.info(
+            "Tracking bulk operation",
+            extra={"shop": client.shop_url, "operation_id": operation_id},
+        )
+
+    def claim(self, shop: str, operation_id: str | None) -> bool:
+        """Returns True for the first caller to claim finalising an operation."""
+        return claim_finalisation(shop, operation_id)
+
+    def cached_status(self, shop: str) -> dict | None:
+        """
+        Latest known bulk operation status for `shop`, from this worker or
+        published by whichever worker is polling it; None if unknown.
+        """
+        with self._lock:
+            tracked = self._tracked.get(shop)
+            if tracked and tracked.status_data:
+                return tracked.status_data
+        latest = self._latest.get(shop)
+        if latest is not None:
+            return latest
+        return get_coordinator().get(f"bulk_status:{shop}")
+
+    def _publish(self, shop: str, status_data: dict, ttl: float):
+        """Shares a status with other workers so they don't poll the shop too."""
+        get_coordinator().set(f"bulk_status:{shop}", status_data, ttl=ttl)
+
+    def status_for(self, client: ShopifyAPIClient) -> dict:
+        """
+        Status for /sync/status. Served from cache when the poller knows the
+        shop; otherwise asks Shopify once, then either starts tracking the
+        running operation or queues a job to finalise the finished one.
+        Concurrent callers for a shop share that one Shopify call.
+        """
+        cached = self.cached_status(client.shop_url)
+        if cached is not None:
+            return cached
+        return self._status_reads.do(client.shop_url, self._fetch_status, client)
+
+    def _fetch_status(self, client: ShopifyAPIClient) -> dict:
+        return self.observe(client, client.get_bulk_operation_status())
+
+    def observe(self, client: ShopifyAPIClient, status_data: dict | None) -> dict:
+        """
+        Handles a `currentBulkOperation` result fetched outside the poller:
+        starts tracking a running operation, or hands a finished one to a
+        finalise job so the status request never waits on the download.
+        """
+        if not status_data or not status_data.get("status"):
+            return {"message": "No active sync operation found."}
+
+        if status_data["status"] in TERMINAL_BULK_STATUSES:
+            self._latest.set(client.shop_url, status_data)
+            self._publish(client.shop_url, status_data, settings.BULK_POLL_MAX_INTERVAL)
+            if self.claim(client.shop_url, status_data.get("id")):
+                submit_job("bulk_finalise", client.shop_url, _finalise_job, client, status_data)
+        else:
+            self.track(client, {"bulkOperation": status_data})
+        return status_data
+
+    def _resume(self):
+        """Tracks the operations the ledger still has as processing."""
+        resumed = 0
+        for shop, operation_id in in_flight():
+            with self._lock:
+                if shop in self._tracked:
+                    continue
+            db = SessionLocal()
+            try:
+                store = db.query(Store).filter(Store.shop_url == shop).first()
+                access_token = store.access_token if store else None
+            finally:
+                db.close()
+            if not access_token:
+                continue
+            client = ShopifyAPIClient(shop_url=shop, access_token=access_token)
+            self.track(client, {"bulkOperation": {"id": operation_id}})
+            resumed += 1
+        if resumed:
+            logger.info("Resumed tracking bulk operations", extra={"operations": resumed})
+
+    def _run(self):
+        try:
+            self._resume()
+        except Exception:
+            logger.exception("Could not resume tracking bulk operations")
+        while not self._stop.wait(settings.BULK_POLL_TICK):
+            now = time.monotonic()
+            with self._lock:
+                due = [t for t in self._tracked.values() if t.next_poll_at <= now]
+            for tracked in due:
+                try:
+                    self._poll(tracked)
+                except Exception:
+                    logger.exception(
+                        "Bulk operation poll failed", extra={"shop": tracked.client.shop_url}
+                    )
+                    self._back_off(tracked, grew=False)
+
+    def _back_off(self, tracked: _TrackedOperation, grew: bool):
+        if grew:
+            tracked.interval = max(settings.BULK_POLL_MIN_INTERVAL, tracked.interval / 2)
+        else:
+            tracked.interval = min(settings.BULK_POLL_MAX_INTERVAL, tracked.interval * 2)
+        tracked.next_poll_at = time.monotonic() + tracked.interval
+
+    def _poll(self, tracked: _TrackedOperation):
+        shop = tracked.client.shop_url
+        status_data = tracked.client.get_bulk_operation_status() or {}
+        tracked.status_data = status_data
+
+        if status_data.get("status") not in TERMINAL_BULK_STATUSES:
+            object_count = int(status_data.get("objectCount") or 0)
+            self._back_off(tracked, grew=object_count > tracked.last_object_count)
+            tracked.last_object_count = object_count
+            # Outlives the next poll, but not this worker by much.
+            self._publish(shop, status_data, tracked.interval * 2 + settings.BULK_POLL_TICK)
+            return
+
+        with self._lock:
+            # A newer operation may have been tracked while this poll was out.
+            if self._tracked.get(shop) is tracked:
+                del self._tracked[shop]
+        self._latest.set(shop, status_data)
+        self._publish(shop, status_data, settings.BULK_POLL_MAX_INTERVAL)
+        operation_id = status_data.get("id")
+        if not self.claim(shop, operation_id):
+            return
+
+        logger.info(
+            "Bulk operation finished",
+            extra={"shop": shop, "operation_id": operation_id, "status": status_data.get("status")},
+        )
+        submit_job("bulk_finalise", shop, _finalise_job, tracked.client, status_data)
+
+
+def _finalise_job(job, client: ShopifyAPIClient, status_data: dict) -> dict:
+    """Job: download the finished operation's result and record it in history."""
+    updated = run_finalisation(client, status_data)
+    return {"operation_id": status_data.get("id"), "history_updated": updated}
+
+
+bulk_poller = BulkOperationPoller()
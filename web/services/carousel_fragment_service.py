@@ -0,0 +1,165 @@
+# services/carousel_fragment_service.py
+"""
+Server-rendered carousel HTML for the storefront block.
+
+Instead of handing the theme a list of handles to turn into cards (one
+extra /search round trip and a DOM scrape per carousel), the proxy can
+render the cards itself. The template is compiled once at import; card
+data (title, link, first image, lowest price) comes from the shop's last
+catalogue download, so rendering needs no Shopify call.
+
+Rendered fragments are cached per store, reco path and query parameters
+for CAROUSEL_FRAGMENT_TTL_SECONDS together with an ETag over the HTML.
+The key includes the catalogue file's mtime, so a sync in any worker
+retires the fragments built from the old catalogue. A cache hit is
+served without touching the reco service; a matching If-None-Match is
+answered with 304 and no body.
+"""
+import hashlib
+import json
+import os
+import threading
+from decimal import Decimal, InvalidOperation
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from core.cache import TTLCache
+from core.config import settings
+from core.logger import get_logger
+from core.metrics import metrics
+from services.search_index_service import catalogue_path
+
+logger = get_logger("carousel_fragment")
+
+_environment = Environment(
+    loader=FileSystemLoader("templates"),
+    autoescape=select_autoescape(["html"]),
+    trim_blocks=True,
+    lstrip_blocks=True,
+)
+_template = _environment.get_template("carousel_fragment.html")
+
+fragment_cache = TTLCache(
+    maxsize=settings.CAROUSEL_FRAGMENT_CACHE_SIZE,
+    default_ttl=settings.CAROUSEL_FRAGMENT_TTL_SECONDS,
+)
+metrics.register_collector("carousel_fragment_cache", fragment_cache.stats)
+
+
+def _lowest_price(prices: list) -> str | None:
+    values = []
+    for price in prices:
+        try:
+            values.append(Decimal(str(price)))
+        except (InvalidOperation, ValueError):
+            continue
+    return str(min(values)) if values else None
+
+
+def build_cards(rows: list) -> dict:
+    """handle -> card fields for the active products of a catalogue export."""
+    products, prices, images = {}, {}, {}
+    for row in rows:
+        parent_id = row.get("__parentId")
+        if parent_id is None:
+            if row.get("handle") and row.get("status") in (None, "ACTIVE"):
+                products[row["id"]] = row
+        elif "originalSrc" in row:
+            images.setdefault(parent_id, row)
+        elif "price" in row:
+            prices.setdefault(parent_id, []).append(row["price"])
+
+    cards = {}
+    for product_id, product in products.items():
+        image = images.get(product_id) or {}
+        cards[product["handle"]] = {
+            "title": product.get("title") or product["handle"],
+            "image": image.get("originalSrc"),
+            "alt": image.get("altText") or product.get("title"),
+            "price": _lowest_price(prices.get(product_id, [])),
+        }
+    return cards
+
+
+class CardRegistry:
+    """
+    Each shop's cards, reloaded in the background when the catalogue file
+    changes. Until the first load finishes, cards are rendered from the
+    handle alone.
+    """
+
+    def __init__(self):
+        self._cards: dict[str, tuple] = {}  # shop -> (catalogue mtime, cards)
+        self._loading: set = set()
+        self._lock = threading.Lock()
+
+    def get(self, shop: str) -> tuple:
+        """(version, cards) for the shop; the version changes with the catalogue."""
+        try:
+            mtime = os.path.getmtime(catalogue_path(shop))
+        except OSError:
+            mtime = None
+        with self._lock:
+            loaded = self._cards.get(shop)
+            if mtime is None or (loaded and loaded[0] == mtime) or shop in self._loading:
+                return loaded or (None, {})
+            self._loading.add(shop)
+        threading.Thread(
+            target=self._load, args=(shop, mtime), name="couture-cards-load", daemon=True
+        ).start()
+        return loaded or (None, {})
+
+    def _load(self, shop: str, mtime: float):
+        try:
+            with open(catalogue_path(shop), "r", encoding="utf-8") as f:
+                cards = build_cards(json.load(f))
+            with self._lock:
+                self._cards[shop] = (mtime, cards)
+            logger.info("Carousel cards loaded", extra={"shop": shop, "cards": len(cards)})
+        except Exception:
+            logger.exception("Cannot load carousel cards", extra={"shop": shop})
+        finally:
+            with self._lock:
+                self._loading.discard(shop)
+
+
+card_registry = CardRegistry()
+
+
+def fragment_key(store: str, version, reco_key: str) -> str:
+    return f"fragment:{store}:{version}:{reco_key}"
+
+
+def etag_for(html: str) -> str:
+    return '"' + hashlib.blake2b(html.encode("utf-8"), digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in candidates
+
+
+def render_fragment(cards: dict, handles: list) -> str:
+    """The carousel's card markup for `handles`, in order."""
+    items = []
+    for handle in handles:
+        card = cards.get(handle) or {"title": handle.replace("-", " ").capitalize()}
+        items.append({"handle": handle, **card})
+    return _template.render(items=items)
+
+
+def cached_fragment(key: str) -> tuple | None:
+    """(html, etag) for a fragment rendered within the TTL, or None."""
+    return fragment_cache.get(key)
+
+
+def store_fragment(key: str, cards: dict, handles: list) -> tuple:
+    """Renders and caches a fragment; returns (html, etag)."""
+    html = render_fragment(cards, handles)
+    fragment = (html, etag_for(html))
+    fragment_cache.set(key, fragment)
+    return fragment
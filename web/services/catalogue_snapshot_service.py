@@ -0,0 +1,113 @@
+# services/catalogue_snapshot_service.py
+"""
+Change detection between consecutive catalogue snapshots.
+
+Each product (its row plus its variant and image rows) gets a stable
+content hash: a digest of its canonical JSON. The hashes are kept next to
+the catalogue download as sorted "id<TAB>hash" lines:
+
+    downloads/{shop}_products.hashes.tsv
+
+Because both the previous and the new hash files are sorted by ID, they
+can be diffed as a streaming merge without loading either into memory.
+The resulting added / changed / deleted IDs are written to
+downloads/{shop}_products.changes.json for downstream indexing.
+"""
+import hashlib
+import json
+import os
+
+from core.logger import get_logger
+
+logger = get_logger("catalogue_snapshot")
+
+
+def hashes_path(shop: str) -> str:
+    return f"downloads/{shop}_products.hashes.tsv"
+
+
+def changes_path(shop: str) -> str:
+    return f"downloads/{shop}_products.changes.json"
+
+
+def content_hash(product: dict, children: list) -> str:
+    """Digest of a product's canonical JSON; key order and whitespace don't matter."""
+    canonical = json.dumps(
+        {"product": product, "children": children},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def product_hashes(rows: list) -> dict:
+    """{product id: content hash} for a bulk export's rows."""
+    products: dict[str, tuple] = {}
+    for row in rows:
+        parent_id = row.get("__parentId")
+        if parent_id is None:
+            if row.get("id"):
+                products[row["id"]] = (row, [])
+        elif parent_id in products:
+            products[parent_id][1].append({k: v for k, v in row.items() if k != "__parentId"})
+    return {pid: content_hash(product, children) for pid, (product, children) in products.items()}
+
+
+def _read_hashes(path: str):
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            product_id, _, digest = line.rstrip("\n").partition("\t")
+            if product_id:
+                yield product_id, digest
+
+
+def diff_hashes(previous, current):
+    """
+    Merges two ID-sorted (id, hash) streams, yielding ("added" | "changed" |
+    "deleted", id) for every difference.
+    """
+    previous, current = iter(previous), iter(current)
+    old = next(previous, None)
+    new = next(current, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            yield "deleted", old[0]
+            old = next(previous, None)
+        elif old is None or new[0] < old[0]:
+            yield "added", new[0]
+            new = next(current, None)
+        else:
+            if old[1] != new[1]:
+                yield "changed", new[0]
+            old = next(previous, None)
+            new = next(current, None)
+
+
+def record_snapshot(shop: str, rows: list) -> dict:
+    """
+    Hashes a new catalogue export, diffs it against the previous snapshot's
+    hashes and replaces them. Returns {"added", "changed", "deleted"} ID lists;
+    on a shop's first snapshot every product is "added".
+    """
+    path = hashes_path(shop)
+    tmp_path = f"{path}.tmp"
+    hashes = product_hashes(rows)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for product_id in sorted(hashes):
+            f.write(f"{product_id}\t{hashes[product_id]}\n")
+
+    changes = {"added": [], "changed": [], "deleted": []}
+    for kind, product_id in diff_hashes(_read_hashes(path), _read_hashes(tmp_path)):
+        changes[kind].append(product_id)
+    os.replace(tmp_path, path)
+
+    with open(changes_path(shop), "w", encoding="utf-8") as f:
+        json.dump(changes, f)
+    logger.info(
+        "Catalogue snapshot recorded",
+        extra={"shop": shop, "products": len(hashes), **{k: len(v) for k, v in changes.items()}},
+    )
+    return changes
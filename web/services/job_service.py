@@ -0,0 +1,149 @@
+# services/job_service.py
+import datetime
+import json
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
+from typing import Callable
+
+from core.config import settings
+from core.logger import get_logger
+from models.database import SessionLocal, Job
+
+logger = get_logger("jobs")
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.JOB_WORKERS, thread_name_prefix="couture-job"
+)
+# IDs of jobs this worker has queued or is running; failed on shutdown.
+_unfinished: set = set()
+_unfinished_lock = threading.Lock()
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(timezone.utc)
+
+
+def _update_job(job_id: str, **fields):
+    db = SessionLocal()
+    try:
+        db.query(Job).filter(Job.id == job_id).update(fields)
+        db.commit()
+    finally:
+        db.close()
+
+
+class JobContext:
+    """Handed to every job function so it can report progress."""
+
+    def __init__(self, job_id: str, shop: str):
+        self.id = job_id
+        self.shop = shop
+
+    def progress(self, message: str):
+        _update_job(self.id, message=message)
+
+
+def _run(job: JobContext, fn: Callable, args: tuple, kwargs: dict):
+    try:
+        _update_job(job.id, status=JOB_RUNNING, started_at=_now())
+        try:
+            result = fn(job, *args, **kwargs)
+        except Exception as e:
+            logger.exception("Job failed", extra={"job_id": job.id, "shop": job.shop})
+            _update_job(job.id, status=JOB_FAILED, error=str(e), finished_at=_now())
+            return
+
+        _update_job(
+            job.id,
+            status=JOB_SUCCEEDED,
+            result=json.dumps(result, default=str) if result is not None else None,
+            finished_at=_now(),
+        )
+    finally:
+        with _unfinished_lock:
+            _unfinished.discard(job.id)
+
+
+def submit_job(kind: str, shop: str, fn: Callable, *args, **kwargs) -> str:
+    """
+    Records a queued job and runs `fn(job, *args, **kwargs)` on the job pool.
+    Returns the job ID immediately; poll it with `get_job`.
+    """
+    job_id = uuid.uuid4().hex
+    db = SessionLocal()
+    try:
+        db.add(
+            Job(
+                id=job_id,
+                kind=kind,
+                shop_url=shop,
+                status=JOB_QUEUED,
+                created_at=_now(),
+            )
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    logger.info("Job queued", extra={"job_id": job_id, "kind": kind, "shop": shop})
+    with _unfinished_lock:
+        _unfinished.add(job_id)
+    _executor.submit(_run, JobContext(job_id, shop), fn, args, kwargs)
+    return job_id
+
+
+def get_job(job_id: str) -> dict | None:
+    """Returns a job as a plain dict, or None if it doesn't exist."""
+    db = SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        if not job:
+            return None
+        return {
+            "id": job.id,
+            "kind": job.kind,
+            "shop": job.shop_url,
+            "status": job.status,
+            "message": job.message,
+            "result": json.loads(job.result) if job.result else None,
+            "error": job.error,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "started_at": job.started_at.isoformat() if job.started_at else None,
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        }
+    finally:
+        db.close()
+
+
+def shutdown_jobs(wait: bool = False):
+    """
+    Stops accepting jobs and cancels queued ones. Jobs this worker had not
+    finished are marked failed, so pollers don't wait on them forever; one
+    that still completes before the process exits records its own result.
+    """
+    _executor.shutdown(wait=wait, cancel_futures=True)
+    with _unfinished_lock:
+        job_ids = list(_unfinished)
+        _unfinished.clear()
+    if not job_ids:
+        return
+
+    db = SessionLocal()
+    try:
+        db.query(Job).filter(
+            Job.id.in_(job_ids), Job.status.in_((JOB_QUEUED, JOB_RUNNING))
+        ).update(
+            {"status": JOB_FAILED, "error": "Worker shut down", "finished_at": _now()},
+            synchronize_session=False,
+        )
+        db.commit()
+    finally:
+        db.close()
+    logger.warning("Unfinished jobs failed on shutdown", extra={"jobs": len(job_ids)})
@@ -0,0 +1,145 @@
+# services/order_store_service.py
+"""
+Local order history, stored as append-only monthly partitions:
+
+    downloads/{shop}/orders/2024-05.jsonl
+
+Each line is one order with its line items nested under "lineItems". An
+order lands in the partition of the month it was created, so new orders
+only ever append to the newest partitions. An order that comes back from
+an incremental export with a newer `updatedAt` is compacted in place: only
+its partition is rewritten, through a temp file, so readers never see a
+half-written month.
+"""
+import json
+import os
+
+from core.logger import get_logger
+from services.shop_settings_service import get_sync_watermark, save_sync_watermark
+
+logger = get_logger("order_store")
+
+ORDERS_RESOURCE = "orders"
+UNDATED_PARTITION = "undated"
+
+
+def partition_dir(shop: str) -> str:
+    return os.path.join("downloads", shop, "orders")
+
+
+def partition_key(order: dict) -> str:
+    """"2024-05" for an order created in May 2024."""
+    created_at = order.get("createdAt") or ""
+    return created_at[:7] if len(created_at) >= 7 else UNDATED_PARTITION
+
+
+def assemble_orders(rows: list) -> list:
+    """
+    Folds a bulk export's flat rows back into orders: child rows carry a
+    `__parentId` and are nested under their order's "lineItems".
+    """
+    orders = {}
+    for row in rows:
+        parent_id = row.get("__parentId")
+        if parent_id is None:
+            row.setdefault("lineItems", [])
+            orders[row.get("id")] = row
+            continue
+        parent = orders.get(parent_id)
+        if parent is None:
+            continue  # JSONL rows always follow their parent; skip orphans
+        child = {k: v for k, v in row.items() if k != "__parentId"}
+        parent["lineItems"].append(child)
+    return list(orders.values())
+
+
+def _read_partition(path: str) -> list:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _write_partition(path: str, orders: list):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for order in orders:
+            f.write(json.dumps(order, separators=(",", ":")) + "\n")
+    os.replace(tmp_path, path)
+
+
+def apply_orders(shop: str, orders: list) -> dict:
+    """
+    Merges exported orders into the shop's partitions: unseen orders are
+    appended, known ones replaced if their `updatedAt` moved forward.
+    Returns counts of what changed.
+    """
+    by_partition: dict[str, list] = {}
+    for order in orders:
+        by_partition.setdefault(partition_key(order), []).append(order)
+
+    directory = partition_dir(shop)
+    os.makedirs(directory, exist_ok=True)
+    appended = updated = 0
+
+    for key, incoming in by_partition.items():
+        path = os.path.join(directory, f"{key}.jsonl")
+        existing = _read_partition(path)
+        index = {order.get("id"): i for i, order in enumerate(existing)}
+
+        new_orders, changed = [], False
+        for order in incoming:
+            position = index.get(order.get("id"))
+            if position is None:
+                index[order.get("id")] = len(existing) + len(new_orders)
+                new_orders.append(order)
+            elif (order.get("updatedAt") or "") > (existing[position].get("updatedAt") or ""):
+                existing[position] = order
+                changed = True
+                updated += 1
+
+        if changed:
+            _write_partition(path, existing + new_orders)
+        elif new_orders:
+            with open(path, "a", encoding="utf-8") as f:
+                for order in new_orders:
+                    f.write(json.dumps(order, separators=(",", ":")) + "\n")
+        appended += len(new_orders)
+
+    return {"appended": appended, "updated": updated, "partitions": len(by_partition)}
+
+
+def iter_orders(shop: str, since_month: str = None):
+    """Yields the shop's stored orders, oldest partition first."""
+    directory = partition_dir(shop)
+    if not os.path.isdir(directory):
+        return
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".jsonl"):
+            continue
+        if since_month and name[:-len(".jsonl")] < since_month:
+            continue
+        yield from _read_partition(os.path.join(directory, name))
+
+
+def store_order_export(shop: str, orders: list) -> dict:
+    """
+    Stores a finished order export (see `assemble_orders`) and moves the
+    shop's watermarks to the newest `createdAt` / `updatedAt` it contained.
+    """
+    counts = apply_orders(shop, orders)
+    if orders:
+        save_sync_watermark(
+            shop,
+            ORDERS_RESOURCE,
+            created_at=max((o.get("createdAt") or "" for o in orders), default="") or None,
+            updated_at=max((o.get("updatedAt") or "" for o in orders), default="") or None,
+        )
+    logger.info("Order export stored", extra={"shop": shop, **counts})
+    return counts
+
+
+def order_watermark(shop: str) -> str | None:
+    """`updatedAt` to resume an incremental order sync from, or None for a full export."""
+    mark = get_sync_watermark(shop, ORDERS_RESOURCE)
+    return mark["updated_at"] if mark else None
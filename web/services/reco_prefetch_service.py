@@ -0,0 +1,101 @@
+# services/reco_prefetch_service.py
+"""
+Next-page prefetching for paginated reco and search responses.
+
+With RECO_PREFETCH_ENABLED, serving page N of a response from upstream or
+the cache starts a background fetch of page N+1 into the response cache,
+so a shopper paging through results gets the next page at cache-hit
+speed. A prefetch is skipped when:
+
+- the response says there is no next page,
+- the next page is already cached or being prefetched,
+- the store has used its prefetch budget (a token bucket of
+  RECO_PREFETCH_RATE_PER_SECOND, bursting to RECO_PREFETCH_BURST), or
+- the proxy is under load: admission control is queueing, or more than
+  RECO_PREFETCH_MAX_LOAD of its in-flight limit is in use.
+
+Prefetches go through admission control and fetch_reco, so they count
+against the proxy's in-flight limit and the store's upstream rate limit
+and fair-queue share. One that admission control sheds is dropped.
+"""
+import asyncio
+
+from core.admission import OverloadedError, reco_admission
+from core.config import settings
+from core.cache import TTLCache
+from core.fairness import TokenBucket
+from core.logger import get_logger
+from core.metrics import metrics
+from services.reco_proxy_service import cache_key, fetch_reco, get_cached, get_local, store_key
+
+logger = get_logger("reco_prefetch")
+
+# store key -> prefetch budget; unknown stores share one.
+_budgets = TTLCache(
+    maxsize=settings.RECO_STORE_STATE_SIZE, default_ttl=settings.RECO_STORE_STATE_TTL_SECONDS
+)
+_in_flight: set = set()
+_tasks: set = set()
+
+
+def _has_next_page(params: dict, data: dict) -> bool:
+    total = data.get("total_count", data.get("total"))
+    if total is not None:
+        return params["page_number"] * params["page_size"] < total
+    # No total: a full page suggests there is more.
+    return len(data.get("product_handles") or []) >= params["page_size"]
+
+
+def _skip(reason: str) -> bool:
+    metrics.incr("reco_prefetch_skipped_total", reason=reason)
+    return False
+
+
+async def _prefetch(store: str, api_key: str, reco_path: str, params: dict, key: str):
+    try:
+        if await get_cached(key) is not None:
+            return  # another worker already has it in the shared tier
+        async with reco_admission.admit():
+            await fetch_reco(store, api_key, reco_path, params, max_retries=0)
+        metrics.incr("reco_prefetched_total", store=store_key(store))
+    except OverloadedError:
+        _skip("load")  # shopper requests come first
+    except Exception as e:
+        logger.debug("Prefetch failed", extra={"store": store, "path": reco_path, "error": str(e)})
+    finally:
+        _in_flight.discard(key)
+
+
+def schedule_next_page(store: str, api_key: str, reco_path: str, params: dict, data: dict) -> bool:
+    """
+    Starts prefetching the page after the one `params` asked for, if
+    allowed. Call from the event loop serving the request. Returns True if
+    a prefetch was started.
+    """
+    if not settings.RECO_PREFETCH_ENABLED or not params.get("page_number"):
+        return False
+    if not isinstance(data, dict) or not _has_next_page(params, data):
+        return False
+    if reco_admission.under_load(settings.RECO_PREFETCH_MAX_LOAD):
+        return _skip("load")
+
+    next_params = {**params, "page_number": params["page_number"] + 1}
+    key = cache_key(store, reco_path, next_params)
+    if key in _in_flight or get_local(key) is not None:
+        return False
+
+    budget_key = store_key(store)
+    budget = _budgets.get(budget_key) or TokenBucket(
+        settings.RECO_PREFETCH_RATE_PER_SECOND, settings.RECO_PREFETCH_BURST
+    )
+    _budgets.set(budget_key, budget)
+    if budget.try_take():
+        return _skip("budget")
+
+    _in_flight.add(key)
+    task = asyncio.get_running_loop().create_task(
+        _prefetch(store, api_key, reco_path, next_params, key)
+    )
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return True
@@ -0,0 +1,233 @@
+# services/reco_proxy_service.py
+"""
+Upstream calls and response caching for the /api/reco proxy.
+
+Successful upstream responses are cached per store, path and query
+parameters for RECO_CACHE_TTL_SECONDS, so repeated carousel and search
+requests are served without a round trip. Each worker keeps an in-process
+cache in front of the coordinator's shared one, so a response fetched by
+one worker serves all of them. Misses go upstream through the per-store
+rate limits and fair queue in core/fairness.py. The proxy also remembers
+which reco paths each store's theme asks for, so the cache warmer knows
+what to prefetch.
+
+The store header is not authenticated, so per-store state and metric
+labels use `store_key`: the store itself if it is installed, else
+UNKNOWN_STORE.
+
+Responses are also kept in this worker for RECO_STALE_TTL_SECONDS, past
+their freshness, for answering requests that can't go upstream.
+
+Entries in this worker's cache are PrecompressedBody objects, so a cached
+response is serialised and compressed once however often it is served.
+The shared tier is read and written on the threadpool, so a slow
+coordinator never blocks the event loop.
+"""
+import asyncio
+from urllib.parse import urlencode, urlparse
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+
+from core.cache import TTLCache
+from core.compression import PrecompressedBody
+from core.config import settings
+from core.coordination import get_coordinator
+from core.fairness import reco_scheduler
+from core.logger import get_logger
+from core.metrics import metrics
+from core.resilience import acall_with_retries, reco_destination
+from services.shop_settings_service import is_installed_store
+
+logger = get_logger("reco_proxy")
+
+reco_cache = TTLCache(maxsize=settings.RECO_CACHE_SIZE, default_ttl=settings.RECO_CACHE_TTL_SECONDS)
+metrics.register_collector("reco_cache", reco_cache.stats)
+stale_cache = TTLCache(maxsize=settings.RECO_CACHE_SIZE, default_ttl=settings.RECO_STALE_TTL_SECONDS)
+
+# store -> {"api_key": last key the theme sent, "paths": {reco paths used with product_id}}
+_store_activity = TTLCache(
+    maxsize=settings.RECO_STORE_STATE_SIZE, default_ttl=settings.RECO_STORE_STATE_TTL_SECONDS
+)
+MAX_TRACKED_PATHS = 32
+UNKNOWN_STORE = "other"
+
+_http_client: httpx.AsyncClient | None = None
+_http_client_loop = None
+
+
+def build_reco_params(
+    product_id: int = None,
+    query: str = None,
+    page_number: int = 1,
+    page_size: int = 10,
+    sort_by: str = "relevance",
+    sort_order: str = "asc",
+) -> dict:
+    """Query parameters forwarded upstream, in the order the reco service expects."""
+    params = {}
+    if product_id is not None:
+        params["product_id"] = product_id
+    if query is not None:
+        params["query"] = query
+    if page_number is not None:
+        params["page_number"] = page_number
+    if page_number is not None:
+        params["page_size"] = page_size
+    if sort_by is not None:
+        params["sort_by"] = sort_by
+    if sort_order is not None:
+        params["sort_order"] = sort_order
+    return params
+
+
+def store_key(store: str) -> str:
+    """The key for the store's limits, budgets and metric labels."""
+    return store if is_installed_store(store) else UNKNOWN_STORE
+
+
+def cache_key(store: str, reco_path: str, params: dict) -> str:
+    return f"reco:{store}:{reco_path}?{urlencode(sorted(params.items()))}"
+
+
+async def get_cached_body(key: str) -> PrecompressedBody | None:
+    """
+    A cached response from this worker's cache, else from the shared tier
+    (filled by any worker), which is then kept locally too.
+    """
+    cached = reco_cache.get(key)
+    if cached is None:
+        data = await run_in_threadpool(get_coordinator().get, key)
+        if data is not None:
+            cached = PrecompressedBody(data)
+            reco_cache.set(key, cached)
+    return cached
+
+
+def get_local(key: str):
+    """The data of a response in this worker's cache, or None. Never blocks."""
+    cached = reco_cache.get(key)
+    return cached.data if cached is not None else None
+
+
+async def get_cached(key: str):
+    """The data of a cached response, or None."""
+    cached = await get_cached_body(key)
+    return cached.data if cached is not None else None
+
+
+def get_stale(key: str):
+    """The last response for `key`, fresh or not, if this worker still has it."""
+    return stale_cache.get(key)
+
+
+async def put_cached(key: str, data):
+    reco_cache.set(key, PrecompressedBody(data))
+    stale_cache.set(key, data)
+    await run_in_threadpool(
+        get_coordinator().set, key, data, ttl=settings.RECO_CACHE_TTL_SECONDS
+    )
+
+
+def upstream_url(reco_path: str, params: dict) -> str:
+    return f"{settings.PROXY_SERVER_URL}/{reco_path}?{urlencode(params)}"
+
+
+def record_activity(store: str, api_key: str, reco_path: str, product_request: bool):
+    """
+    Remembers an installed store's API key and, for product requests, the
+    path asked for. Only called once upstream has accepted the key.
+    """
+    if not is_installed_store(store):
+        return
+    activity = _store_activity.get(store) or {"api_key": api_key, "paths": set()}
+    _store_activity.set(store, activity)
+    activity["api_key"] = api_key
+    if product_request and len(activity["paths"]) < MAX_TRACKED_PATHS:
+        activity["paths"].add(reco_path)
+
+
+def store_activity(store: str) -> dict:
+    """{"api_key", "paths"} recently seen from the store's theme."""
+    activity = _store_activity.get(store) or {}
+    return {
+        "api_key": activity.get("api_key"),
+        "paths": set(activity.get("paths") or ()),
+    }
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    The connection-pooled client for the current event loop. Creating a
+    client per request costs a TLS handshake and pool setup every time.
+    """
+    global _http_client, _http_client_loop
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client_loop is not loop or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=settings.RECO_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+        _http_client_loop = loop
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
+def is_upstream_failure(e: Exception) -> bool:
+    """Errors that count against the reco host's circuit breaker."""
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code >= 500
+    return isinstance(e, httpx.RequestError)
+
+
+def _is_retryable(e: Exception) -> bool:
+    return is_upstream_failure(e) or (
+        isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 429
+    )
+
+
+async def fetch_reco(
+    store: str,
+    api_key: str,
+    reco_path: str,
+    params: dict,
+    timeout: float = None,
+    max_retries: int = None,
+    client: httpx.AsyncClient = None,
+) -> dict:
+    """
+    GETs a reco response from upstream behind the store's rate limit and
+    fair-queue slot and the host's circuit breaker, and caches it. Raises
+    httpx errors (HTTPStatusError for non-2xx), StoreThrottledError or
+    CircuitOpenError for the caller to handle.
+    """
+    client = client or get_http_client()
+    headers = {"x_api_key": api_key, "x_store_identifier": store}
+    url = upstream_url(reco_path, params)
+    timeout = settings.RECO_TIMEOUT_SECONDS if timeout is None else timeout
+
+    async def send():
+        response = await client.get(url, headers=headers, timeout=timeout)
+        response.raise_for_status()
+        return response
+
+    key = store_key(store)
+    reco_scheduler.check_rate(key)
+    async with reco_scheduler.slot(key):
+        response = await acall_with_retries(
+            reco_destination,
+            urlparse(settings.PROXY_SERVER_URL).netloc,
+            send,
+            max_retries=settings.RECO_MAX_RETRIES if max_retries is None else max_retries,
+            is_failure=is_upstream_failure,
+            is_retryable=_is_retryable,
+        )
+    data = response.json()
+    await put_cached(cache_key(store, reco_path, params), data)
+    return data
@@ -0,0 +1,235 @@
+# services/reco_push_service.py
+"""
+Pushes synced products and orders to the reco backend for ingestion.
+
+A push is staged on disk first, as a "run" of gzip-compressed NDJSON
+batches, each bounded by RECO_PUSH_BATCH_BYTES / RECO_PUSH_BATCH_RECORDS:
+
+    downloads/{shop}/push/1718000000000-products/00001.ndjson.gz
+
+Runs are staged under a temp name and renamed when complete, so a crash
+mid-staging never leaves a half-run to push. Batches are then POSTed to
+`{PROXY_SERVER_URL}/ingest/{kind}` with bounded concurrency and retried
+with backoff; every batch carries an Idempotency-Key derived from its run
+and number, so a retried or re-sent batch is applied once. A batch file is
+deleted as soon as the backend acknowledges it, which makes the staged run
+its own checkpoint: a failed push resumes with the batches still on disk.
+"""
+import asyncio
+import gzip
+import json
+import os
+import random
+import shutil
+import time
+
+import httpx
+
+from core.config import settings
+from core.coordination import get_coordinator
+from core.logger import get_logger
+
+logger = get_logger("reco_push")
+
+PRODUCTS = "products"
+ORDERS = "orders"
+
+_CHILD_FIELDS = {"ProductVariant": "variants", "LineItem": "lineItems"}
+# One push per shop across workers; expires if a worker dies mid-push.
+PUSH_LOCK_SECONDS = 3600
+
+
+class PushError(Exception):
+    """Raised when a batch is rejected or still failing after all retries."""
+
+
+def push_dir(shop: str) -> str:
+    return os.path.join("downloads", shop, "push")
+
+
+def _child_field(row: dict) -> str:
+    gid = row.get("id") or ""
+    if gid.startswith("gid://shopify/"):
+        return _CHILD_FIELDS.get(gid.split("/")[3], "children")
+    return "images" if "originalSrc" in row else "children"
+
+
+def assemble_products(rows: list, product_ids: set = None) -> list:
+    """Nests a catalogue export's variant and image rows under their products."""
+    products = {}
+    for row in rows:
+        parent_id = row.get("__parentId")
+        if parent_id is None:
+            if row.get("id") and (product_ids is None or row["id"] in product_ids):
+                products[row["id"]] = dict(row)
+            continue
+        parent = products.get(parent_id)
+        if parent is not None:
+            child = {k: v for k, v in row.items() if k != "__parentId"}
+            parent.setdefault(_child_field(row), []).append(child)
+    return list(products.values())
+
+
+def stage_push(shop: str, kind: str, records) -> str | None:
+    """
+    Writes `records` as a run of compressed batches. Returns the run name,
+    or None if there was nothing to push.
+    """
+    run_name = f"{int(time.time() * 1000):013d}-{kind}"
+    final_dir = os.path.join(push_dir(shop), run_name)
+    tmp_dir = f"{final_dir}.tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    batches = 0
+    lines, size = [], 0
+
+    def flush():
+        nonlocal batches, lines, size
+        batches += 1
+        with open(os.path.join(tmp_dir, f"{batches:05d}.ndjson.gz"), "wb") as f:
+            f.write(gzip.compress(b"".join(lines), compresslevel=6))
+        lines, size = [], 0
+
+    for record in records:
+        line = json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+        lines.append(line)
+        size += len(line)
+        if size >= settings.RECO_PUSH_BATCH_BYTES or len(lines) >= settings.RECO_PUSH_BATCH_RECORDS:
+            flush()
+    if lines:
+        flush()
+
+    if not batches:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return None
+    os.rename(tmp_dir, final_dir)
+    logger.info("Push staged", extra={"shop": shop, "run": run_name, "batches": batches})
+    return run_name
+
+
+def _delete_ratio(rows: list, changes: dict) -> float:
+    """Deleted products as a share of the catalogue before this sync."""
+    current = sum(1 for row in rows if row.get("id") and not row.get("__parentId"))
+    previous = current - len(changes["added"]) + len(changes["deleted"])
+    return len(changes["deleted"]) / previous if previous > 0 else 0.0
+
+
+def stage_products_push(shop: str, rows: list, changes: dict) -> str | None:
+    """
+    Stages added and changed products, plus tombstones for deleted ones.
+    Only call with the rows of a completed, fully read export. Tombstones
+    are left out when they would delete more than RECO_PUSH_MAX_DELETE_RATIO
+    of the catalogue; that looks like a broken export, not a cleanup.
+    """
+    changed = set(changes["added"]) | set(changes["changed"])
+    records = assemble_products(rows, changed) if changed else []
+    deleted = changes["deleted"]
+    ratio = _delete_ratio(rows, changes)
+    if deleted and ratio > settings.RECO_PUSH_MAX_DELETE_RATIO:
+        logger.error(
+            "Refusing to stage mass deletion",
+            extra={"shop": shop, "deleted": len(deleted), "ratio": round(ratio, 3)},
+        )
+        deleted = []
+    records += [{"id": product_id, "deleted": True} for product_id in deleted]
+    return stage_push(shop, PRODUCTS, records)
+
+
+def stage_orders_push(shop: str, orders: list) -> str | None:
+    """Stages the orders of an (incremental) order export."""
+    return stage_push(shop, ORDERS, orders)
+
+
+def pending_runs(shop: str) -> list:
+    """Staged runs not yet fully acknowledged, oldest first."""
+    directory = push_dir(shop)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        name for name in os.listdir(directory)
+        if not name.endswith(".tmp") and os.path.isdir(os.path.join(directory, name))
+    )
+
+
+def _retryable(exc: Exception) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return isinstance(exc, httpx.RequestError)
+
+
+async def _send_batch(client: httpx.AsyncClient, shop: str, kind: str, run_name: str, path: str):
+    with open(path, "rb") as f:
+        body = f.read()
+    batch = os.path.basename(path).split(".")[0]
+    headers = {
+        "Content-Type": "application/x-ndjson",
+        "Content-Encoding": "gzip",
+        "Idempotency-Key": f"{shop}/{run_name}/{batch}",
+        "X-Api-Key": settings.PROXY_API_KEY,
+        "X-Store-Identifier": shop,
+    }
+    url = f"{settings.PROXY_SERVER_URL}/ingest/{kind}"
+
+    for attempt in range(settings.RECO_PUSH_MAX_RETRIES + 1):
+        try:
+            response = await client.post(url, content=body, headers=headers)
+            response.raise_for_status()
+            break
+        except httpx.HTTPError as e:
+            if not _retryable(e) or attempt == settings.RECO_PUSH_MAX_RETRIES:
+                raise PushError(f"Batch {run_name}/{batch} failed: {e}") from e
+            delay = settings.RECO_PUSH_RETRY_BASE_SECONDS * 2 ** attempt
+            await asyncio.sleep(delay + random.uniform(0, delay))
+
+    try:
+        os.remove(path)  # acknowledged: this is the checkpoint
+    except FileNotFoundError:
+        pass
+
+
+async def _push_run(shop: str, run_name: str) -> int:
+    """Sends a run's remaining batches; returns how many were sent."""
+    run_dir = os.path.join(push_dir(shop), run_name)
+    kind = run_name.split("-", 1)[1]
+    batches = sorted(os.path.join(run_dir, name) for name in os.listdir(run_dir))
+    semaphore = asyncio.Semaphore(settings.RECO_PUSH_CONCURRENCY)
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(30.0)) as client:
+
+        async def send(path):
+            async with semaphore:
+                await _send_batch(client, shop, kind, run_name, path)
+
+        results = await asyncio.gather(*(send(p) for p in batches), return_exceptions=True)
+
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        raise errors[0]
+    shutil.rmtree(run_dir, ignore_errors=True)
+    return len(batches)
+
+
+def run_reco_push(job, shop: str) -> dict:
+    """
+    Job: pushes the shop's staged runs in order, resuming any left over by
+    an earlier failure. Stops at the first run that can't be completed.
+    """
+    coordinator = get_coordinator()
+    token = coordinator.acquire(f"push:{shop}", ttl=PUSH_LOCK_SECONDS)
+    if token is None:
+        return {"status": "skipped", "message": "A push is already running for this shop."}
+
+    try:
+        pushed = {"runs": 0, "batches": 0}
+        while True:
+            runs = pending_runs(shop)
+            if not runs:
+                break
+            run_name = runs[0]
+            job.progress(f"Pushing {run_name} to the reco service.")
+            pushed["batches"] += asyncio.run(_push_run(shop, run_name))
+            pushed["runs"] += 1
+            logger.info("Push run acknowledged", extra={"shop": shop, "run": run_name})
+        return pushed
+    finally:
+        coordinator.release(f"push:{shop}", token)
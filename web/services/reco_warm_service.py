@@ -0,0 +1,133 @@
+# services/reco_warm_service.py
+"""
+Fills the reco proxy cache after a sync so the first storefront visits
+don't all miss together and stampede the reco service.
+
+Products are ranked by units ordered over the last RECO_WARM_LOOKBACK_DAYS
+(all stored orders if there are none that recent, catalogue order if there
+are no orders at all). The carousel responses for the top products are
+then fetched one at a time at RECO_WARM_RATE_PER_SECOND, using the same
+query parameters the theme sends so the cache keys match.
+"""
+import asyncio
+import datetime
+import json
+import os
+import time
+from collections import Counter
+from datetime import timezone
+
+import httpx
+
+from core.config import settings
+from core.logger import get_logger
+from core.fairness import StoreThrottledError
+from core.resilience import CircuitOpenError
+from services.order_store_service import iter_orders
+from services.reco_proxy_service import build_reco_params, fetch_reco, store_activity
+from services.search_index_service import catalogue_path
+from services.similarity_index_service import neighbour_indexes, product_number
+
+logger = get_logger("reco_warm")
+
+# Give up early when the reco service is down rather than queueing failures.
+MAX_CONSECUTIVE_FAILURES = 5
+
+
+def _count_units(orders, since: str = None) -> Counter:
+    units = Counter()
+    for order in orders:
+        if since and (order.get("createdAt") or "") < since:
+            continue
+        for item in order.get("lineItems") or []:
+            number = product_number(((item.get("product") or {}).get("id")))
+            if number is not None:
+                units[number] += int(item.get("quantity") or 1)
+    return units
+
+
+def rank_products(shop: str, limit: int) -> list:
+    """Numeric product IDs to warm, best sellers first."""
+    since = (
+        datetime.datetime.now(timezone.utc)
+        - datetime.timedelta(days=settings.RECO_WARM_LOOKBACK_DAYS)
+    ).strftime("%Y-%m-%dT%H:%M:%SZ")
+    units = _count_units(iter_orders(shop, since_month=since[:7]), since)
+    if not units:
+        units = _count_units(iter_orders(shop))
+    if units:
+        return [number for number, _ in units.most_common(limit)]
+
+    if not os.path.exists(catalogue_path(shop)):
+        return []
+    with open(catalogue_path(shop), "r", encoding="utf-8") as f:
+        products = json.load(f)
+    ranked = []
+    for product in products:
+        number = None if product.get("__parentId") else product_number(product.get("id"))
+        if number is not None:
+            ranked.append(number)
+            if len(ranked) >= limit:
+                break
+    return ranked
+
+
+def warm_paths(shop: str) -> list:
+    """Carousel paths to prefetch, skipping any answered from the local neighbour index."""
+    paths = set(settings.RECO_WARM_PATHS) | store_activity(shop)["paths"]
+    if neighbour_indexes.get(shop) is not None:
+        paths -= set(settings.LOCAL_SIMILARITY_PATHS)
+    return sorted(paths)
+
+
+async def _prefetch(shop: str, api_key: str, requests: list) -> dict:
+    interval = 1.0 / settings.RECO_WARM_RATE_PER_SECOND if settings.RECO_WARM_RATE_PER_SECOND > 0 else 0
+    stats = {"requested": len(requests), "warmed": 0, "failed": 0}
+    consecutive_failures = 0
+    async with httpx.AsyncClient(timeout=settings.RECO_TIMEOUT_SECONDS) as client:
+        next_at = time.monotonic()
+        for reco_path, params in requests:
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            next_at = time.monotonic() + interval
+            try:
+                await fetch_reco(shop, api_key, reco_path, params, client=client)
+            except CircuitOpenError:
+                logger.warning("Reco circuit open, warming stopped", extra={"shop": shop})
+                break
+            except StoreThrottledError as e:
+                # Storefront traffic is using the store's share; back off.
+                stats["failed"] += 1
+                await asyncio.sleep(e.retry_after)
+                continue
+            except httpx.HTTPError as e:
+                stats["failed"] += 1
+                consecutive_failures += 1
+                logger.debug("Warm request failed", extra={"shop": shop, "error": str(e)})
+                if consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+                    logger.warning("Reco service failing, warming stopped", extra={"shop": shop})
+                    break
+                continue
+            consecutive_failures = 0
+            stats["warmed"] += 1
+    return stats
+
+
+def warm_reco_cache(job, shop: str) -> dict:
+    """Job: prefetch carousel responses for the shop's top products into the proxy cache."""
+    paths = warm_paths(shop)
+    products = rank_products(shop, settings.RECO_WARM_MAX_PRODUCTS) if paths else []
+    requests = [
+        (path, build_reco_params(product_id=number))
+        for number in products
+        for path in paths
+    ]
+    if not requests:
+        return {"requested": 0, "warmed": 0, "failed": 0}
+
+    job.progress(f"Warming {len(requests)} reco responses.")
+    api_key = store_activity(shop)["api_key"] or settings.PROXY_API_KEY
+    stats = asyncio.run(_prefetch(shop, api_key, requests))
+    logger.info("Reco cache warmed", extra={"shop": shop, "paths": paths, **stats})
+    return stats
@@ -0,0 +1,279 @@
+# services/search_index_service.py
+"""
+Per-shop BM25 index over the synced catalogue, used to answer storefront
+search when the reco service is slow or down.
+
+Titles, tags, vendor and productType are tokenised into an inverted index
+(term -> {product id: weighted term frequency}). Query tokens also match as
+prefixes, so "jack" finds "jacket". The index is updated in place after
+each catalogue sync: only products whose searchable fields changed are
+re-indexed, and products missing from the export are dropped.
+"""
+import bisect
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import time
+
+from core.config import settings
+from core.logger import get_logger
+
+logger = get_logger("search_index")
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Field weights applied to term frequencies; titles matter most.
+FIELD_WEIGHTS = {"title": 3.0, "tags": 2.0, "productType": 1.5, "vendor": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Prefix-only matches score a little below whole-word matches.
+PREFIX_MATCH_FACTOR = 0.7
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_EXPANSIONS = 32
+# Applied to index updates so searches never wait on a whole catalogue.
+UPDATE_BATCH_SIZE = 500
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN_RE.findall(text.lower()) if text else []
+
+
+def _searchable_fields(product: dict) -> tuple:
+    tags = product.get("tags") or []
+    if isinstance(tags, str):
+        tags = [t.strip() for t in tags.split(",")]
+    return (
+        product.get("handle") or "",
+        product.get("title") or "",
+        tuple(tags),
+        product.get("vendor") or "",
+        product.get("productType") or "",
+    )
+
+
+def _term_frequencies(fields: tuple) -> dict:
+    _, title, tags, vendor, product_type = fields
+    tf: dict[str, float] = {}
+    for name, text in (
+        ("title", title),
+        ("tags", " ".join(tags)),
+        ("vendor", vendor),
+        ("productType", product_type),
+    ):
+        weight = FIELD_WEIGHTS[name]
+        for token in tokenize(text):
+            tf[token] = tf.get(token, 0.0) + weight
+    return tf
+
+
+class SearchIndex:
+    """BM25 inverted index for one shop's products."""
+
+    def __init__(self):
+        self._postings: dict[str, dict[str, float]] = {}
+        self._docs: dict[str, tuple] = {}  # id -> (fields, doc length)
+        self._total_length = 0.0
+        self._vocabulary: list = []
+        self._vocabulary_dirty = False
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def _remove(self, product_id: str):
+        fields, length = self._docs.pop(product_id)
+        for term in _term_frequencies(fields):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(product_id, None)
+            if not posting:
+                del self._postings[term]
+                self._vocabulary_dirty = True
+        self._total_length -= length
+
+    def _add(self, product_id: str, fields: tuple):
+        tf = _term_frequencies(fields)
+        for term, freq in tf.items():
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = {}
+                self._vocabulary_dirty = True
+            posting[product_id] = freq
+        length = sum(tf.values())
+        self._docs[product_id] = (fields, length)
+        self._total_length += length
+
+    def update(self, products: list, changed_ids: set = None) -> dict:
+        """
+        Brings the index in line with a full catalogue export: adds new
+        products, re-indexes changed ones and drops those no longer listed.
+        With `changed_ids` (from the snapshot diff) only those products are
+        looked at. Non-active products are not searchable.
+        """
+        incoming = {}
+        for product in products:
+            if product.get("__parentId") or not product.get("id"):
+                continue  # variant / image rows of the bulk export
+            if changed_ids is not None and product["id"] not in changed_ids:
+                continue
+            if product.get("status") not in (None, "ACTIVE"):
+                continue
+            incoming[product["id"]] = _searchable_fields(product)
+
+        changes = [
+            (pid, fields)
+            for pid, fields in incoming.items()
+            if self._docs.get(pid, (None,))[0] != fields
+        ]
+        candidates = list(self._docs) if changed_ids is None else changed_ids
+        removed = [pid for pid in candidates if pid in self._docs and pid not in incoming]
+        added = sum(1 for pid, _ in changes if pid not in self._docs)
+
+        for start in range(0, len(removed), UPDATE_BATCH_SIZE):
+            with self._lock:
+                for pid in removed[start:start + UPDATE_BATCH_SIZE]:
+                    self._remove(pid)
+        for start in range(0, len(changes), UPDATE_BATCH_SIZE):
+            with self._lock:
+                for pid, fields in changes[start:start + UPDATE_BATCH_SIZE]:
+                    if pid in self._docs:
+                        self._remove(pid)
+                    self._add(pid, fields)
+
+        return {
+            "indexed": len(self._docs),
+            "added": added,
+            "updated": len(changes) - added,
+            "removed": len(removed),
+        }
+
+    def _expand(self, token: str) -> list:
+        """(term, score factor) pairs for a query token: the word itself and its completions."""
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        matches = [(token, 1.0)] if token in self._postings else []
+        if len(token) < MIN_PREFIX_LENGTH:
+            return matches
+        start = bisect.bisect_left(self._vocabulary, token)
+        end = bisect.bisect_left(self._vocabulary, token + "\uffff", lo=start)
+        completions = [t for t in self._vocabulary[start:end] if t != token]
+        if len(completions) > MAX_PREFIX_EXPANSIONS:
+            completions.sort(key=lambda t: len(self._postings[t]), reverse=True)
+            completions = completions[:MAX_PREFIX_EXPANSIONS]
+        return matches + [(t, PREFIX_MATCH_FACTOR) for t in completions]
+
+    def search(self, query: str, offset: int = 0, limit: int = 10, budget_ms: float = None) -> dict:
+        """
+        Ranks products for `query`. Once `budget_ms` is spent no further terms
+        are scored and whatever has been scored so far is ranked.
+        Returns {"product_handles", "total_count"} like the reco service.
+        """
+        deadline = time.perf_counter() + budget_ms / 1000.0 if budget_ms else None
+        scores: dict[str, float] = {}
+        with self._lock:
+            n_docs = len(self._docs)
+            if not n_docs:
+                return {"product_handles": [], "total_count": 0}
+            avg_length = self._total_length / n_docs
+            terms = [pair for token in dict.fromkeys(tokenize(query)) for pair in self._expand(token)]
+            for term, factor in terms:
+                if deadline and time.perf_counter() > deadline:
+                    logger.debug("Search budget spent", extra={"query": query})
+                    break
+                posting = self._postings[term]
+                idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for pid, tf in posting.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._docs[pid][1] / avg_length)
+                    scores[pid] = scores.get(pid, 0.0) + factor * idf * tf * (BM25_K1 + 1) / (tf + norm)
+            top = heapq.nsmallest(offset + limit, scores, key=lambda pid: (-scores[pid], pid))
+            handles = [self._docs[pid][0][0] for pid in top[offset:]]
+        return {"product_handles": handles, "total_count": len(scores)}
+
+
+class SearchIndexRegistry:
+    """
+    Holds each shop's index; indexes not in memory load from the last
+    catalogue download, and reload when another worker rewrites it.
+    """
+
+    def __init__(self):
+        self._indexes: dict[str, SearchIndex] = {}
+        self._mtimes: dict[str, float] = {}  # shop -> catalogue mtime the index reflects
+        self._loading: set = set()
+        self._lock = threading.Lock()
+
+    def update(self, shop: str, products: list, changed_ids: set = None) -> dict:
+        """Updates the shop's index; `changed_ids` is ignored if the index isn't in memory yet."""
+        with self._lock:
+            index = self._indexes.get(shop)
+            if index is None:
+                index = self._indexes[shop] = SearchIndex()
+                changed_ids = None
+        counts = index.update(products, changed_ids)
+        mtime = _mtime(catalogue_path(shop))
+        if mtime is not None:
+            with self._lock:
+                self._mtimes[shop] = mtime
+        logger.info("Search index updated", extra={"shop": shop, **counts})
+        return counts
+
+    def get(self, shop: str) -> SearchIndex | None:
+        """
+        The shop's index, or None if it isn't in memory yet. A missing or
+        outdated index is (re)loaded in the background so a request never
+        waits on it; until then the old one is served.
+        """
+        mtime = _mtime(catalogue_path(shop))
+        with self._lock:
+            index = self._indexes.get(shop)
+            if mtime is None or self._mtimes.get(shop) == mtime or shop in self._loading:
+                return index
+            self._loading.add(shop)
+        threading.Thread(
+            target=self._load, args=(shop, mtime), name="couture-search-load", daemon=True
+        ).start()
+        return index
+
+    def _load(self, shop: str, mtime: float):
+        try:
+            with open(catalogue_path(shop), "r", encoding="utf-8") as f:
+                products = json.load(f)
+            index = SearchIndex()
+            counts = index.update(products)
+            with self._lock:
+                self._indexes[shop] = index
+                self._mtimes[shop] = mtime
+            logger.info("Search index loaded", extra={"shop": shop, **counts})
+        except Exception:
+            logger.exception("Cannot load search index", extra={"shop": shop})
+        finally:
+            with self._lock:
+                self._loading.discard(shop)
+
+    def search(self, shop: str, query: str, page_number: int, page_size: int) -> dict | None:
+        """Page `page_number` of local results, or None if the shop has no index."""
+        index = self.get(shop)
+        if index is None:
+            return None
+        offset = max(page_number - 1, 0) * page_size
+        return index.search(query, offset, page_size, budget_ms=settings.SEARCH_FALLBACK_BUDGET_MS)
+
+
+def _mtime(path: str) -> float | None:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def catalogue_path(shop: str) -> str:
+    """The catalogue download written by the last completed product sync."""
+    return f"downloads/{shop}_products.jsonl"
+
+
+search_indexes = SearchIndexRegistry()
@@ -0,0 +1,117 @@
+# services/shop_settings_service.py
+import json
+
+from core.cache import TTLCache
+from core.config import settings
+from models.bulk_query_builder import resolve_profile
+from models.database import SessionLocal, Store, SyncWatermark
+
+# One entry: the set of installed shops, re-read every INSTALLED_STORES_TTL_SECONDS.
+_installed_stores = TTLCache(maxsize=1, default_ttl=settings.INSTALLED_STORES_TTL_SECONDS)
+
+
+def installed_stores() -> frozenset:
+    """Shops with a stored access token."""
+    stores = _installed_stores.get("stores")
+    if stores is None:
+        db = SessionLocal()
+        try:
+            stores = frozenset(shop for (shop,) in db.query(Store.shop_url).all())
+        finally:
+            db.close()
+        _installed_stores.set("stores", stores)
+    return stores
+
+
+def is_installed_store(shop: str) -> bool:
+    return shop in installed_stores()
+
+
+def forget_installed_stores():
+    """Drops the cached set so an install shows up at once."""
+    _installed_stores.clear()
+
+
+def get_shop_field_profile(shop: str) -> str | dict:
+    """Returns the shop's bulk export field profile, or the app default."""
+    db = SessionLocal()
+    try:
+        store = db.query(Store).filter(Store.shop_url == shop).first()
+        profile = store.field_profile if store else None
+    finally:
+        db.close()
+
+    if not profile:
+        return settings.DEFAULT_FIELD_PROFILE
+    if profile.lstrip().startswith("{"):
+        return json.loads(profile)
+    return profile
+
+
+def save_shop_field_profile(shop: str, profile: str | dict):
+    """
+    Validates and stores a shop's field profile (preset name or field spec).
+    Raises FieldProfileError if the profile is invalid.
+    """
+    resolve_profile(profile)
+    value = profile if isinstance(profile, str) else json.dumps(profile)
+
+    db = SessionLocal()
+    try:
+        store = db.query(Store).filter(Store.shop_url == shop).first()
+        if not store:
+            raise ValueError(f"Unknown shop {shop}")
+        store.field_profile = value
+        db.commit()
+    finally:
+        db.close()
+
+
+def get_sync_watermark(shop: str, resource: str) -> dict | None:
+    """Returns {"created_at", "updated_at"} for the shop's last incremental sync."""
+    db = SessionLocal()
+    try:
+        mark = (
+            db.query(SyncWatermark)
+            .filter(SyncWatermark.shop_url == shop, SyncWatermark.resource == resource)
+            .first()
+        )
+        if not mark:
+            return None
+        return {"created_at": mark.created_at, "updated_at": mark.updated_at}
+    finally:
+        db.close()
+
+
+def save_sync_watermark(shop: str, resource: str, created_at: str | None, updated_at: str | None):
+    """Moves the shop's watermarks forward; older values never replace newer ones."""
+    db = SessionLocal()
+    try:
+        mark = (
+            db.query(SyncWatermark)
+            .filter(SyncWatermark.shop_url == shop, SyncWatermark.resource == resource)
+            .first()
+        )
+        if not mark:
+            mark = SyncWatermark(shop_url=shop, resource=resource)
+            db.add(mark)
+        # ISO-8601 UTC timestamps compare correctly as strings.
+        if created_at and (not mark.created_at or created_at > mark.created_at):
+            mark.created_at = created_at
+        if updated_at and (not mark.updated_at or updated_at > mark.updated_at):
+            mark.updated_at = updated_at
+        db.commit()
+    finally:
+        db.close()
+
+
+def clear_sync_watermark(shop: str, resource: str):
+    """Forgets the watermarks so the next sync is a full export."""
+    db = SessionLocal()
+    try:
+        db.query(SyncWatermark).filter(
+            SyncWatermark.shop_url == shop, SyncWatermark.resource == resource
+        ).delete()
+        db.commit()
+    finally:
+        db.close()
@@ -6,8 +6,34 @@ import base64
 from fastapi import Request, HTTPException, status
 import hmac
 import hashlib
+import json
+import math
+import time
 
 from models.database import SessionLocal, Store
+from core.cache import TTLCache
+from services.shop_settings_service import forget_installed_stores
+from services.shopify_product_service import trigger_initial_product_sync
+from services.bulk_poller_service import bulk_poller
+from services.webhook_service import WEBHOOK_TOPICS
+from core.logger import get_logger
+
+logger = get_logger("auth")
+
+# Verified session-token claims, keyed by the token's SHA-256 digest and kept
+# until the token expires.
+_session_token_cache = TTLCache(maxsize=settings.SESSION_TOKEN_CACHE_SIZE)
+
+# Shops for query strings whose HMAC already checked out, keyed by digest.
+_hmac_cache = TTLCache(
+    maxsize=settings.SESSION_TOKEN_CACHE_SIZE,
+    default_ttl=settings.HMAC_CACHE_TTL_SECONDS,
+)
+
+
+class SessionTokenError(Exception):
+    """Raised when an App Bridge session token fails verification."""
+
 
 def get_install_url(shop: str) -> str:
     """
@@ -34,12 +60,16 @@ def exchange_code_for_token(shop: str, code: str):
         "client_secret": settings.SHOPIFY_APP_SECRET,
         "code": code,
     }
-    response = requests.post(url, json=payload)
+    response = requests.post(
+        url,
+        json=payload,
+        timeout=(settings.SHOPIFY_CONNECT_TIMEOUT_SECONDS, settings.SHOPIFY_READ_TIMEOUT_SECONDS),
+    )
     response.raise_for_status()
     access_token = response.json()["access_token"]
 
     # TODO: Securely save the 'shop' and 'access_token' to your database.
-    print(f"Access Token for {shop}: {access_token}")
+    logger.info("Received access token", extra={"shop": shop})
 
     # For now, we'll save it to a temporary file for demonstration
     with open(f"./tokens/{shop}_token.txt", "w") as f:
@@ -62,11 +92,11 @@ def get_shop_access_token(shop: str) -> str | None:
 
 def get_shop_api_key(request: Request, shop: str) -> str | None:
     try:
-        print(f"Shop: {shop} | API_KEY: {settings.PROXY_API_KEY}")
+        logger.debug("Resolved shop API key", extra={"shop": shop})
         # TODO: fetch the API key from the DB, as ideally the API generated will be different for each user
         return settings.PROXY_API_KEY
-    except Exception as e:
-        print(f"Exception in API KEY: {e}")
+    except Exception:
+        logger.exception("Could not resolve shop API key", extra={"shop": shop})
 
 
 def save_or_update_token_in_db(shop: str, access_token: str):
@@ -75,54 +105,137 @@ def save_or_update_token_in_db(shop: str, access_token: str):
     """
     db = SessionLocal()
     try:
-        print("Saving token in DB")
         # Check if the store already exists
         store = db.query(Store).filter(Store.shop_url == shop).first()
         if store:
-            print(f"[DB] Updating token for {shop}")
+            logger.info("Updating token", extra={"shop": shop})
             store.access_token = access_token
         else:
-            print(f"[DB] Creating new record and token for {shop}")
+            logger.info("Creating new store record", extra={"shop": shop})
             store = Store(shop_url=shop, access_token=access_token)
             db.add(store)
 
         db.commit()
         db.refresh(store)
-        print(f"[DB] Successfully saved token for {shop}")
+        forget_installed_stores()
+        logger.info("Saved token", extra={"shop": shop})
     finally:
         db.close()
 
 
-def verify_shopify_request(request: Request):
+def _b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def decode_session_token(token: str) -> dict:
     """
-    Verifies the authenticity of a request coming from Shopify's frontend (App Bridge).
-    This is a crucial security step.
+    Verifies an App Bridge session token (HS256 JWT signed with the app
+    secret) and returns its claims. Raises SessionTokenError on any failure.
     """
+    # ValueError covers bad base64 and JSON, and non-ASCII input (UnicodeError).
     try:
-        auth_header = request.headers.get("Authorization")
-        token = auth_header.split(" ")[1]
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        header = json.loads(_b64url_decode(header_b64))
+        signature = _b64url_decode(signature_b64)
+        signing_input = f"{header_b64}.{payload_b64}".encode("ascii")
+    except ValueError as e:
+        raise SessionTokenError(f"Malformed token: {e}")
 
-        # In a production app, you would decode and verify the JWT here
-        # For now, we'll decode it to get the shop domain
-        decoded_payload = base64.b64decode(token.split(".")[1] + "==")
-        payload_data = eval(decoded_payload.decode("utf-8"))
-        shop = payload_data["dest"].replace("https://", "")
+    if not isinstance(header, dict) or header.get("alg") != "HS256":
+        raise SessionTokenError("Unexpected token header")
 
-        print(f"[DEBUG] Request verified for shop: {shop}")
-        return {"shop": shop}
+    expected = hmac.new(
+        settings.SHOPIFY_APP_SECRET.encode("utf-8"), signing_input, hashlib.sha256
+    ).digest()
+    if not hmac.compare_digest(expected, signature):
+        raise SessionTokenError("Invalid signature")
 
-    except Exception as e:
-        print(f"[ERROR] Request verification failed: {e}")
+    try:
+        claims = json.loads(_b64url_decode(payload_b64))
+    except ValueError as e:
+        raise SessionTokenError(f"Malformed payload: {e}")
+    if not isinstance(claims, dict):
+        raise SessionTokenError("Malformed payload: not an object")
+
+    exp, nbf = claims.get("exp"), claims.get("nbf", 0)
+    if not _is_number(exp) or not _is_number(nbf):
+        raise SessionTokenError("Malformed exp or nbf claim")
+    now = time.time()
+    leeway = settings.SESSION_TOKEN_LEEWAY_SECONDS
+    if exp + leeway < now:
+        raise SessionTokenError("Token expired")
+    if nbf - leeway > now:
+        raise SessionTokenError("Token not yet valid")
+    if claims.get("aud") != settings.SHOPIFY_APP_KEY:
+        raise SessionTokenError("Token audience does not match this app")
+
+    dest, iss = claims.get("dest"), claims.get("iss")
+    if not isinstance(dest, str) or not isinstance(iss, str):
+        raise SessionTokenError("Malformed dest or iss claim")
+    try:
+        dest, iss = urllib.parse.urlparse(dest).hostname, urllib.parse.urlparse(iss).hostname
+    except ValueError as e:
+        raise SessionTokenError(f"Malformed dest or iss claim: {e}")
+    if not dest or dest != iss:
+        raise SessionTokenError("Token issuer does not match destination")
+
+    return claims
+
+
+def verify_session_token(token: str) -> dict:
+    """
+    Returns the claims of a valid session token, reusing the result of an
+    earlier verification of the same token until it expires.
+    """
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    claims = _session_token_cache.get(key)
+    if claims is not None:
+        return claims
+
+    claims = decode_session_token(token)
+    _session_token_cache.set(
+        key, claims, expires_at=claims["exp"] + settings.SESSION_TOKEN_LEEWAY_SECONDS
+    )
+    return claims
+
+
+def verify_shopify_request(request: Request):
+    """
+    Verifies the authenticity of a request coming from Shopify's frontend (App Bridge).
+    Use as a FastAPI dependency; returns the shop domain and the token claims.
+    """
+    auth_header = request.headers.get("Authorization", "")
+    scheme, _, token = auth_header.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Missing session token")
+
+    try:
+        claims = verify_session_token(token)
+    except SessionTokenError as e:
+        logger.warning("Request verification failed", extra={"error": str(e)})
         raise HTTPException(status_code=401, detail="Could not verify Shopify request")
 
+    shop = urllib.parse.urlparse(claims["dest"]).hostname
+    logger.debug("Request verified", extra={"shop": shop})
+    return {"shop": shop, "claims": claims}
+
 
 def verify_hmac_signature(request: Request):
     """
     Verifies the HMAC signature of an incoming request from Shopify.
     This is the standard way to authenticate non-embedded apps.
     """
+    query_string = request.url.query
+    cache_key = hashlib.sha256(query_string.encode("utf-8")).digest()
+    shop = _hmac_cache.get(cache_key)
+    if shop is not None:
+        return shop
+
     try:
-        query_string = request.url.query
         query_params = urllib.parse.parse_qs(query_string)
 
         # The hmac is the one query parameter we don't include in the calculation
@@ -157,11 +270,62 @@ def verify_hmac_signature(request: Request):
             )
 
         # If verification passes, return the shop name
-        return params_for_signature.get("shop")
+        shop = params_for_signature.get("shop")
+        if shop:
+            _hmac_cache.set(cache_key, shop)
+        return shop
 
     except Exception as e:
-        print(f"[ERROR] HMAC verification failed: {e}")
+        logger.warning("HMAC verification failed", extra={"error": str(e)})
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Could not verify Shopify request",
         )
+
+
+async def verify_webhook(request: Request) -> dict:
+    """
+    Verifies a Shopify webhook: the X-Shopify-Hmac-Sha256 header must be the
+    base64 HMAC-SHA256 of the raw body under the app secret. Use as a FastAPI
+    dependency; returns the shop, topic, webhook id and decoded payload.
+    """
+    body = await request.body()
+    signature = request.headers.get("X-Shopify-Hmac-Sha256", "")
+    digest = base64.b64encode(
+        hmac.new(settings.SHOPIFY_APP_SECRET.encode("utf-8"), body, hashlib.sha256).digest()
+    ).decode("ascii")
+    if not signature or not hmac.compare_digest(digest, signature):
+        logger.warning(
+            "Webhook verification failed",
+            extra={"shop": request.headers.get("X-Shopify-Shop-Domain")},
+        )
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid webhook signature",
+        )
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Webhook body is not JSON")
+    return {
+        "shop": request.headers.get("X-Shopify-Shop-Domain"),
+        "topic": request.headers.get("X-Shopify-Topic"),
+        "webhook_id": request.headers.get("X-Shopify-Webhook-Id"),
+        "payload": payload,
+    }
+
+
+def run_post_install_setup(job, client):
+    """Job: create the API key metaobject and kick off the first catalogue sync."""
+    client.create_api_key_metaobject()
+    job.progress("API key metaobject created.")
+    try:
+        client.ensure_webhook_subscriptions(f"{settings.APP_URL}/webhooks", WEBHOOK_TOPICS)
+    except Exception as e:
+        # Bulk syncs still keep the data current, just less promptly.
+        logger.warning("Webhook registration failed", extra={"shop": client.shop_url, "error": str(e)})
+    result = trigger_initial_product_sync(client=client)
+    if result.get("bulkOperation"):
+        bulk_poller.track(client, result)
+    return result
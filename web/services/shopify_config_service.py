@@ -1,14 +1,35 @@
+import hashlib
+import json
 import requests
+from urllib.parse import urlparse
 from .shopify_auth_service import get_shop_access_token
 from models.shopify_client import ShopifyAPIClient
 from core.config import settings
+from core.logger import get_logger
+from core.resilience import call_with_retries, reco_destination
 
+logger = get_logger("config_sync")
 
-def sync_reco_configurations(shop: str, client: ShopifyAPIClient) -> dict:
+CAROUSEL_TYPE = "couture_product_carousel"
+
+
+def fields_hash(fields: dict) -> str:
+    """Digest of a metaobject's field values; unset and null fields are the same."""
+    canonical = json.dumps(
+        {key: value for key, value in fields.items() if value is not None},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def sync_reco_configurations(shop: str, client: ShopifyAPIClient, prune: bool = False) -> dict:
     """
-    Fetches configurations, builds full public URLs, and upserts them as metaobjects.
+    Fetches configurations, builds full public URLs, and upserts the new or
+    changed ones as metaobjects. With `prune`, carousels no longer in the
+    reco service's configuration are deleted.
     """
-    print(f"[DEBUG] Starting configuration sync for shop: {shop}")
+    logger.info("Starting configuration sync", extra={"shop": shop})
 
     access_token = get_shop_access_token(shop)
     if not access_token:
@@ -21,12 +42,31 @@ def sync_reco_configurations(shop: str, client: ShopifyAPIClient) -> dict:
 
     headers = {"X-Api-Key": "API_KEY", "X-Store-Identifier": shop}
 
-    response = requests.post(external_api_url, headers=headers)
-    response.raise_for_status()
-    reco_data = response.json()
+    def fetch_configs():
+        response = requests.post(
+            external_api_url, headers=headers, timeout=settings.RECO_TIMEOUT_SECONDS
+        )
+        response.raise_for_status()
+        return response.json()
+
+    reco_data = call_with_retries(
+        reco_destination,
+        urlparse(settings.PROXY_SERVER_URL).netloc,
+        fetch_configs,
+        max_retries=settings.RECO_MAX_RETRIES,
+        is_failure=lambda e: isinstance(e, (requests.ConnectionError, requests.Timeout))
+        or (isinstance(e, requests.HTTPError) and e.response.status_code >= 500),
+    )
 
     product_recos = reco_data.get("product_recos", [])
-    stats = {"created": 0, "updated": 0, "failed": 0}
+    stats = {"created": 0, "updated": 0, "unchanged": 0, "deleted": 0, "failed": 0}
+
+    # One paginated read of what's already there, so unchanged carousels cost nothing.
+    existing = {
+        metaobject["handle"]: metaobject
+        for metaobject in client.list_metaobjects(CAROUSEL_TYPE)
+    }
+    seen = set()
 
     # Get the public base URL of this Shopify App (your ngrok URL) from settings
     public_app_url = settings.APP_URL
@@ -38,20 +78,56 @@ def sync_reco_configurations(shop: str, client: ShopifyAPIClient) -> dict:
         if relative_path and relative_path.startswith("/"):
             # Combine the public ngrok URL with the relative path
             full_public_url = f"{public_app_url.rstrip('/')}{relative_path}"
-            print(
-                f"[SYNC] Converting relative path '{relative_path}' to absolute URL '{full_public_url}'"
+            logger.debug(
+                "Converted relative reco endpoint",
+                extra={"path": relative_path, "url": full_public_url},
             )
             # Overwrite the endpoint in the dictionary with the full URL
             reco["endpoint"] = full_public_url
 
+        handle, fields = client.carousel_fields(reco)
+        seen.add(handle)
+        current = existing.get(handle)
+        if current and fields_hash(current["fields"]) == fields_hash(fields):
+            stats["unchanged"] += 1
+            continue
+
         # Now, upsert the metaobject with the corrected, full URL
         status = client.upsert_metaobject(definition_id, reco)
-        if status in ["created", "updated"]:
-            stats[status] += 1
+        if status == "updated":
+            stats["updated" if current else "created"] += 1
         else:
             stats["failed"] += 1
 
-    print(
-        f"[DEBUG] Sync complete for {shop}. Created: {stats['created']}, Updated: {stats['updated']}"
-    )
+    if prune:
+        for handle, metaobject in existing.items():
+            if handle in seen:
+                continue
+            if client.delete_metaobject(metaobject["id"]):
+                stats["deleted"] += 1
+            else:
+                stats["failed"] += 1
+
+    logger.info("Configuration sync complete", extra={"shop": shop, **stats})
     return stats
+
+
+def run_reco_config_sync(job, client: ShopifyAPIClient, prune: bool = None) -> dict:
+    """Job: sync reco configurations and record the outcome in history."""
+    prune = settings.RECO_CONFIG_PRUNE if prune is None else prune
+    try:
+        result = sync_reco_configurations(client.shop_url, client, prune=prune)
+    except Exception as e:
+        client.update_sync_history(
+            key="reco_config_sync", status="error", message=f"Sync failed: {e}"
+        )
+        raise
+
+    message = (
+        f"Sync successful! {result['created']} created, {result['updated']} updated, "
+        f"{result['unchanged']} unchanged"
+    )
+    message += f", {result['deleted']} deleted." if prune else "."
+    client.update_sync_history(key="reco_config_sync", status="success", message=message)
+    job.progress(message)
+    return result
@@ -1,7 +1,33 @@
 from models.shopify_client import ShopifyAPIClient
 from utils.commons.api_utils import read_jsonl_from_url
 from utils.commons.file_utils import save_to_json
+from core.logger import get_logger
+from services.shop_settings_service import get_shop_field_profile
+from services.order_store_service import (
+    assemble_orders,
+    order_watermark,
+    store_order_export,
+)
+from services.search_index_service import catalogue_path, search_indexes
+from services.similarity_index_service import neighbour_indexes, neighbours_path
+from services.catalogue_snapshot_service import record_snapshot
+from services.reco_warm_service import warm_reco_cache
+from services.job_service import submit_job
+from services.sync_ledger_service import record_completion
+from services.reco_push_service import (
+    pending_runs,
+    run_reco_push,
+    stage_orders_push,
+    stage_products_push,
+)
+from core.config import settings
+from core.cache import SingleFlight
+from core.coordination import get_coordinator
 import json
+import os
+import time
+
+logger = get_logger("product_sync")
 
 
 def trigger_initial_product_sync(client: ShopifyAPIClient) -> dict:
@@ -11,53 +37,162 @@ def trigger_initial_product_sync(client: ShopifyAPIClient) -> dict:
     if client.is_bulk_operation_running():
         return {"status": "A sync operation is already in progress."}
 
-    print("Triggering background catalogue!")
-    result = client.fetch_all_products()
+    profile = get_shop_field_profile(client.shop_url)
+    logger.info(
+        "Triggering catalogue bulk export",
+        extra={"shop": client.shop_url, "profile": profile if isinstance(profile, str) else "custom"},
+    )
+    result = client.fetch_all_products(profile=profile)
 
     return result
 
 
-def trigger_order_history_sync(client: ShopifyAPIClient) -> dict:
+def trigger_order_history_sync(client: ShopifyAPIClient, full: bool = False) -> dict:
     """
-    Starts a background bulk operation to fetch all products for a given store.
+    Starts a background bulk operation to fetch the orders for a given store.
+    Once a first export is stored, only orders updated since the watermark
+    are fetched unless `full` is set.
     """
 
     if client.is_bulk_operation_running():
         return {"status": "A sync operation is already in progress."}
 
-    print("Triggering order history download!")
-    result = client.fetch_all_orders_information()
+    profile = get_shop_field_profile(client.shop_url)
+    updated_since = None if full else order_watermark(client.shop_url)
+    logger.info(
+        "Triggering order bulk export",
+        extra={
+            "shop": client.shop_url,
+            "profile": profile if isinstance(profile, str) else "custom",
+            "updated_since": updated_since,
+        },
+    )
+    result = client.fetch_all_orders_information(profile=profile, updated_since=updated_since)
     return result
 
 
-def get_last_sync_status(client: ShopifyAPIClient) -> dict:
+TERMINAL_BULK_STATUSES = ("COMPLETED", "FAILED", "CANCELED", "EXPIRED")
+
+# How long a finalisation claim is remembered across workers.
+FINALISE_CLAIM_TTL_SECONDS = 24 * 3600
+# Delays between finalisation attempts; the last attempt records a failure.
+FINALISE_RETRY_DELAYS_SECONDS = (5, 30)
+
+# Held while the catalogue file is rewritten; writers queue for up to a minute.
+CATALOGUE_LOCK_SECONDS = 600
+CATALOGUE_LOCK_WAIT_SECONDS = 60
+
+# Concurrent history reads for the same shop and key share one metafield call.
+_history_reads = SingleFlight(window=settings.SYNC_STATUS_COALESCE_SECONDS)
+
+
+def claim_finalisation(shop: str, operation_id: str | None) -> bool:
+    """Returns True for the first caller, in any worker, to claim finalising an operation."""
+    if not operation_id:
+        return False
+    return get_coordinator().add(
+        f"finalised:{shop}:{operation_id}", True, ttl=FINALISE_CLAIM_TTL_SECONDS
+    )
+
+
+def release_finalisation(shop: str, operation_id: str | None):
+    """Gives up a claim so the operation can be finalised again later."""
+    if operation_id:
+        get_coordinator().delete(f"finalised:{shop}:{operation_id}")
+
+
+def run_finalisation(client: ShopifyAPIClient, status_data: dict) -> bool:
     """
-    Checks the status of the most recent bulk operation for a store.
-    Only updates the metafield if the last record is in 'processing'.
+    Finalises an operation the caller has claimed, retrying failed
+    downloads and saves. The claim is kept once an outcome (success, or
+    failure after the last attempt) is recorded; if finalising itself
+    fails it is released, so the next poll or status check tries again.
     """
+    attempts = len(FINALISE_RETRY_DELAYS_SECONDS) + 1
+    try:
+        for attempt in range(attempts):
+            try:
+                return finalise_bulk_operation(
+                    client, status_data, final_attempt=attempt == attempts - 1
+                )
+            except Exception:
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(FINALISE_RETRY_DELAYS_SECONDS[attempt])
+    except BaseException:
+        release_finalisation(client.shop_url, status_data.get("id"))
+        raise
 
-    status_data = client.get_bulk_operation_status()
 
-    if not status_data or not status_data.get("status"):
-        return {"message": "No active sync operation found."}
+def get_sync_history(client: ShopifyAPIClient, key: str) -> list:
+    """The shop's sync history records for `key`, newest first."""
 
-    final_status = status_data.get("status")
+    def read():
+        metafield = client.get_metafield(namespace="couture_app", key=key)
+        if not metafield or not metafield.get("value"):
+            return []
+        return json.loads(metafield["value"])
+
+    return _history_reads.do((client.shop_url, key), read)
+
+
+def catalogue_lock(shop: str):
+    """
+    Serialises rewrites of the shop's catalogue file (bulk exports and
+    webhook batches), across workers.
+    """
+    return get_coordinator().lock(
+        f"catalogue:{shop}", ttl=CATALOGUE_LOCK_SECONDS, wait=CATALOGUE_LOCK_WAIT_SECONDS
+    )
+
+
+def apply_catalogue(shop: str, rows: list, rebuild_neighbours: bool = True) -> dict:
+    """
+    Makes `rows` the shop's catalogue: diffs it against the last snapshot,
+    saves the file, updates the search index (and the neighbour index if
+    asked) and stages the reco push last, so a failure on the way stages
+    nothing. Returns the snapshot changes. Callers hold `catalogue_lock`.
+    """
+    changes = record_snapshot(shop, rows)
+    save_to_json(filename=catalogue_path(shop), data_dict=rows)
+    changed_ids = {pid for ids in changes.values() for pid in ids}
+    search_indexes.update(shop, rows, changed_ids)
+    if rebuild_neighbours and (changed_ids or not os.path.exists(neighbours_path(shop))):
+        neighbour_indexes.rebuild(shop, rows)
+    if settings.RECO_PUSH_ENABLED:
+        stage_products_push(shop, rows, changes)
+    return changes
 
-    # Determine which sync type this was based on the GraphQL query
-    query = status_data.get("query", "")
-    history_key = None
-    filename_key = None
 
+def classify_bulk_query(query: str) -> tuple:
+    """
+    Determines which sync type a bulk operation belongs to based on its
+    GraphQL query. Returns (history_key, filename_key), or (None, None).
+    """
     if "products" in query:
-        history_key = "catalogue_sync_history"
-        filename_key = "products"
-    elif "orders" in query:
-        history_key = "order_sync_history"
-        filename_key = "orders"
+        return "catalogue_sync_history", "products"
+    if "orders" in query:
+        return "order_sync_history", "orders"
+    return None, None
+
+
+def finalise_bulk_operation(
+    client: ShopifyAPIClient, status_data: dict, final_attempt: bool = True
+) -> bool:
+    """
+    Downloads and saves a finished bulk operation's result and records the
+    outcome in sync history. Only updates the metafield if the last record
+    is in 'processing'. Returns True if history was updated. A failed
+    download or save is recorded as the sync's outcome on the final
+    attempt, and raised otherwise. Callers take `claim_finalisation` first
+    and go through `run_finalisation`.
+    """
+    final_status = status_data.get("status")
+    history_key, filename_key = classify_bulk_query(status_data.get("query", ""))
 
     if not history_key:
-        print("No history key found")
-        return status_data  # Not a sync we are tracking
+        logger.debug("Bulk operation is not a tracked sync", extra={"shop": client.shop_url})
+        return False  # Not a sync we are tracking
 
     # --- NEW: fetch existing history ---
     existing_history = []
@@ -71,39 +206,97 @@ def get_last_sync_status(client: ShopifyAPIClient) -> dict:
 
     # If last record is not 'processing', skip updating
     if not last_record or last_record.get("status") != "processing":
-        print(
-            f"Last sync for {history_key} is not in processing state. Skipping update."
+        logger.debug(
+            "Last sync is not processing, skipping update",
+            extra={"shop": client.shop_url, "history_key": history_key},
         )
-        return status_data
+        return False
 
     # --- Only update if last record is processing ---
     if final_status == "COMPLETED":
-        try:
-            products = read_jsonl_from_url(status_data["url"])
-            save_to_json(
-                filename=f"downloads/{client.shop_url}_{filename_key}.jsonl", data_dict=products
-            )
-        except Exception as e:
-            print(f"Cannot save information for {filename_key}: {e}")
-
         message = (
             f"Sync complete. {status_data.get('objectCount', 'All')} items indexed."
         )
+        timings, error = {}, None
+        try:
+            rows = read_jsonl_from_url(status_data["url"], timings) if status_data.get("url") else []
+            if not rows and int(status_data.get("objectCount") or 0) > 0:
+                # Never let a lost result file pass for an empty catalogue.
+                raise Exception(
+                    f"Export reported {status_data['objectCount']} objects but none were read"
+                )
+            storing = time.perf_counter()
+            if filename_key == "orders":
+                orders = assemble_orders(rows)
+                counts = store_order_export(client.shop_url, orders)
+                if settings.RECO_PUSH_ENABLED:
+                    stage_orders_push(client.shop_url, orders)
+                message = (
+                    f"Sync complete. {counts['appended']} new and "
+                    f"{counts['updated']} updated orders stored."
+                )
+            else:
+                with catalogue_lock(client.shop_url) as acquired:
+                    if not acquired:
+                        raise Exception("Timed out waiting for the catalogue lock")
+                    changes = apply_catalogue(client.shop_url, rows)
+                message = (
+                    f"{message} {len(changes['added'])} added, "
+                    f"{len(changes['changed'])} changed, {len(changes['deleted'])} deleted."
+                )
+            timings["store_ms"] = (time.perf_counter() - storing) * 1000
+        except Exception as e:
+            error = str(e)
+            logger.error(
+                "Cannot save sync download",
+                extra={"shop": client.shop_url, "kind": filename_key, "error": error},
+            )
+            if not final_attempt:
+                raise
+        record_completion(client.shop_url, filename_key, status_data, timings, error)
 
         client.update_sync_history(
             key=history_key,
-            status="success",
-            message=message,
+            status="error" if error else "success",
+            message=f"Sync failed while saving the export: {error}" if error else message,
             update_latest_processing=True,
         )
+        if error:
+            return True
+        # Fresh data: prefetch the busiest carousels before shoppers ask.
+        submit_job("reco_warm", client.shop_url, warm_reco_cache, client.shop_url)
+        if settings.RECO_PUSH_ENABLED and pending_runs(client.shop_url):
+            submit_job("reco_push", client.shop_url, run_reco_push, client.shop_url)
+        return True
 
     elif final_status in ["FAILED", "CANCELED", "EXPIRED"]:
         message = f"Sync {final_status.lower()}. Reason: {status_data.get('errorCode', 'Unknown')}"
+        record_completion(client.shop_url, filename_key, status_data)
         client.update_sync_history(
             key=history_key,
             status="error",
             message=message,
             update_latest_processing=True,
         )
+        return True
+
+    return False
+
+
+def get_last_sync_status(client: ShopifyAPIClient) -> dict:
+    """
+    Checks the status of the most recent bulk operation for a store and
+    finalises it if it has finished since the last check.
+    """
+
+    status_data = client.get_bulk_operation_status()
 
+    if not status_data or not status_data.get("status"):
+        return {"message": "No active sync operation found."}
+
+    if status_data["status"] in TERMINAL_BULK_STATUSES and claim_finalisation(
+        client.shop_url, status_data.get("id")
+    ):
+        run_finalisation(client, status_data)
     return status_data
+
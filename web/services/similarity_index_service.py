@@ -0,0 +1,240 @@
+# services/similarity_index_service.py
+"""
+Precomputed similar-product neighbours for each shop's catalogue.
+
+After a catalogue sync every product is turned into a hashed TF-IDF vector
+over its title, tags, vendor and productType. The top-k cosine neighbours
+of each product are then found with blocked matrix multiplies, so memory
+stays at one (block x products) slab rather than a full similarity matrix.
+
+The result is a compact array index, saved next to the catalogue download:
+
+    ids         int64 (n,)     numeric product IDs, sorted
+    handles     str   (n,)     product handles, same order
+    neighbours  int32 (n, k)   row numbers of each product's neighbours
+    scores      float16 (n, k) their cosine similarities, descending
+
+Looking up a product is a binary search plus a row slice.
+"""
+import math
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+from core.config import settings
+from core.logger import get_logger
+from services.search_index_service import FIELD_WEIGHTS, tokenize
+
+logger = get_logger("similarity_index")
+
+_GID_RE = re.compile(r"/(\d+)$")
+
+
+def product_number(gid: str) -> int | None:
+    """123 for "gid://shopify/Product/123"."""
+    match = _GID_RE.search(gid or "")
+    return int(match.group(1)) if match else None
+
+
+def _features(product: dict) -> dict:
+    """Weighted term counts; tags, vendor and type are namespaced so they don't collide with title words."""
+    tags = product.get("tags") or []
+    if isinstance(tags, str):
+        tags = [t.strip() for t in tags.split(",")]
+    terms: dict[str, float] = {}
+    for token in tokenize(product.get("title")):
+        terms[token] = terms.get(token, 0.0) + FIELD_WEIGHTS["title"]
+    for prefix, field, values in (
+        ("tag:", "tags", tags),
+        ("vendor:", "vendor", [product.get("vendor")]),
+        ("type:", "productType", [product.get("productType")]),
+    ):
+        for value in values:
+            if value:
+                key = prefix + value.strip().lower()
+                terms[key] = terms.get(key, 0.0) + FIELD_WEIGHTS[field]
+    return terms
+
+
+def _hash(term: str) -> int:
+    return zlib.crc32(term.encode("utf-8"))
+
+
+def build_feature_matrix(products: list, dim: int) -> np.ndarray:
+    """
+    L2-normalised (n, dim) float32 TF-IDF matrix. Terms are hashed into `dim`
+    columns with a hash-derived sign so collisions tend to cancel out.
+    """
+    documents = [_features(p) for p in products]
+    document_frequency: dict[str, int] = {}
+    for terms in documents:
+        for term in terms:
+            document_frequency[term] = document_frequency.get(term, 0) + 1
+    n = len(documents)
+    idf = {t: math.log((1 + n) / (1 + df)) + 1.0 for t, df in document_frequency.items()}
+    columns = {t: (_hash(t) % dim, 1.0 if (_hash(t) >> 31) & 1 else -1.0) for t in idf}
+
+    rows, cols, values = [], [], []
+    for row, terms in enumerate(documents):
+        for term, tf in terms.items():
+            column, sign = columns[term]
+            rows.append(row)
+            cols.append(column)
+            values.append(sign * tf * idf[term])
+
+    matrix = np.zeros((n, dim), dtype=np.float32)
+    np.add.at(matrix, (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)), values)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def top_k_neighbours(matrix: np.ndarray, k: int, block_rows: int) -> tuple:
+    """
+    (neighbours int32 (n, k), scores float16 (n, k)) of each row's most
+    similar other rows, best first, computed `block_rows` rows at a time.
+    """
+    n = matrix.shape[0]
+    k = min(k, max(n - 1, 0))
+    neighbours = np.empty((n, k), dtype=np.int32)
+    scores = np.empty((n, k), dtype=np.float16)
+    if k == 0:
+        return neighbours, scores
+
+    for start in range(0, n, block_rows):
+        end = min(start + block_rows, n)
+        similarity = matrix[start:end] @ matrix.T
+        similarity[np.arange(end - start), np.arange(start, end)] = -np.inf  # not its own neighbour
+        candidates = np.argpartition(similarity, -k, axis=1)[:, -k:]
+        candidate_scores = np.take_along_axis(similarity, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind="stable")
+        neighbours[start:end] = np.take_along_axis(candidates, order, axis=1)
+        scores[start:end] = np.take_along_axis(candidate_scores, order, axis=1)
+    return neighbours, scores
+
+
+class NeighbourIndex:
+    """Array-backed top-k neighbour lists for one shop."""
+
+    def __init__(self, ids: np.ndarray, handles: np.ndarray, neighbours: np.ndarray, scores: np.ndarray):
+        self.ids = ids
+        self.handles = handles
+        self.neighbours = neighbours
+        self.scores = scores
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, products: list) -> "NeighbourIndex":
+        """Builds the index from a catalogue export (child rows and inactive products are skipped)."""
+        listed = {}
+        for product in products:
+            if product.get("__parentId") or product.get("status") not in (None, "ACTIVE"):
+                continue
+            number = product_number(product.get("id"))
+            if number is not None and product.get("handle"):
+                listed[number] = product
+        ids = np.array(sorted(listed), dtype=np.int64)
+        ordered = [listed[i] for i in ids.tolist()]
+        matrix = build_feature_matrix(ordered, settings.SIMILARITY_FEATURE_DIM)
+        neighbours, scores = top_k_neighbours(
+            matrix, settings.SIMILARITY_TOP_K, settings.SIMILARITY_BLOCK_ROWS
+        )
+        handles = np.array([p["handle"] for p in ordered], dtype=str)
+        return cls(ids, handles, neighbours, scores)
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, ids=self.ids, handles=self.handles, neighbours=self.neighbours, scores=self.scores)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "NeighbourIndex":
+        with np.load(path) as data:
+            return cls(data["ids"], data["handles"], data["neighbours"], data["scores"])
+
+    def similar(self, product_id: int, offset: int = 0, limit: int = 10) -> dict | None:
+        """A page of handles similar to `product_id`, or None if it isn't indexed."""
+        row = int(np.searchsorted(self.ids, product_id))
+        if row >= len(self.ids) or self.ids[row] != product_id:
+            return None
+        neighbours = self.neighbours[row]
+        page = neighbours[offset:offset + limit]
+        return {"product_handles": self.handles[page].tolist(), "total_count": len(neighbours)}
+
+
+def _mtime(path: str) -> float | None:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def neighbours_path(shop: str) -> str:
+    return f"downloads/{shop}_neighbours.npz"
+
+
+class NeighbourIndexRegistry:
+    """
+    Holds each shop's neighbour index; missing ones load from disk in the
+    background, and reload when another worker saves a new one.
+    """
+
+    def __init__(self):
+        self._indexes: dict[str, NeighbourIndex] = {}
+        self._mtimes: dict[str, float] = {}  # shop -> index file mtime loaded
+        self._loading: set = set()
+        self._lock = threading.Lock()
+
+    def rebuild(self, shop: str, products: list) -> dict:
+        """Rebuilds and saves the shop's index from a catalogue export."""
+        index = NeighbourIndex.build(products)
+        index.save(neighbours_path(shop))
+        mtime = _mtime(neighbours_path(shop))
+        with self._lock:
+            self._indexes[shop] = index
+            if mtime is not None:
+                self._mtimes[shop] = mtime
+        logger.info(
+            "Neighbour index rebuilt",
+            extra={"shop": shop, "products": len(index), "k": index.neighbours.shape[1]},
+        )
+        return {"products": len(index), "k": index.neighbours.shape[1]}
+
+    def get(self, shop: str) -> NeighbourIndex | None:
+        mtime = _mtime(neighbours_path(shop))
+        with self._lock:
+            index = self._indexes.get(shop)
+            if mtime is None or self._mtimes.get(shop) == mtime or shop in self._loading:
+                return index
+            self._loading.add(shop)
+        threading.Thread(
+            target=self._load, args=(shop, mtime), name="couture-neighbours-load", daemon=True
+        ).start()
+        return index
+
+    def _load(self, shop: str, mtime: float):
+        try:
+            index = NeighbourIndex.load(neighbours_path(shop))
+            with self._lock:
+                self._indexes[shop] = index
+                self._mtimes[shop] = mtime
+        except Exception:
+            logger.exception("Cannot load neighbour index", extra={"shop": shop})
+        finally:
+            with self._lock:
+                self._loading.discard(shop)
+
+    def similar(self, shop: str, product_id: int, page_number: int, page_size: int) -> dict | None:
+        index = self.get(shop)
+        if index is None:
+            return None
+        return index.similar(product_id, max(page_number - 1, 0) * page_size, page_size)
+
+
+neighbour_indexes = NeighbourIndexRegistry()
@@ -0,0 +1,94 @@
+# services/sync_job_service.py
+"""
+Background job bodies for the sync endpoints. Each one starts work on
+Shopify and hands any bulk operation it started to the bulk poller.
+"""
+import time
+
+from core.coordination import get_coordinator
+from models.shopify_client import ShopifyAPIClient
+from services.bulk_poller_service import bulk_poller
+from services.order_store_service import ORDERS_RESOURCE, order_watermark
+from services.shop_settings_service import clear_sync_watermark
+from services.sync_ledger_service import record_trigger
+from services.shopify_product_service import (
+    trigger_initial_product_sync,
+    trigger_order_history_sync,
+)
+
+# Covers checking for a running operation and starting one.
+BULK_TRIGGER_LOCK_SECONDS = 120
+
+
+def _run_bulk_sync(
+    job,
+    client: ShopifyAPIClient,
+    kind: str,
+    history_key: str,
+    label: str,
+    trigger,
+    message: str = None,
+):
+    """Shared body of the catalogue and order sync jobs."""
+    # Shopify runs one bulk query per shop at a time, whichever worker asks.
+    lock = get_coordinator().lock(f"bulk:{client.shop_url}", ttl=BULK_TRIGGER_LOCK_SECONDS)
+    with lock as acquired:
+        if not acquired or client.is_bulk_operation_running():
+            job.progress("A sync operation is already in progress.")
+            return {"status": "skipped", "message": "A sync operation is already in progress."}
+        return _start_bulk_sync(job, client, kind, history_key, label, trigger, message)
+
+
+def _start_bulk_sync(
+    job, client: ShopifyAPIClient, kind: str, history_key: str, label: str, trigger, message: str
+):
+    client.update_sync_history(
+        key=history_key,
+        status="processing",
+        message=message or f"Full {label} sync initiated by user.",
+    )
+    started = time.perf_counter()
+    try:
+        result = trigger(client=client)
+    except Exception as e:
+        client.update_sync_history(
+            key=history_key, status="error", message=f"{label.capitalize()} sync failed: {e}"
+        )
+        raise
+
+    if result.get("bulkOperation"):
+        record_trigger(
+            client.shop_url,
+            kind,
+            result["bulkOperation"].get("id"),
+            (time.perf_counter() - started) * 1000,
+        )
+        bulk_poller.track(client, result)
+    job.progress(f"Bulk export for {label} started on Shopify.")
+    return result
+
+
+def run_catalogue_sync(job, client: ShopifyAPIClient) -> dict:
+    """Job: record the sync in history and start the catalogue bulk export."""
+    return _run_bulk_sync(
+        job, client, "products", "catalogue_sync_history", "catalogue", trigger_initial_product_sync
+    )
+
+
+def run_order_sync(job, client: ShopifyAPIClient, full: bool = False) -> dict:
+    """
+    Job: record the sync in history and start the order bulk export, which
+    is incremental from the stored watermark unless `full` is set.
+    """
+    if full:
+        clear_sync_watermark(client.shop_url, ORDERS_RESOURCE)
+    incremental = not full and order_watermark(client.shop_url) is not None
+    return _run_bulk_sync(
+        job,
+        client,
+        "orders",
+        "order_sync_history",
+        "order history",
+        lambda client: trigger_order_history_sync(client, full=full),
+        message="Incremental order history sync initiated by user." if incremental else None,
+    )
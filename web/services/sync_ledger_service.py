@@ -0,0 +1,264 @@
+# services/sync_ledger_service.py
+"""
+Per-shop ledger of bulk sync performance.
+
+Sync history metafields keep the last ten messages for the dashboard; the
+ledger keeps every sync with structured timings for each phase:
+
+    trigger   starting the bulk query on Shopify
+    shopify   Shopify running it (createdAt -> completedAt)
+    download  fetching the result file
+    parse     parsing the JSONL
+    store     snapshot diff, files and indexes
+    total     trigger to stored, wall clock
+
+plus object count, file size, bytes downloaded and records parsed. A
+sync whose download or save failed is recorded as an error with the
+reason. Entries live in their own database (SYNC_LEDGER_DATABASE_URL).
+Summaries report percentiles over the last SYNC_LEDGER_SUMMARY_WINDOW
+syncs next to the window before it, so slow stores and regressions show.
+"""
+import datetime
+import math
+from datetime import timezone
+
+from core.config import settings
+from core.logger import get_logger
+from models.database import LedgerSessionLocal, SyncLedgerEntry
+
+logger = get_logger("sync_ledger")
+
+PHASES = ("trigger_ms", "shopify_ms", "download_ms", "parse_ms", "store_ms", "total_ms")
+PERCENTILES = (50, 90, 99)
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(timezone.utc)
+
+
+def _as_utc(value: datetime.datetime | None) -> datetime.datetime | None:
+    # SQLite hands datetimes back without their timezone.
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=timezone.utc)
+
+
+def _parse_timestamp(value: str | None) -> datetime.datetime | None:
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def _int(value) -> int | None:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def record_trigger(shop: str, kind: str, operation_id: str | None, trigger_ms: float):
+    """Opens a ledger entry for a bulk sync that was just started."""
+    db = LedgerSessionLocal()
+    try:
+        db.add(
+            SyncLedgerEntry(
+                shop_url=shop,
+                kind=kind,
+                operation_id=operation_id,
+                status="processing",
+                triggered_at=_now(),
+                trigger_ms=trigger_ms,
+            )
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def record_completion(
+    shop: str,
+    kind: str,
+    status_data: dict,
+    timings: dict = None,
+    error: str = None,
+):
+    """
+    Closes the ledger entry for a finished bulk operation with its Shopify
+    timings and sizes plus the local `timings` (download_ms, parse_ms,
+    store_ms, bytes_downloaded, records). Operations started outside the
+    sync jobs get an entry here.
+    """
+    timings = timings or {}
+    operation_id = status_data.get("id")
+    created = _parse_timestamp(status_data.get("createdAt"))
+    completed = _parse_timestamp(status_data.get("completedAt"))
+    now = _now()
+
+    db = LedgerSessionLocal()
+    try:
+        entry = None
+        if operation_id:
+            entry = (
+                db.query(SyncLedgerEntry)
+                .filter(
+                    SyncLedgerEntry.shop_url == shop,
+                    SyncLedgerEntry.operation_id == operation_id,
+                )
+                .first()
+            )
+        if entry is None:
+            entry = SyncLedgerEntry(
+                shop_url=shop, kind=kind, operation_id=operation_id, triggered_at=created or now
+            )
+            db.add(entry)
+
+        succeeded = status_data.get("status") == "COMPLETED" and not error
+        entry.status = "success" if succeeded else "error"
+        entry.error = error or status_data.get("errorCode")
+        entry.completed_at = now
+        if created and completed:
+            entry.shopify_ms = (completed - created).total_seconds() * 1000
+        entry.total_ms = (now - _as_utc(entry.triggered_at)).total_seconds() * 1000
+        entry.object_count = _int(status_data.get("objectCount"))
+        entry.file_size = _int(status_data.get("fileSize"))
+        for field in ("download_ms", "parse_ms", "store_ms", "bytes_downloaded", "records"):
+            if timings.get(field) is not None:
+                setattr(entry, field, timings[field])
+        db.commit()
+        logger.info(
+            "Sync recorded in ledger",
+            extra={"shop": shop, "kind": kind, "sync_status": entry.status, "total_ms": entry.total_ms},
+        )
+    finally:
+        db.close()
+
+
+def _entry_dict(entry: SyncLedgerEntry) -> dict:
+    return {
+        "id": entry.id,
+        "kind": entry.kind,
+        "operation_id": entry.operation_id,
+        "status": entry.status,
+        "error": entry.error,
+        "triggered_at": _as_utc(entry.triggered_at).isoformat() if entry.triggered_at else None,
+        "completed_at": _as_utc(entry.completed_at).isoformat() if entry.completed_at else None,
+        **{phase: getattr(entry, phase) for phase in PHASES},
+        "object_count": entry.object_count,
+        "file_size": entry.file_size,
+        "bytes_downloaded": entry.bytes_downloaded,
+        "records": entry.records,
+    }
+
+
+def _query(db, shop: str = None, kind: str = None):
+    query = db.query(SyncLedgerEntry)
+    if shop:
+        query = query.filter(SyncLedgerEntry.shop_url == shop)
+    if kind:
+        query = query.filter(SyncLedgerEntry.kind == kind)
+    return query
+
+
+def in_flight() -> list:
+    """(shop, operation_id) of every sync still processing, newest first."""
+    db = LedgerSessionLocal()
+    try:
+        entries = (
+            _query(db)
+            .filter(SyncLedgerEntry.status == "processing")
+            .order_by(SyncLedgerEntry.triggered_at.desc())
+            .all()
+        )
+        return [(entry.shop_url, entry.operation_id) for entry in entries]
+    finally:
+        db.close()
+
+
+def list_entries(shop: str, kind: str = None, page_number: int = 1, page_size: int = 20) -> dict:
+    """A page of the shop's ledger, newest first."""
+    page_number = max(page_number, 1)
+    page_size = min(max(page_size, 1), 100)
+    db = LedgerSessionLocal()
+    try:
+        query = _query(db, shop, kind)
+        total = query.count()
+        entries = (
+            query.order_by(SyncLedgerEntry.triggered_at.desc(), SyncLedgerEntry.id.desc())
+            .offset((page_number - 1) * page_size)
+            .limit(page_size)
+            .all()
+        )
+        return {
+            "entries": [_entry_dict(entry) for entry in entries],
+            "page_number": page_number,
+            "page_size": page_size,
+            "total_count": total,
+        }
+    finally:
+        db.close()
+
+
+def _percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile of sorted `values`."""
+    rank = max(math.ceil(q * len(values) / 100), 1)
+    return values[rank - 1]
+
+
+def _phase_stats(entries: list) -> dict:
+    stats = {"count": len(entries)}
+    for phase in PHASES:
+        values = sorted(v for v in (getattr(e, phase) for e in entries) if v is not None)
+        if not values:
+            stats[phase] = None
+            continue
+        stats[phase] = {f"p{q}": round(_percentile(values, q), 1) for q in PERCENTILES}
+        stats[phase]["max"] = round(values[-1], 1)
+    return stats
+
+
+def summarise(shop: str, kind: str = None, window: int = None) -> dict:
+    """
+    Percentiles per phase over the shop's last `window` successful syncs
+    ("current") and the `window` before them ("previous").
+    """
+    window = window or settings.SYNC_LEDGER_SUMMARY_WINDOW
+    db = LedgerSessionLocal()
+    try:
+        entries = (
+            _query(db, shop, kind)
+            .filter(SyncLedgerEntry.status == "success")
+            .order_by(SyncLedgerEntry.triggered_at.desc(), SyncLedgerEntry.id.desc())
+            .limit(window * 2)
+            .all()
+        )
+        errors = _query(db, shop, kind).filter(SyncLedgerEntry.status == "error").count()
+    finally:
+        db.close()
+    return {
+        "shop": shop,
+        "kind": kind,
+        "window": window,
+        "failed_syncs": errors,
+        "current": _phase_stats(entries[:window]),
+        "previous": _phase_stats(entries[window:]),
+    }
+
+
+def slowest_stores(kind: str = None, limit: int = 20, window: int = None) -> list:
+    """Shops ranked by p90 total sync time over their last `window` successful syncs."""
+    db = LedgerSessionLocal()
+    try:
+        query = _query(db, kind=kind).with_entities(SyncLedgerEntry.shop_url).distinct()
+        shops = [row[0] for row in query]
+    finally:
+        db.close()
+    ranked = []
+    for shop in shops:
+        current = summarise(shop, kind, window)["current"]
+        if current["total_ms"]:
+            ranked.append({"shop": shop, "count": current["count"], "total_ms": current["total_ms"]})
+    ranked.sort(key=lambda item: item["total_ms"]["p90"], reverse=True)
+    return ranked[:limit]
@@ -0,0 +1,525 @@
+# services/webhook_service.py
+"""
+Keeps the local catalogue and order store fresh between bulk exports by
+applying product and order webhooks.
+
+Webhook handlers only append the event to a durable spool and return, so
+Shopify gets its 200 in milliseconds. The spool is an append-only log per
+worker process:
+
+    downloads/webhooks/4242.log                    events being received
+    downloads/webhooks/1718000000000-4242.seg      sealed, waiting to apply
+    downloads/webhooks/dead/                       events that can't be applied
+
+Every WEBHOOK_FLUSH_INTERVAL_SECONDS the flusher seals its log into a
+segment and applies all sealed segments in one batch; logs left behind
+by workers that have exited are sealed by whichever worker flushes.
+Repeated updates to a product collapse to the newest one (by
+`updated_at`), and a delete replaces anything pending for that product
+and drops updates from before it that arrive late. Applied deletes leave
+a tombstone in the coordinator for WEBHOOK_TOMBSTONE_TTL_SECONDS, so a
+stale update that arrives in a later flush is dropped too.
+
+Products are patched into the catalogue file under the shop's catalogue
+lock and run through the same snapshot, push and search index steps as
+a bulk export; the neighbour index is rebuilt at most every WEBHOOK_NEIGHBOUR_REBUILD_SECONDS.
+Orders are merged into the order store. Segments are deleted only once
+applied, and applying one twice is harmless, so a crash mid-flush loses
+nothing.
+
+Shops are applied independently: if one shop's batch fails, the others
+still go through and its events are written back as a retry segment.
+After WEBHOOK_MAX_APPLY_ATTEMPTS failed flushes they move to the
+dead-letter directory, as do spool lines that can't be parsed.
+
+Webhook payloads use the REST shape; they are converted to the rows a
+bulk export produces and trimmed to the shop's field profile.
+"""
+import datetime
+import json
+import os
+import threading
+import time
+from datetime import timezone
+from decimal import Decimal, InvalidOperation
+
+from core.config import settings
+from core.coordination import get_coordinator
+from core.logger import get_logger
+from core.metrics import metrics
+from models.bulk_query_builder import resolve_profile
+from services.job_service import submit_job
+from services.order_store_service import apply_orders
+from services.reco_push_service import pending_runs, run_reco_push, stage_orders_push
+from services.search_index_service import catalogue_path
+from services.shop_settings_service import get_shop_field_profile
+from services.shopify_product_service import apply_catalogue, catalogue_lock
+from services.similarity_index_service import neighbour_indexes
+
+logger = get_logger("webhooks")
+
+# GraphQL subscription topic -> path under /webhooks.
+WEBHOOK_TOPICS = {
+    "PRODUCTS_CREATE": "products/create",
+    "PRODUCTS_UPDATE": "products/update",
+    "PRODUCTS_DELETE": "products/delete",
+    "ORDERS_CREATE": "orders/create",
+}
+PRODUCT_TOPICS = ("products/create", "products/update")
+
+# Only one worker applies segments at a time.
+FLUSH_LOCK_SECONDS = 600
+
+
+def spool_dir() -> str:
+    return os.path.join("downloads", "webhooks")
+
+
+def dead_letter_dir() -> str:
+    return os.path.join(spool_dir(), "dead")
+
+
+def _utc(timestamp: str | None) -> str | None:
+    """REST timestamps carry the shop's offset; bulk exports use UTC."""
+    if not timestamp:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    except ValueError:
+        return timestamp
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _timestamp(value) -> float | None:
+    """Epoch seconds of a REST timestamp, or None if it can't be read."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _gid(kind: str, record: dict, id_field: str = "id") -> str | None:
+    if record.get("admin_graphql_api_id") and id_field == "id":
+        return record["admin_graphql_api_id"]
+    value = record.get(id_field)
+    return f"gid://shopify/{kind}/{value}" if value is not None else None
+
+
+def _money(amount, currency: str | None) -> dict:
+    return {"shopMoney": {"amount": None if amount is None else str(amount), "currencyCode": currency}}
+
+
+def _project(record: dict, fields: list) -> dict:
+    """Keeps the fields of a bulk field spec, recursing into objects and connections."""
+    projected = {}
+    for item in fields:
+        name = item if isinstance(item, str) else item["field"]
+        if name not in record:
+            continue
+        value = record[name]
+        if isinstance(item, dict) and value is not None:
+            if isinstance(value, list):
+                value = [_project(v, item["fields"]) for v in value]
+            else:
+                value = _project(value, item["fields"])
+        projected[name] = value
+    return projected
+
+
+def product_rows(payload: dict, fields: list) -> list:
+    """
+    Converts a products/update payload into the flat rows of a catalogue
+    export: the product, then its variant and image rows with `__parentId`.
+    """
+    product_id = _gid("Product", payload)
+    tags = payload.get("tags") or []
+    if isinstance(tags, str):
+        tags = [tag.strip() for tag in tags.split(",") if tag.strip()]
+    product = {
+        "id": product_id,
+        "title": payload.get("title"),
+        "handle": payload.get("handle"),
+        "descriptionHtml": payload.get("body_html"),
+        "productType": payload.get("product_type"),
+        "vendor": payload.get("vendor"),
+        "tags": tags,
+        "status": (payload.get("status") or "").upper() or None,
+        "createdAt": _utc(payload.get("created_at")),
+        "updatedAt": _utc(payload.get("updated_at")),
+        "variants": [
+            {
+                "id": _gid("ProductVariant", variant),
+                "title": variant.get("title"),
+                "sku": variant.get("sku"),
+                "inventoryQuantity": variant.get("inventory_quantity"),
+                "price": variant.get("price"),
+            }
+            for variant in payload.get("variants") or []
+        ],
+        "images": [
+            {"originalSrc": image.get("src"), "altText": image.get("alt")}
+            for image in payload.get("images") or []
+        ],
+    }
+
+    fields = ["id", *[f for f in fields if f != "id"]]
+    projected = _project(product, fields)
+    rows = [projected]
+    for item in fields:
+        if isinstance(item, dict) and item.get("connection"):
+            for child in projected.pop(item["field"], None) or []:
+                rows.append({**child, "__parentId": product_id})
+    return rows
+
+
+def order_record(payload: dict, fields: list) -> dict:
+    """Converts an orders/create payload into an assembled order (see `assemble_orders`)."""
+    currency = payload.get("currency")
+    line_items = []
+    for item in payload.get("line_items") or []:
+        try:
+            discounted = (
+                Decimal(str(item.get("price") or 0)) * int(item.get("quantity") or 0)
+                - Decimal(str(item.get("total_discount") or 0))
+            )
+        except (InvalidOperation, ValueError):
+            discounted = None
+        line_items.append({
+            "id": _gid("LineItem", item),
+            "title": item.get("title"),
+            "quantity": item.get("quantity"),
+            "discountedTotalSet": _money(discounted, currency),
+            "product": (
+                {"id": _gid("Product", item, "product_id"), "title": item.get("title")}
+                if item.get("product_id") else None
+            ),
+            "variant": (
+                {
+                    "id": _gid("ProductVariant", item, "variant_id"),
+                    "title": item.get("variant_title"),
+                    "sku": item.get("sku"),
+                }
+                if item.get("variant_id") else None
+            ),
+        })
+    order = {
+        "id": _gid("Order", payload),
+        "name": payload.get("name"),
+        "createdAt": _utc(payload.get("created_at")),
+        "updatedAt": _utc(payload.get("updated_at") or payload.get("created_at")),
+        "currencyCode": currency,
+        "totalPriceSet": _money(payload.get("total_price"), currency),
+        "lineItems": line_items,
+    }
+    # Incremental order syncs rely on these, whatever the profile says.
+    required = [name for name in ("id", "createdAt", "updatedAt") if name not in fields]
+    projected = _project(order, required + fields)
+    projected.setdefault("lineItems", [])
+    return projected
+
+
+def tombstone_key(shop: str, product_id: str) -> str:
+    return f"webhook_tombstone:{shop}:{product_id}"
+
+
+def coalesce(events) -> dict:
+    """
+    Folds spooled events into the latest state per shop:
+    {shop: {"products": {gid: payload or None for deleted}, "orders": {gid: payload},
+            "deleted_at": {gid: when the delete was received}}}.
+    Updates older than a delete in this batch or a tombstone from an earlier
+    flush are dropped.
+    """
+    pending: dict[str, dict] = {}
+    deleted_at: dict[tuple, float] = {}  # (shop, gid) -> when its delete was received
+    for event in events:
+        shop_pending = pending.setdefault(
+            event["shop"], {"products": {}, "orders": {}, "deleted_at": {}}
+        )
+        payload = event["payload"]
+        topic = event["topic"]
+        if topic in PRODUCT_TOPICS:
+            product_id = _gid("Product", payload)
+            deleted = deleted_at.get((event["shop"], product_id))
+            if deleted is None:
+                deleted = get_coordinator().get(tombstone_key(event["shop"], product_id))
+            if deleted is not None and (_timestamp(payload.get("updated_at")) or 0) <= deleted:
+                continue  # an update from before the delete, delivered late
+            current = shop_pending["products"].get(product_id)
+            if current is not None and (_utc(payload.get("updated_at")) or "") < (
+                _utc(current.get("updated_at")) or ""
+            ):
+                continue  # delivered out of order
+            shop_pending["products"][product_id] = payload
+        elif topic == "products/delete":
+            product_id = _gid("Product", payload)
+            shop_pending["products"][product_id] = None
+            deleted_at[(event["shop"], product_id)] = event.get("received_at") or time.time()
+            shop_pending["deleted_at"][product_id] = deleted_at[(event["shop"], product_id)]
+        elif topic == "orders/create":
+            shop_pending["orders"][_gid("Order", payload)] = payload
+    return pending
+
+
+def patch_catalogue(rows: list, products: dict, fields: list) -> list:
+    """
+    Replaces or removes the rows of the products in `products` (gid ->
+    payload, None to delete), keeping catalogue order; new products go last.
+    """
+    patched = []
+    placed = set()
+    for row in rows:
+        product_id = row.get("__parentId") or row.get("id")
+        if product_id not in products:
+            patched.append(row)
+            continue
+        if row.get("__parentId") is None and products[product_id] is not None:
+            patched.extend(product_rows(products[product_id], fields))
+            placed.add(product_id)
+    for product_id, payload in products.items():
+        if payload is not None and product_id not in placed:
+            patched.extend(product_rows(payload, fields))
+    return patched
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # running, as another user
+    return True
+
+
+class WebhookSpool:
+    """Durable append-only event log plus the background flusher that applies it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        # Shops whose neighbour index is behind the catalogue, and when each was last rebuilt.
+        self._stale_neighbours: set = set()
+        self._neighbours_rebuilt: dict[str, float] = {}
+
+    def _log_path(self) -> str:
+        return os.path.join(spool_dir(), f"{os.getpid()}.log")
+
+    def append(self, topic: str, shop: str, payload: dict, webhook_id: str = None):
+        """Writes one event to this worker's log and fsyncs it before returning."""
+        line = json.dumps(
+            {
+                "topic": topic,
+                "shop": shop,
+                "webhook_id": webhook_id,
+                "received_at": time.time(),
+                "payload": payload,
+            },
+            separators=(",", ":"),
+        )
+        with self._lock:
+            os.makedirs(spool_dir(), exist_ok=True)
+            with open(self._log_path(), "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        metrics.incr("webhooks_received_total", topic=topic)
+
+    def _seal(self):
+        """Turns this worker's log into a segment so new events start a fresh log."""
+        with self._lock:
+            path = self._log_path()
+            if os.path.exists(path) and os.path.getsize(path):
+                sealed = os.path.join(spool_dir(), f"{int(time.time() * 1000):013d}-{os.getpid()}.seg")
+                os.rename(path, sealed)
+
+    def _seal_orphans(self):
+        """Seals the logs of worker processes that are no longer running."""
+        if not os.path.isdir(spool_dir()):
+            return
+        for name in os.listdir(spool_dir()):
+            stem, ext = os.path.splitext(name)
+            if ext != ".log" or not stem.isdigit() or int(stem) == os.getpid():
+                continue
+            if _pid_alive(int(stem)):
+                continue
+            path = os.path.join(spool_dir(), name)
+            sealed = os.path.join(spool_dir(), f"{int(time.time() * 1000):013d}-{stem}.seg")
+            try:
+                os.rename(path, sealed)
+            except FileNotFoundError:
+                continue
+            logger.info("Sealed orphaned webhook log", extra={"log": name})
+
+    def segments(self) -> list:
+        if not os.path.isdir(spool_dir()):
+            return []
+        return sorted(
+            os.path.join(spool_dir(), name)
+            for name in os.listdir(spool_dir())
+            if name.endswith(".seg")
+        )
+
+    def flush(self) -> dict:
+        """Applies every sealed segment, from any worker, in one coalesced batch."""
+        self._seal()
+        stats = {"segments": 0, "events": 0, "failed": 0, "products": 0, "deleted": 0, "orders": 0}
+        with get_coordinator().lock("webhook_flush", ttl=FLUSH_LOCK_SECONDS) as acquired:
+            if not acquired:
+                return stats
+            self._seal_orphans()
+            segments = self.segments()
+            if segments:
+                by_shop: dict[str, list] = {}
+                for path in segments:
+                    for event in self._read_segment(path):
+                        by_shop.setdefault(event.get("shop"), []).append(event)
+                failed = []
+                for shop, events in by_shop.items():
+                    try:
+                        self._apply(shop, coalesce(events).get(shop), stats)
+                    except Exception:
+                        logger.exception("Cannot apply webhooks", extra={"shop": shop})
+                        failed.extend(events)
+                    stats["events"] += len(events)
+                if failed:
+                    self._retry_later(failed)
+                # Every event is now applied, queued for retry or dead-lettered.
+                for path in segments:
+                    os.remove(path)
+                stats["segments"] = len(segments)
+                stats["failed"] = len(failed)
+                logger.info("Webhook spool flushed", extra=stats)
+        self._refresh_neighbours()
+        metrics.set_gauge("webhook_spool_segments", len(self.segments()))
+        return stats
+
+    def _read_segment(self, path: str) -> list:
+        """A segment's events; lines that don't parse go to the dead-letter directory."""
+        events, unreadable = [], []
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # A torn last line can only come from a crash mid-append.
+                    unreadable.append(line.rstrip("\n"))
+                    continue
+                if isinstance(event, dict):
+                    events.append(event)
+                else:
+                    unreadable.append(line.rstrip("\n"))
+        if unreadable:
+            self._dead_letter(os.path.basename(path), unreadable)
+        return events
+
+    def _retry_later(self, events: list):
+        """Writes failed events back as a new segment, or dead-letters them after the last attempt."""
+        retry, dead = [], []
+        for event in events:
+            event = {**event, "attempts": event.get("attempts", 0) + 1}
+            (dead if event["attempts"] >= settings.WEBHOOK_MAX_APPLY_ATTEMPTS else retry).append(event)
+        name = f"{int(time.time() * 1000):013d}-{os.getpid()}-retry.seg"
+        if retry:
+            tmp_path = os.path.join(spool_dir(), f"{name}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for event in retry:
+                    f.write(json.dumps(event, separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, os.path.join(spool_dir(), name))
+        if dead:
+            self._dead_letter(name, [json.dumps(event, separators=(",", ":")) for event in dead])
+
+    def _dead_letter(self, name: str, lines: list):
+        os.makedirs(dead_letter_dir(), exist_ok=True)
+        with open(os.path.join(dead_letter_dir(), f"{name}.dead"), "a", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+        metrics.incr("webhooks_dead_lettered_total", value=len(lines))
+        logger.error("Webhook events dead-lettered", extra={"segment": name, "events": len(lines)})
+
+    def _apply(self, shop: str, pending: dict, stats: dict):
+        profile = resolve_profile(get_shop_field_profile(shop))
+        products = pending["products"]
+        if products:
+            with catalogue_lock(shop) as acquired:
+                if not acquired:
+                    raise Exception("Timed out waiting for the catalogue lock")
+                rows = []
+                if os.path.exists(catalogue_path(shop)):
+                    with open(catalogue_path(shop), "r", encoding="utf-8") as f:
+                        rows = json.load(f)
+                rows = patch_catalogue(rows, products, profile["products"])
+                apply_catalogue(shop, rows, rebuild_neighbours=False)
+            for product_id, received_at in pending["deleted_at"].items():
+                if products.get(product_id, False) is None:
+                    get_coordinator().set(
+                        tombstone_key(shop, product_id),
+                        received_at,
+                        ttl=settings.WEBHOOK_TOMBSTONE_TTL_SECONDS,
+                    )
+            self._stale_neighbours.add(shop)
+            stats["deleted"] += sum(1 for payload in products.values() if payload is None)
+            stats["products"] += sum(1 for payload in products.values() if payload is not None)
+
+        if pending["orders"]:
+            orders = [order_record(payload, profile["orders"]) for payload in pending["orders"].values()]
+            apply_orders(shop, orders)
+            if settings.RECO_PUSH_ENABLED:
+                stage_orders_push(shop, orders)
+            stats["orders"] += len(orders)
+
+        if settings.RECO_PUSH_ENABLED and pending_runs(shop):
+            submit_job("reco_push", shop, run_reco_push, shop)
+
+    def _refresh_neighbours(self):
+        """Rebuilds stale neighbour indexes, each at most once per WEBHOOK_NEIGHBOUR_REBUILD_SECONDS."""
+        now = time.monotonic()
+        for shop in list(self._stale_neighbours):
+            last = self._neighbours_rebuilt.get(shop)
+            if last is not None and now - last < settings.WEBHOOK_NEIGHBOUR_REBUILD_SECONDS:
+                continue
+            with catalogue_lock(shop) as acquired:
+                if not acquired or not os.path.exists(catalogue_path(shop)):
+                    continue
+                with open(catalogue_path(shop), "r", encoding="utf-8") as f:
+                    rows = json.load(f)
+            neighbour_indexes.rebuild(shop, rows)
+            self._neighbours_rebuilt[shop] = time.monotonic()
+            self._stale_neighbours.discard(shop)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="couture-webhook-flusher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Final webhook flush failed")
+
+    def _run(self):
+        while not self._stop.wait(settings.WEBHOOK_FLUSH_INTERVAL_SECONDS):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Webhook flush failed")
+
+
+webhook_spool = WebhookSpool()
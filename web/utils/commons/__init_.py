@@ -1,2 +1,3 @@
 from .api_utils import *
 from .file_utils import *
+from .jsonl_parser import *
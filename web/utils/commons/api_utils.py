@@ -1,25 +1,56 @@
+import os
+import tempfile
+import time
+
 import requests
-import json
+from core.config import settings
+from core.logger import get_logger
+from utils.commons.jsonl_parser import parse_jsonl_file
 
+logger = get_logger("api_utils")
 
-def read_jsonl_from_url(url):
-    all_objects = []
-    try:
-        response = requests.get(url)
+
+def download_to_file(url: str, path: str, chunk_size: int = 1024 * 1024) -> int:
+    """Streams `url` to `path` without holding the body in memory. Returns bytes written."""
+    written = 0
+    timeout = (settings.SHOPIFY_CONNECT_TIMEOUT_SECONDS, settings.SHOPIFY_READ_TIMEOUT_SECONDS)
+    with requests.get(url, stream=True, timeout=timeout) as response:
         response.raise_for_status()
+        with open(path, "wb") as f:
+            for block in response.iter_content(chunk_size=chunk_size):
+                f.write(block)
+                written += len(block)
+    return written
 
-        for line in response.text.splitlines():
-            try:
-                obj = json.loads(line)
-                all_objects.append(obj)
-            except json.JSONDecodeError as err:
-                print("Invalid JSON:", err)
 
+def read_jsonl_from_url(url, timings: dict = None):
+    """
+    Downloads a JSONL file (e.g. a bulk operation result) and parses it,
+    splitting large files across worker processes. Download and parse
+    errors propagate: callers must not mistake a failed download for an
+    empty result. If given, `timings` is filled with download_ms,
+    bytes_downloaded, parse_ms and records.
+    """
+    timings = {} if timings is None else timings
+    fd, path = tempfile.mkstemp(suffix=".jsonl")
+    os.close(fd)
+    try:
+        started = time.perf_counter()
+        timings["bytes_downloaded"] = download_to_file(url, path)
+        parsing = time.perf_counter()
+        timings["download_ms"] = (parsing - started) * 1000
+        all_objects, invalid = parse_jsonl_file(path, workers=settings.JSONL_PARSE_WORKERS)
+        timings["parse_ms"] = (time.perf_counter() - parsing) * 1000
+        timings["records"] = len(all_objects)
+        if invalid:
+            logger.warning("Invalid JSON lines skipped", extra={"count": invalid})
         return all_objects
 
     except Exception as e:
-        print(f"Connection error: {e}")
-        return []
+        logger.error("Cannot download JSONL", extra={"error": str(e)})
+        raise
+    finally:
+        os.remove(path)
 
 
 def return_dummy_handlers():
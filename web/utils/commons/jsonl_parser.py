@@ -0,0 +1,102 @@
+"""
+Parallel parsing of large JSONL files (Shopify bulk operation results).
+
+The file is split into newline-aligned byte ranges, each range is parsed in
+a worker process, and the parsed chunks are handed back in file order.
+Small files are parsed inline since a process pool would cost more than it
+saves.
+"""
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+    _loads = json.loads
+
+_DECODE_ERRORS = (ValueError,)  # orjson.JSONDecodeError subclasses ValueError
+
+# Below this size the whole file is parsed in the calling process.
+PARALLEL_MIN_BYTES = 16 * 1024 * 1024
+# Ranges are at least this big so per-task overhead stays negligible.
+MIN_CHUNK_BYTES = 4 * 1024 * 1024
+
+
+def split_ranges(path: str, chunks: int, min_chunk_bytes: int = MIN_CHUNK_BYTES) -> list:
+    """
+    Splits `path` into at most `chunks` (start, end) byte ranges, each
+    ending just after a newline so no line straddles two ranges.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    chunks = max(1, min(chunks, size // max(min_chunk_bytes, 1) or 1))
+    target = size // chunks
+
+    ranges = []
+    start = 0
+    with open(path, "rb") as f:
+        while start < size:
+            end = min(start + target, size)
+            if end < size:
+                f.seek(end)
+                f.readline()  # run on to the end of the current line
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def parse_range(path: str, start: int, end: int) -> tuple:
+    """Parses the lines in [start, end). Returns (objects, invalid_line_count)."""
+    objects = []
+    invalid = 0
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        try:
+            objects.append(_loads(line))
+        except _DECODE_ERRORS:
+            invalid += 1
+    return objects, invalid
+
+
+def _pool_context():
+    # Forking a process that runs logging/poller threads is unsafe.
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def iter_jsonl_chunks(path: str, workers: int = None, parallel_min_bytes: int = PARALLEL_MIN_BYTES):
+    """
+    Yields (objects, invalid_line_count) per byte range, in file order, so
+    callers can stream chunks into later stages instead of holding them all.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or os.path.getsize(path) < parallel_min_bytes:
+        yield parse_range(path, 0, os.path.getsize(path))
+        return
+
+    ranges = split_ranges(path, workers * 4)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as pool:
+        futures = [pool.submit(parse_range, path, start, end) for start, end in ranges]
+        for future in futures:
+            yield future.result()
+
+
+def parse_jsonl_file(path: str, workers: int = None, parallel_min_bytes: int = PARALLEL_MIN_BYTES) -> tuple:
+    """Parses a whole JSONL file. Returns (objects in file order, invalid_line_count)."""
+    objects = []
+    invalid = 0
+    for chunk, chunk_invalid in iter_jsonl_chunks(path, workers, parallel_min_bytes):
+        objects.extend(chunk)
+        invalid += chunk_invalid
+    return objects, invalid